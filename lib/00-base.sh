@@ -156,6 +156,7 @@ fi
 : "${USAGE_PORTAL_URL:=http://${DEFAULT_HOST_IP}:29781}"
 : "${USAGE_PORTAL_TOKEN:=}"
 : "${USAGE_PORTAL_TIMEOUT_SECONDS:=5}"
+: "${USAGE_PORTAL_LIMITS_TTL_SECONDS:=10}"
 
 # GPU / MIG
 : "${ENABLE_MIG:=false}"
@@ -255,16 +255,19 @@ PY
       ;;
   esac
   local usage_portal_timeout; usage_portal_timeout="$(_ensure_numeric_or_default "${USAGE_PORTAL_TIMEOUT_SECONDS}" 5 "USAGE_PORTAL_TIMEOUT_SECONDS")"
+  local usage_portal_limits_ttl; usage_portal_limits_ttl="$(_ensure_numeric_or_default "${USAGE_PORTAL_LIMITS_TTL_SECONDS}" 10 "USAGE_PORTAL_LIMITS_TTL_SECONDS")"
   if [[ "${ENABLE_USAGE_LIMIT_ENFORCER}" == "true" && -n "${USAGE_PORTAL_URL}" ]]; then
     local portal_url_json portal_token_json
     portal_url_json="$(jq -Rn --arg v "${USAGE_PORTAL_URL}" '$v')"
     portal_token_json="$(jq -Rn --arg v "${USAGE_PORTAL_TOKEN}" '$v')"
     local usage_limit_snippet
     usage_limit_snippet="$(cat <<PY
+import asyncio
 import json
 import os
 import logging
 import re
+import time
 from urllib.parse import urljoin
 from tornado import httpclient, web
 
@@ -272,17 +275,24 @@ _PORTAL_URL = os.environ.get("USAGE_PORTAL_URL") or ${portal_url_json}
 _PORTAL_TOKEN = os.environ.get("USAGE_PORTAL_TOKEN") or ${portal_token_json}
 _LOG = logging.getLogger("jhub-usage-limits")
 
-def _portal_timeout_value():
-    raw = os.environ.get("USAGE_PORTAL_TIMEOUT")
+def _portal_float_env(name, default):
+    raw = os.environ.get(name)
     if raw:
         try:
             return float(raw)
         except ValueError:
-            _LOG.warning("Invalid USAGE_PORTAL_TIMEOUT=%s, fallback to default", raw)
-    return float(${usage_portal_timeout})
-
-
-_PORTAL_TIMEOUT = _portal_timeout_value()
+            _LOG.warning("Invalid %s=%s, fallback to default", name, raw)
+    return float(default)
+
+
+_PORTAL_TIMEOUT = _portal_float_env("USAGE_PORTAL_TIMEOUT", ${usage_portal_timeout})
+# Rendering the profile list may reuse limits fetched within this TTL; the
+# pre-spawn quota check always asks the portal (sharing an in-flight call).
+_LIMITS_TTL = _portal_float_env("USAGE_PORTAL_LIMITS_TTL", ${usage_portal_limits_ttl})
+_LIMITS_CACHE = {}
+_LIMITS_CACHE_MAX = 1024
+_LIMITS_INFLIGHT = {}
+_PORTAL_CLIENT = None
 if _PORTAL_URL:
     _PORTAL_BASE = _PORTAL_URL.rstrip("/") + "/"
 else:
@@ -434,14 +444,24 @@ async def _requested_gpu(spawner):
     return 0.0
 
 
-async def _fetch_usage_limits(username):
-    if not (_PORTAL_BASE and username):
-        return None
-    endpoint = urljoin(_PORTAL_BASE, f"users/{username}/limits")
+def _portal_client():
+    # A dedicated client keeps portal calls off the hub's shared AsyncHTTPClient;
+    # curl (when pycurl is installed) also reuses keep-alive connections.
+    global _PORTAL_CLIENT
+    if _PORTAL_CLIENT is None:
+        try:
+            from tornado.curl_httpclient import CurlAsyncHTTPClient
+            _PORTAL_CLIENT = CurlAsyncHTTPClient(force_instance=True, max_clients=32)
+        except ImportError:
+            _PORTAL_CLIENT = httpclient.AsyncHTTPClient(force_instance=True, max_clients=32)
+    return _PORTAL_CLIENT
+
+
+async def _portal_get_json(path):
+    endpoint = urljoin(_PORTAL_BASE, path)
     headers = {"Accept": "application/json"}
     if _PORTAL_TOKEN:
         headers["Authorization"] = f"Bearer {_PORTAL_TOKEN}"
-    client = httpclient.AsyncHTTPClient()
     request = httpclient.HTTPRequest(
         url=endpoint,
         method="GET",
@@ -451,7 +471,7 @@ async def _fetch_usage_limits(username):
         follow_redirects=False,
     )
     try:
-        response = await client.fetch(request)
+        response = await _portal_client().fetch(request)
     except httpclient.HTTPClientError as exc:
         if exc.code != 404:
             _LOG.warning("Usage portal request failed (%s): %s", exc.code, exc)
@@ -466,6 +486,51 @@ async def _fetch_usage_limits(username):
         return None
 
 
+def _remember_limits(username, record):
+    if not record or _LIMITS_TTL <= 0:
+        return
+    now = time.monotonic()
+    for key in [key for key, entry in _LIMITS_CACHE.items() if entry[0] <= now]:
+        del _LIMITS_CACHE[key]
+    _LIMITS_CACHE.pop(username, None)
+    while len(_LIMITS_CACHE) >= _LIMITS_CACHE_MAX:
+        # Entries are kept in insertion order, so the first one expires soonest.
+        del _LIMITS_CACHE[next(iter(_LIMITS_CACHE))]
+    _LIMITS_CACHE[username] = (now + _LIMITS_TTL, record)
+
+
+def _cached_limits(username):
+    entry = _LIMITS_CACHE.get(username)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        _LIMITS_CACHE.pop(username, None)
+        return None
+    return entry[1]
+
+
+async def _request_usage_limits(username):
+    record = await _portal_get_json(f"users/{username}/limits")
+    _remember_limits(username, record)
+    return record
+
+
+async def _fetch_usage_limits(username, cached=True):
+    if not (_PORTAL_BASE and username):
+        return None
+    if cached:
+        record = _cached_limits(username)
+        if record is not None:
+            return record
+    # Concurrent callers for the same user await one request instead of issuing their own.
+    pending = _LIMITS_INFLIGHT.get(username)
+    if pending is None:
+        pending = asyncio.ensure_future(_request_usage_limits(username))
+        _LIMITS_INFLIGHT[username] = pending
+        pending.add_done_callback(lambda _done, key=username: _LIMITS_INFLIGHT.pop(key, None))
+    return await asyncio.shield(pending)
+
+
 def _limit_violation(limit_value, requested, current, label):
     if limit_value is None:
         return None
@@ -490,7 +555,7 @@ async def _enforce_portal_limits(spawner):
     canonical = _canonical_username(username_raw)
     if not canonical:
         return
-    record = await _fetch_usage_limits(canonical)
+    record = await _fetch_usage_limits(canonical, cached=False)
     if not record:
         return
     usage = record.get("usage") or {}
@@ -830,6 +895,7 @@ ${mpi_hook}"
 	    --arg usage_portal_url "${USAGE_PORTAL_URL}" \
 	    --arg usage_portal_token "${USAGE_PORTAL_TOKEN}" \
 	    --argjson usage_portal_timeout "${usage_portal_timeout}" \
+	    --argjson usage_portal_limits_ttl "${usage_portal_limits_ttl}" \
 	    --argjson usage_limits_enabled ${usage_limits_enabled_json} \
 	    --argjson hub_services "${hub_services_json}" '
 {
@@ -1135,7 +1201,8 @@ ${mpi_hook}"
         {
           "USAGE_PORTAL_URL": $usage_portal_url,
           "USAGE_PORTAL_TOKEN": $usage_portal_token,
-          "USAGE_PORTAL_TIMEOUT": ($usage_portal_timeout | tostring)
+          "USAGE_PORTAL_TIMEOUT": ($usage_portal_timeout | tostring),
+          "USAGE_PORTAL_LIMITS_TTL": ($usage_portal_limits_ttl | tostring)
         }
       else
         {}
@@ -16,6 +16,17 @@ from fastapi.routing import APIRouter
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
+try:
+    from usage_monitoring.backend.app.assets import COMPRESSION_ENABLED, CompressionMiddleware, HtmlPage, StaticAssets
+except Exception:  # Usage Portal package not importable: plain static files, no compression.
+    COMPRESSION_ENABLED = False
+    CompressionMiddleware = HtmlPage = StaticAssets = None  # type: ignore
+try:
+    from usage_monitoring.backend.app.instrumentation import instrument
+except Exception:  # Usage Portal package not importable: no /metrics or profiling.
+    def instrument(app, admin=None) -> None:  # type: ignore
+        return None
+
 from .utils import normalize_base_url
 
 # === Paths & basic config ===
@@ -575,6 +586,8 @@ async def remove_mapping(pod_suffix: str, endpoint: str, user: dict = Depends(re
 
 
 app = FastAPI(title="Port Mapper", version="0.1.0")
+# Before the prefix-stripping middleware, so requests are matched to their routes.
+instrument(app)
 
 # When proxied by JupyterHub at /services/<name>, set root_path so Starlette
 # strips the prefix for routing and static file mounts.
@@ -598,17 +611,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
 
 app.include_router(api)
 
 
 # === Static pages ===
+static_assets = StaticAssets(ROOT_DIR) if StaticAssets else StaticFiles(directory=str(ROOT_DIR), html=False)
+INDEX_FILE = FRONTEND_DIR / "index.html"
+index_page = HtmlPage(INDEX_FILE, static_assets) if HtmlPage and INDEX_FILE.exists() else None
 if FRONTEND_DIR.exists():
     # Allow relative asset paths when served behind a prefix (/services/.../app/static)
-    app.mount("/app/static", StaticFiles(directory=str(ROOT_DIR), html=False), name="app-static")
+    app.mount("/app/static", static_assets, name="app-static")
 
 # Expose logo and other assets already under port_mapper/
-app.mount("/static", StaticFiles(directory=str(ROOT_DIR), html=False), name="static")
+app.mount("/static", static_assets, name="static")
 
 
 @app.get("/")
@@ -623,10 +641,11 @@ async def app_entry():
     return RedirectResponse(url=f"{APP_ROOT}/")
 
 @app.get("/app/{rest:path}")
-async def app_spa(rest: str = ""):
-    index_file = FRONTEND_DIR / "index.html"
-    if index_file.exists():
-        return FileResponse(index_file)
+async def app_spa(request: Request, rest: str = ""):
+    if index_page is not None:
+        return index_page.response(request)
+    if INDEX_FILE.exists():
+        return FileResponse(INDEX_FILE)
     raise HTTPException(status_code=404, detail="frontend missing")
 
 
@@ -69,7 +69,9 @@ start_uvicorn_bg() {
   local name="$1" app="$2" port="$3" root_path="$4" logfile="$5"
   kill_existing "uvicorn ${app}.*--port ${port}"
   log "Starting ${name} on ${HOST}:${port} root_path=${root_path}"
+  # ROOT_DIR on the path so the monitors can import the shared usage_monitoring helpers.
   setsid env \
+    PYTHONPATH="${ROOT_DIR}${PYTHONPATH:+:${PYTHONPATH}}" \
     PORT_MAPPER_BIND="${HOST}" \
     PORT_MAPPER_PORT="${port}" \
     PORT_MAPPER_ROOT_PATH="${root_path}" \
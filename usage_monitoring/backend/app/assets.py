@@ -0,0 +1,287 @@
+"""Response compression and precompressed, content-hashed static assets.
+
+``CompressionMiddleware`` negotiates brotli (when the ``brotli`` package is
+installed) or gzip for compressible responses above a size threshold; streamed
+responses are compressed chunk by chunk. ``StaticAssets`` loads a directory
+once at startup, hashes and precompresses every asset, and serves versioned
+URLs (``?v=<hash>``) with immutable cache headers. ``HtmlPage`` does the same
+for a single-page app's index.html, adding the versions to its asset links.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # brotli is optional; gzip is always available.
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Dynamic responses favour speed; static assets are compressed once, at the highest levels.
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+ASSET_SUFFIXES = (".js", ".css", ".html", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".ico", ".webp", ".woff", ".woff2")
+MAX_ASSET_BYTES = 10 * 1024 * 1024
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson", "image/svg+xml")
+# SSE has to reach the client as written.
+_NEVER_COMPRESS = ("text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported coding in an Accept-Encoding header: br, then gzip; None for identity."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compressible(content_type: str) -> bool:
+    content_type = (content_type or "").lower()
+    if content_type.startswith(_NEVER_COMPRESS):
+        return False
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+class _Encoder:
+    def __init__(self, coding: str, level: Optional[int] = None):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY if level is None else level)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress and flush, so every chunk is decodable on arrival."""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(data: bytes, coding: str, level: Optional[int] = None) -> bytes:
+    encoder = _Encoder(coding, level)
+    return encoder.chunk(data) + encoder.finish()
+
+
+class CompressionMiddleware:
+    """Compress compressible responses the client accepts, leaving already-encoded ones alone."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, coding, self.minimum_size))
+
+
+class _CompressingSender:
+    def __init__(self, send: Send, coding: str, minimum_size: int):
+        self._send = send
+        self.coding = coding
+        self.minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._passthrough = False
+        self._encoder: Optional[_Encoder] = None
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self._passthrough = "content-encoding" in headers or not compressible(headers.get("content-type", ""))
+            if self._passthrough:
+                await self._send(message)
+            else:
+                self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._start is not None:
+            start, self._start = self._start, None
+            if not more_body and len(body) < self.minimum_size:
+                await self._send(start)
+                await self._send(message)
+                self._passthrough = True
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.coding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            self._encoder = _Encoder(self.coding)
+            if more_body:
+                del headers["Content-Length"]
+                await self._send(start)
+            else:
+                payload = self._encoder.chunk(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(payload))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": payload})
+                return
+        payload = self._encoder.chunk(body) if body else b""
+        if not more_body:
+            payload += self._encoder.finish()
+        if payload or not more_body:
+            await self._send({"type": "http.response.body", "body": payload, "more_body": more_body})
+
+
+class _Payload:
+    """A body with its precompressed variants and a content-derived ETag."""
+
+    def __init__(self, body: bytes, media_type: str, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.body = body
+        self.media_type = media_type
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        self.variants: Dict[str, bytes] = {}
+        if compressible(media_type) and len(body) >= minimum_size:
+            codings = ("gzip", "br") if brotli is not None else ("gzip",)
+            for coding in codings:
+                encoded = compress(body, coding, level=11 if coding == "br" else 9)
+                if len(encoded) < len(body):
+                    self.variants[coding] = encoded
+
+    def respond(self, headers: Headers, cache_control: str, head: bool = False) -> Response:
+        response_headers = {"ETag": self.etag, "Cache-Control": cache_control}
+        if self.variants:
+            response_headers["Vary"] = "Accept-Encoding"
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match and self.version in if_none_match:
+            return Response(status_code=304, headers=response_headers)
+        coding = choose_encoding(headers.get("accept-encoding", "")) if self.variants else None
+        body = self.body
+        if coding in self.variants:
+            body = self.variants[coding]
+            response_headers["Content-Encoding"] = coding
+        if head:
+            response_headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=response_headers, media_type=self.media_type)
+        return Response(content=body, headers=response_headers, media_type=self.media_type)
+
+
+def _media_type(path: Path) -> str:
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+class StaticAssets:
+    """ASGI app serving a directory's assets from memory.
+
+    Files with ``suffixes`` are read, hashed and precompressed once when the
+    app is created. Requests carrying the current ``?v=`` version are cached
+    for a year as immutable; anything else revalidates with the ETag. Other
+    files are handed to StaticFiles unchanged.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        url_prefix: str = "",
+        suffixes: Sequence[str] = ASSET_SUFFIXES,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix.rstrip("/")
+        self._fallback = StaticFiles(directory=str(directory), check_dir=False)
+        self._assets: Dict[str, _Payload] = {}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.rglob("*")):
+                relative = path.relative_to(self.directory)
+                if any(part.startswith(".") or part == "__pycache__" for part in relative.parts):
+                    continue
+                if not path.is_file() or path.suffix.lower() not in suffixes or path.stat().st_size > MAX_ASSET_BYTES:
+                    continue
+                self._assets[relative.as_posix()] = _Payload(path.read_bytes(), _media_type(path), minimum_size)
+
+    def version(self, name: str) -> Optional[str]:
+        payload = self._assets.get(name.lstrip("/"))
+        return payload.version if payload else None
+
+    def url(self, name: str) -> str:
+        """Versioned URL of an asset, e.g. for templates: /static/app.js?v=3f2a..."""
+        name = name.lstrip("/")
+        version = self.version(name)
+        return f"{self.url_prefix}/{name}" + (f"?v={version}" if version else "")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        method = scope.get("method")
+        payload = None
+        if scope["type"] == "http" and method in {"GET", "HEAD"}:
+            payload = self._assets.get(self._fallback.get_path(scope).replace(os.sep, "/"))
+        if payload is None:
+            await self._fallback(scope, receive, send)
+            return
+        versioned = QueryParams(scope.get("query_string", b"")).get("v") == payload.version
+        response = payload.respond(
+            Headers(scope=scope), IMMUTABLE if versioned else REVALIDATE, head=method == "HEAD"
+        )
+        await response(scope, receive, send)
+
+
+_ASSET_LINK = re.compile(r'((?:src|href)=")((?:\./|/)?(?:[\w./-]*/)?static/)([^"?#]+)(")')
+
+
+class HtmlPage:
+    """An index.html served from memory: asset links versioned, precompressed, revalidated by ETag."""
+
+    def __init__(self, path: Path, assets: StaticAssets, minimum_size: int = COMPRESSION_MIN_SIZE):
+        html = Path(path).read_text(encoding="utf-8")
+
+        def versioned(match: "re.Match[str]") -> str:
+            version = assets.version(match.group(3))
+            if version is None:
+                return match.group(0)
+            return f"{match.group(1)}{match.group(2)}{match.group(3)}?v={version}{match.group(4)}"
+
+        body = _ASSET_LINK.sub(versioned, html).encode("utf-8")
+        self._payload = _Payload(body, "text/html; charset=utf-8", minimum_size)
+
+    def response(self, request: Request) -> Response:
+        return self._payload.respond(request.headers, REVALIDATE, head=request.method == "HEAD")
@@ -7,13 +7,13 @@ from typing import Dict, Optional, Set
 
 from sqlalchemy.orm import Session
 
-from . import jhub, models
+from . import cache, jhub, models, outbox, partitions, pricing, pvc_usage, rollup
+from .snapshot import claim_owners, cluster_snapshot
 from .config import DEFAULT_CPU_LIMIT_CORES, DEFAULT_GPU_LIMIT, DEFAULT_MEMORY_LIMIT_GIB
 from .database import SessionLocal
 from .timeutils import ensure_naive_local, naive_now_local, LOCAL_TZ
 
 
-GPU_RATE_PER_HOUR = float(os.getenv("GPU_RATE_PER_HOUR", "4"))
 PVC_LAST_USED_TOUCH_INTERVAL_SECONDS = int(os.getenv("PVC_LAST_USED_TOUCH_INTERVAL_SECONDS", "3600"))
 
 
@@ -34,6 +34,15 @@ def _memory_mb(mebibytes: Optional[float]) -> int:
     return int(mebibytes * 1.048576)
 
 
+def _open_sessions(db: Session):
+    """Open sessions; the hot-horizon bound lets PostgreSQL skip archived partitions."""
+    query = db.query(models.ContainerSession).filter(models.ContainerSession.end_time.is_(None))
+    horizon = partitions.hot_horizon(db)
+    if horizon is not None:
+        query = query.filter(models.ContainerSession.start_time >= horizon)
+    return query
+
+
 class UsageAutoRecorder:
     """Polls JupyterHub pods and mirrors them into container_sessions rows."""
 
@@ -42,6 +51,8 @@ class UsageAutoRecorder:
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
         self._pvc_last_used_cache: Dict[str, float] = {}
+        self._created_usernames: Set[str] = set()
+        self._costs_changed = False
 
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
@@ -67,39 +78,42 @@ class UsageAutoRecorder:
             self._stop_event.wait(wait_for)
 
     def _sync_once(self) -> None:
+        collected_at = time.monotonic()
         payload = jhub.collect_usage_payload()
         pods = payload.get("pods", [])
-        self._touch_active_pvcs(pods)
+        cluster_snapshot.publish(pods, taken_at=collected_at)
         active_names = {pod.get("podName") for pod in pods if pod.get("podName")}
         db: Session = SessionLocal()
         try:
             for pod in pods:
                 self._ensure_session(db, pod)
             self._close_finished_sessions(db, active_names)
+            touched = self._touch_active_pvcs(db, pods)
             db.commit()
         finally:
             db.close()
-
-    def _touch_active_pvcs(self, pods: list) -> None:
+        self._pvc_last_used_cache.update(touched)
+        while self._created_usernames:
+            cache.invalidate_users(self._created_usernames.pop())
+        if self._costs_changed:
+            self._costs_changed = False
+            cache.invalidate_costs()
+
+    def _touch_active_pvcs(self, db: Session, pods: list) -> Dict[str, float]:
+        """Mark mounted claims as used in pvc_usage, each at most once per touch interval."""
         if PVC_LAST_USED_TOUCH_INTERVAL_SECONDS <= 0:
-            return
+            return {}
         now_mono = time.monotonic()
-        claim_names = set()
-        for pod in pods:
-            for vol in (pod.get("volumes") or []):
-                claim = vol.get("claimName")
-                if claim and claim.startswith(jhub.SINGLEUSER_PVC_PREFIX):
-                    claim_names.add(claim)
-
-        for claim in claim_names:
+        due = {}
+        for claim, user in claim_owners(pods).items():
+            if not claim.startswith(jhub.SINGLEUSER_PVC_PREFIX):
+                continue
             last_touched = self._pvc_last_used_cache.get(claim)
             if last_touched is not None and (now_mono - last_touched) < PVC_LAST_USED_TOUCH_INTERVAL_SECONDS:
                 continue
-            try:
-                jhub.touch_pvc_last_used(claim)
-                self._pvc_last_used_cache[claim] = now_mono
-            except Exception as exc:  # pragma: no cover - best effort
-                print(f"[usage-auto] touch pvc last-used failed: {claim}: {exc}", flush=True)
+            due[claim] = user
+        pvc_usage.mark_used(db, due, naive_now_local())
+        return dict.fromkeys(due, now_mono)
 
     def _ensure_session(self, db: Session, pod: Dict) -> None:
         pod_name = pod.get("podName")
@@ -111,62 +125,88 @@ class UsageAutoRecorder:
         phase = str(pod.get("phase") or "running").lower()
 
         existing = (
-            db.query(models.ContainerSession)
+            _open_sessions(db)
             .filter(models.ContainerSession.container_name == pod_name)
-            .filter(models.ContainerSession.end_time.is_(None))
             .first()
         )
         if existing:
-            updated = False
+            changes = {}
             if phase and existing.status != phase:
-                existing.status = phase
-                updated = True
+                changes["status"] = phase
             if first_container_id and existing.container_id != first_container_id:
-                existing.container_id = first_container_id
-                updated = True
+                changes["container_id"] = first_container_id
             requested_cpu = (requests.get("cpuMillicores") or 0) / 1000.0
             requested_memory = _memory_mb(requests.get("memoryMiB"))
             requested_gpu = int(float(requests.get("gpu") or 0) or 0)
             if requested_cpu and existing.requested_cpu != requested_cpu:
-                existing.requested_cpu = requested_cpu
-                updated = True
+                changes["requested_cpu"] = requested_cpu
             if requested_memory and existing.requested_memory_mb != requested_memory:
-                existing.requested_memory_mb = requested_memory
-                updated = True
+                changes["requested_memory_mb"] = requested_memory
             if requested_gpu and existing.requested_gpu != requested_gpu:
-                existing.requested_gpu = requested_gpu
-                updated = True
-            if updated:
+                changes["requested_gpu"] = requested_gpu
+            node_name = pod.get("node")
+            if node_name and existing.node_name != node_name:
+                changes["node_name"] = node_name
+            profile = rollup.resource_profile(changes.get("requested_gpu", existing.requested_gpu) or 0)
+            if existing.resource_profile != profile:
+                changes["resource_profile"] = profile
+            if changes:
+                if rollup.needs_retraction(existing, changes):
+                    # Debit the rollup under the values it was credited with; the accruer re-adds the session.
+                    db.refresh(existing, with_for_update=True)
+                    rollup.retract_session(db, existing)
+                    self._costs_changed = True
+                for field, value in changes.items():
+                    setattr(existing, field, value)
                 db.add(existing)
+                outbox.enqueue_session_change(db, existing)
             return
         user_obj = self._get_or_create_user(db, pod)
-        start_time = _parse_time(pod.get("startTime")) or datetime.now(LOCAL_TZ)
+        start_time = ensure_naive_local(_parse_time(pod.get("startTime")) or datetime.now(LOCAL_TZ))
+        horizon = partitions.hot_horizon(db)
+        if horizon is not None and start_time < horizon:
+            # A pod older than the archive horizon: record it from the horizon on instead of
+            # writing into an archived month.
+            start_time = horizon
         gpu_count = int(float(requests.get("gpu") or 0) or 0)
-        cost_rate = GPU_RATE_PER_HOUR * max(gpu_count, 1) if gpu_count else 0
+        requested_cpu = (requests.get("cpuMillicores") or 0) / 1000.0
+        requested_memory = _memory_mb(requests.get("memoryMiB"))
+        profile = rollup.resource_profile(gpu_count)
+        # Snapshot of the rate cards in force at start; billing by rate cards reprices from the raw requests.
+        cost_rate = pricing.hourly_rate(
+            pricing.load_rates(db), requested_cpu, requested_memory, gpu_count, profile, start_time
+        )
 
         session = models.ContainerSession(
             user_id=user_obj.id,
             container_name=pod_name,
             container_id=first_container_id,
-            requested_cpu=(requests.get("cpuMillicores") or 0) / 1000.0,
-            requested_memory_mb=_memory_mb(requests.get("memoryMiB")),
+            requested_cpu=requested_cpu,
+            requested_memory_mb=requested_memory,
             requested_gpu=gpu_count,
-            cost_rate_per_hour=cost_rate,
+            cost_rate_per_hour=round(cost_rate, 2),
             status=phase,
-            start_time=ensure_naive_local(start_time),
+            node_name=pod.get("node"),
+            resource_profile=profile,
+            start_time=start_time,
             notes="auto-recorded from JupyterHub pod monitor",
         )
         db.add(session)
+        outbox.enqueue_session_change(db, session)
+        if start_time < naive_now_local():
+            # Backdated into periods whose priced frames may already be cached.
+            self._costs_changed = True
 
     def _close_finished_sessions(self, db: Session, active_pod_names: Set[str]) -> None:
         if not active_pod_names:
             active_pod_names = set()
-        open_sessions = db.query(models.ContainerSession).filter(models.ContainerSession.end_time.is_(None)).all()
+        open_sessions = _open_sessions(db).all()
         now = naive_now_local()
         for session in open_sessions:
             if session.container_name not in active_pod_names:
                 session.end_time = now
                 session.status = "completed"
+                outbox.enqueue_session_change(db, session)
 
     def _get_or_create_user(self, db: Session, pod: Dict) -> models.User:
         username = pod.get("user") or "(unknown)"
@@ -190,6 +230,7 @@ class UsageAutoRecorder:
         )
         db.add(user)
         db.flush()
+        self._created_usernames.add(username)
         return user
 
 
@@ -0,0 +1,113 @@
+"""Small in-process read-through caches for hot, rarely written rows."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+
+
+class TTLCache:
+    """Bounded LRU map whose entries also expire after ``ttl_seconds``; safe across threads."""
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl_seconds: float = 30.0):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (hit, value)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def _ttl(env_name: str, default: str) -> float:
+    return float(os.getenv(env_name, default)) if USER_CACHE_ENABLED else 0.0
+
+
+# username -> schemas.UserRead (includes the limits served to the spawn hook)
+user_cache = TTLCache(
+    "users_by_name",
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")),
+    ttl_seconds=_ttl("USER_CACHE_TTL_SECONDS", "30"),
+)
+# Single entry: the encoded full user list shown by the dashboard.
+user_list_cache = TTLCache("user_list", maxsize=1, ttl_seconds=_ttl("USER_CACHE_TTL_SECONDS", "30"))
+
+# Rate cards change rarely; writes clear this along with the cost caches below.
+rate_card_cache = TTLCache("rate_cards", maxsize=1, ttl_seconds=float(os.getenv("RATE_CARD_CACHE_TTL_SECONDS", "300")))
+_COST_TTL_SECONDS = float(os.getenv("COST_CACHE_TTL_SECONDS", "3600"))
+# (period_start, period_end) -> pricing.SessionFrame of a finished period.
+frame_cache = TTLCache(
+    "cost_frames", maxsize=int(os.getenv("COST_FRAME_CACHE_SIZE", "24")), ttl_seconds=_COST_TTL_SECONDS
+)
+# (period_start, period_end, group_by) -> priced summaries of a finished period.
+cost_cache = TTLCache("billing_costs", maxsize=512, ttl_seconds=_COST_TTL_SECONDS)
+
+
+def invalidate_users(username: Optional[str] = None) -> None:
+    """Drop cached data after a user row was created or changed."""
+    user_list_cache.clear()
+    if username:
+        user_cache.invalidate(username)
+
+
+def invalidate_costs() -> None:
+    """Drop cached cost frames and results after rate cards or past sessions changed."""
+    rate_card_cache.clear()
+    frame_cache.clear()
+    cost_cache.clear()
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    caches = (user_cache, user_list_cache, rate_card_cache, frame_cache, cost_cache)
+    return {cache.name: cache.stats() for cache in caches}
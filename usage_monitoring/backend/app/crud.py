@@ -1,12 +1,20 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
 
-from sqlalchemy import func, literal
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, Float, and_, cast, column, func, literal, or_, select, tuple_, union_all, values
+from sqlalchemy.orm import Query, Session
 
-from . import models, schemas
+from . import cache, models, outbox, partitions, pricing, rollup, schemas
+from .fastjson import RowEncoder
+from .pagination import Page, decode_cursor, encode_cursor, estimate_count
 from .timeutils import naive_now_local, ensure_naive_local
 
 
+# Column rows for the list endpoints, encoded straight to the read schemas' JSON.
+USER_ROWS = RowEncoder(schemas.UserRead, models.User)
+SESSION_ROWS = RowEncoder(schemas.ContainerSessionRead, models.ContainerSession)
+
+
 # User CRUD
 
 def create_user(db: Session, payload: schemas.UserCreate) -> models.User:
@@ -14,11 +22,52 @@ def create_user(db: Session, payload: schemas.UserCreate) -> models.User:
     db.add(user)
     db.commit()
     db.refresh(user)
+    cache.invalidate_users(user.username)
     return user
 
 
-def get_users(db: Session) -> List[models.User]:
-    return db.query(models.User).order_by(models.User.created_at.desc()).all()
+def get_users_json(db: Session) -> bytes:
+    """The full user list, newest first, as encoded UserRead JSON."""
+    hit, body = cache.user_list_cache.get("all")
+    if not hit:
+        rows = db.query(*USER_ROWS.columns).order_by(models.User.created_at.desc()).all()
+        body = USER_ROWS.encode(rows)
+        cache.user_list_cache.set("all", body)
+    return body
+
+
+def cached_user(username: str) -> Optional[schemas.UserRead]:
+    """User snapshot from the cache only; never touches the database."""
+    hit, user = cache.user_cache.get(username)
+    return user if hit else None
+
+
+def remember_user(user: models.User) -> schemas.UserRead:
+    snapshot = schemas.UserRead.model_validate(user)
+    cache.user_cache.set(snapshot.username, snapshot)
+    return snapshot
+
+
+def get_users_by_usernames(db: Session, usernames: List[str]) -> List[schemas.UserRead]:
+    """Existing users among ``usernames``; cached ones are served without the database."""
+    found: List[schemas.UserRead] = []
+    missing = []
+    for username in usernames:
+        user = cached_user(username)
+        if user:
+            found.append(user)
+        else:
+            missing.append(username)
+    if missing:
+        rows = db.query(models.User).filter(models.User.username.in_(missing)).all()
+        found.extend(remember_user(row) for row in rows)
+    return found
+
+
+def get_users_page(db: Session, limit: int, after: Optional[str] = None) -> Page:
+    """Newest-first keyset page of USER_ROWS; raises ValueError for a malformed cursor."""
+    query = db.query(*USER_ROWS.columns)
+    return _keyset_page(db, query, models.User.created_at, models.User.id, limit, after)
 
 
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
@@ -29,46 +78,50 @@ def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def update_user(db: Session, user_id: int, payload: schemas.UserUpdate) -> Optional[models.User]:
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        return None
+# User columns copied into cached cost frames and results (pricing.load_frame, cost_cache).
+_COSTED_USER_FIELDS = frozenset({"username", "full_name", "department"})
+
+
+def _apply_user_updates(db: Session, user: models.User, payload: schemas.UserUpdate) -> models.User:
+    """Write the set fields, then drop the cache entries of the old and the new username."""
     updates = payload.dict(exclude_unset=True)
     if not updates:
         return user
+    old_username = user.username
+    costs_changed = any(
+        name in _COSTED_USER_FIELDS and getattr(user, name) != value for name, value in updates.items()
+    )
     for field, value in updates.items():
         setattr(user, field, value)
     db.commit()
     db.refresh(user)
+    cache.invalidate_users(old_username)
+    if user.username != old_username:
+        cache.invalidate_users(user.username)
+    if costs_changed:
+        cache.invalidate_costs()
     return user
 
 
+def update_user(db: Session, user_id: int, payload: schemas.UserUpdate) -> Optional[models.User]:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        return None
+    return _apply_user_updates(db, user, payload)
+
+
 def update_user_by_username(db: Session, username: str, payload: schemas.UserUpdate) -> Optional[models.User]:
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         return None
-    updates = payload.dict(exclude_unset=True)
-    if not updates:
-        return user
-    for field, value in updates.items():
-        setattr(user, field, value)
-    db.commit()
-    db.refresh(user)
-    return user
+    return _apply_user_updates(db, user, payload)
 
 
 def update_user_by_full_name(db: Session, full_name: str, payload: schemas.UserUpdate) -> Optional[models.User]:
     user = db.query(models.User).filter(models.User.full_name == full_name).first()
     if not user:
         return None
-    updates = payload.dict(exclude_unset=True)
-    if not updates:
-        return user
-    for field, value in updates.items():
-        setattr(user, field, value)
-    db.commit()
-    db.refresh(user)
-    return user
+    return _apply_user_updates(db, user, payload)
 
 
 # Session CRUD
@@ -81,76 +134,424 @@ def create_container_session(
         session.start_time = naive_now_local()
     else:
         session.start_time = ensure_naive_local(session.start_time)
+    partitions.ensure_writable(db, session.start_time)
     db.add(session)
+    outbox.enqueue_session_change(db, session)
     db.commit()
     db.refresh(session)
+    cache.invalidate_costs()
     return session
 
 
 def update_container_session(
     db: Session, session_id: int, payload: schemas.ContainerSessionUpdate
 ) -> Optional[models.ContainerSession]:
-    session_db = db.query(models.ContainerSession).filter(models.ContainerSession.id == session_id).first()
+    session_db = (
+        db.query(models.ContainerSession)
+        .filter(models.ContainerSession.id == session_id)
+        .with_for_update()
+        .first()
+    )
     if not session_db:
         return None
+    partitions.ensure_writable(db, session_db.start_time)
     updates = payload.dict(exclude_unset=True)
     if "start_time" in updates:
         updates["start_time"] = ensure_naive_local(updates["start_time"])
+        partitions.ensure_writable(db, updates["start_time"])
     if "end_time" in updates:
         updates["end_time"] = ensure_naive_local(updates["end_time"])
+    if rollup.needs_retraction(session_db, updates):
+        # The rollup holds usage past the new end or under the old values: take the session out, the accruer re-adds it.
+        rollup.retract_session(db, session_db)
     for field, value in updates.items():
         setattr(session_db, field, value)
     if payload.end_time and payload.status is None:
         session_db.status = "completed"
+    outbox.enqueue_session_change(db, session_db)
     db.commit()
     db.refresh(session_db)
+    cache.invalidate_costs()
     return session_db
 
 
-def get_sessions(db: Session, user_id: Optional[int] = None) -> List[models.ContainerSession]:
-    query = db.query(models.ContainerSession).order_by(models.ContainerSession.start_time.desc())
+def get_sessions_json(db: Session, user_id: Optional[int] = None, **filters) -> bytes:
+    """Filtered sessions, newest first, as encoded ContainerSessionRead JSON."""
+    query = db.query(*SESSION_ROWS.columns).order_by(models.ContainerSession.start_time.desc())
+    return SESSION_ROWS.encode(filter_sessions(query, user_id=user_id, **filters).all())
+
+
+def filter_sessions(
+    query: Query,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    gpu_only: bool = False,
+) -> Query:
+    """Apply the /sessions filters; start/end bound start_time as a half-open [start, end) range."""
+    session_cls = models.ContainerSession
     if user_id:
-        query = query.filter(models.ContainerSession.user_id == user_id)
-    return query.all()
+        query = query.filter(session_cls.user_id == user_id)
+    if username:
+        user_ids = select(models.User.id).where(models.User.username == username)
+        query = query.filter(session_cls.user_id.in_(user_ids))
+    if status:
+        query = query.filter(session_cls.status == status)
+    if start:
+        query = query.filter(session_cls.start_time >= ensure_naive_local(start))
+    if end:
+        query = query.filter(session_cls.start_time < ensure_naive_local(end))
+    if gpu_only:
+        query = query.filter(session_cls.requested_gpu > 0)
+    return query
+
+
+def get_sessions_page(
+    db: Session,
+    limit: int,
+    after: Optional[str] = None,
+    **filters,
+) -> Page:
+    """Newest-first keyset page of SESSION_ROWS; raises ValueError for a malformed cursor."""
+    query = filter_sessions(db.query(*SESSION_ROWS.columns), **filters)
+    return _keyset_page(
+        db, query, models.ContainerSession.start_time, models.ContainerSession.id, limit, after
+    )
+
+
+def _keyset_page(db: Session, query: Query, sort_column, id_column, limit: int, after: Optional[str]) -> Page:
+    total_estimate = estimate_count(db, query)
+    if after:
+        cursor_value, cursor_id = decode_cursor(after)
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(cursor_value, cursor_id))
+    # Fetch one extra row to learn whether another page exists without counting.
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return Page(items=rows, next_cursor=next_cursor, total_estimate=total_estimate)
 
 
 def get_usage_summary(db: Session) -> List[schemas.UsageSummary]:
+    """Per-user totals from usage_rollup_daily plus the live, not yet accrued tail."""
+    rollup_table = models.UsageRollupDaily
+    rolled = {
+        row.user_id: row
+        for row in db.query(
+            rollup_table.user_id,
+            func.sum(rollup_table.session_count).label("total_sessions"),
+            func.sum(rollup_table.wall_hours).label("total_hours"),
+            func.sum(rollup_table.cost).label("total_estimated_cost"),
+            func.sum(rollup_table.storage_gib_hours).label("total_storage_gib_hours"),
+        )
+        .group_by(rollup_table.user_id)
+        .all()
+    }
+    live = rollup.live_totals(db, naive_now_local())
+
+    users = (
+        db.query(models.User.id, models.User.username, models.User.full_name)
+        .order_by(models.User.username)
+        .all()
+    )
+    summaries: List[schemas.UsageSummary] = []
+    for user in users:
+        row = rolled.get(user.id)
+        delta = live.get(user.id) or dict.fromkeys(rollup.MEASURES, 0.0)
+        rolled_sessions = int(row.total_sessions or 0) if row else 0
+        rolled_hours = float(row.total_hours or 0) if row else 0.0
+        rolled_cost = float(row.total_estimated_cost or 0) if row else 0.0
+        rolled_storage = float(row.total_storage_gib_hours or 0) if row else 0.0
+        summaries.append(
+            schemas.UsageSummary(
+                user_id=user.id,
+                username=user.username,
+                full_name=user.full_name,
+                total_sessions=rolled_sessions + int(delta["session_count"]),
+                total_hours=rolled_hours + delta["wall_hours"],
+                total_estimated_cost=rolled_cost + delta["cost"],
+                total_storage_gib_hours=rolled_storage,
+            )
+        )
+    return summaries
+
+
+BILLING_GROUPS = ("user", "department")
+MAX_BILLING_PERIODS = 120
+
+
+def billing_periods(start: datetime, end: datetime, breakdown: Optional[str] = None) -> List[Tuple[datetime, datetime]]:
+    """Split [start, end) into the reporting periods: one, or one per calendar month."""
+    if breakdown != "month":
+        return [(start, end)]
+    periods: List[Tuple[datetime, datetime]] = []
+    cursor = start
+    while cursor < end:
+        if cursor.month == 12:
+            next_month = cursor.replace(year=cursor.year + 1, month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        else:
+            next_month = cursor.replace(month=cursor.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        periods.append((cursor, min(next_month, end)))
+        cursor = next_month
+    return periods
+
+
+def _billing_window_periods(
+    start: datetime, end: datetime, group_by: str, breakdown: Optional[str]
+) -> List[Tuple[datetime, datetime]]:
+    """Validated periods of a billing request; raises ValueError like get_billing_window."""
+    if end <= start:
+        raise ValueError("end must be later than start")
+    if group_by not in BILLING_GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(BILLING_GROUPS)}")
+    periods = billing_periods(start, end, breakdown)
+    if len(periods) > MAX_BILLING_PERIODS:
+        raise ValueError(f"at most {MAX_BILLING_PERIODS} periods per request")
+    return periods
+
+
+def _period_table(dialect: str, periods: List[Tuple[datetime, datetime]]):
+    """The periods as a (period_start, period_end) table to join sessions against.
+
+    SQLite has no column list on a VALUES alias, so it gets a UNION ALL of rows instead.
+    """
+    if dialect == "sqlite":
+        rows = [
+            select(literal(start, DateTime).label("period_start"), literal(end, DateTime).label("period_end"))
+            for start, end in periods
+        ]
+        return union_all(*rows).subquery("periods")
+    return values(
+        column("period_start", DateTime),
+        column("period_end", DateTime),
+        name="periods",
+    ).data(periods)
+
+
+def _clipped_hours(dialect: str, start_a, start_b, end_a, end_b):
+    """Hours of overlap of [start_a, end_a) and [start_b, end_b), 0 when disjoint, as SQL.
+
+    PostgreSQL has GREATEST/LEAST and interval epochs; SQLite spells them as the
+    scalar max()/min() and julianday() differences.
+    """
+    if dialect == "sqlite":
+        overlap = (func.julianday(func.min(end_a, end_b)) - func.julianday(func.max(start_a, start_b))) * 24.0
+        return func.max(overlap, 0)
+    overlap = func.extract("epoch", func.least(end_a, end_b) - func.greatest(start_a, start_b)) / 3600.0
+    return func.greatest(overlap, 0)
+
+
+def get_billing_window(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    group_by: str = "user",
+    breakdown: Optional[str] = None,
+) -> List[schemas.BillingWindowSummary]:
+    """Usage with every session clipped to each period of [start, end), aggregated in one query.
+
+    Raises ValueError for an empty window, an unknown grouping or too many periods.
+    """
+    start = ensure_naive_local(start)
+    end = ensure_naive_local(end)
+    periods = _billing_window_periods(start, end, group_by, breakdown)
+
+    session_cls = models.ContainerSession
     current_local = naive_now_local()
-    duration_hours = func.extract(
-        'epoch',
-        (
-            func.coalesce(models.ContainerSession.end_time, literal(current_local))
-            - models.ContainerSession.start_time
-        ),
-    ) / 3600.0
+    dialect = db.get_bind().dialect.name
+    buckets = _period_table(dialect, periods)
+    session_end = func.coalesce(session_cls.end_time, literal(current_local))
+    clipped_hours = _clipped_hours(
+        dialect,
+        session_cls.start_time,
+        buckets.c.period_start,
+        session_end,
+        buckets.c.period_end,
+    )
+    memory_gib = session_cls.requested_memory_mb * (1_000_000 / 1024 ** 3)
+
+    if group_by == "user":
+        group_columns = [models.User.id, models.User.username, models.User.full_name]
+        labels = [
+            models.User.id.label("user_id"),
+            models.User.username.label("username"),
+            models.User.full_name.label("full_name"),
+        ]
+        order = [models.User.username]
+    else:
+        department = func.coalesce(models.User.department, "")
+        group_columns = [department]
+        labels = [department.label("department")]
+        order = [department]
+
+    # Window bounds repeated on the session table so the planner can use the time indexes;
+    # the archive bound also lets PostgreSQL prune months that ended before the window.
+    window_filters = [
+        session_cls.start_time < end,
+        or_(session_cls.end_time.is_(None), session_cls.end_time > start),
+    ]
+    lower_bound = partitions.billing_lower_bound(db, start)
+    if lower_bound is not None:
+        window_filters.append(session_cls.start_time >= lower_bound)
 
     rows = (
         db.query(
-            models.User.id.label("user_id"),
-            models.User.username,
-            models.User.full_name,
-            func.count(models.ContainerSession.id).label("total_sessions"),
-            func.coalesce(func.sum(duration_hours), 0).label("total_hours"),
-            func.coalesce(func.sum(duration_hours * models.ContainerSession.cost_rate_per_hour), 0).label(
-                "total_estimated_cost"
-            ),
+            buckets.c.period_start,
+            buckets.c.period_end,
+            *labels,
+            func.count(session_cls.id).label("total_sessions"),
+            func.coalesce(func.sum(clipped_hours), 0).label("total_hours"),
+            func.coalesce(func.sum(clipped_hours * session_cls.requested_cpu), 0).label("cpu_core_hours"),
+            func.coalesce(func.sum(clipped_hours * memory_gib), 0).label("memory_gib_hours"),
+            func.coalesce(func.sum(clipped_hours * session_cls.requested_gpu), 0).label("gpu_hours"),
+            func.coalesce(func.sum(clipped_hours * cast(session_cls.cost_rate_per_hour, Float)), 0).label("total_estimated_cost"),
         )
-        .outerjoin(models.ContainerSession, models.User.id == models.ContainerSession.user_id)
-        .group_by(models.User.id)
-        .order_by(models.User.username)
+        .select_from(session_cls)
+        .join(models.User, models.User.id == session_cls.user_id)
+        .join(
+            buckets,
+            and_(session_cls.start_time < buckets.c.period_end, session_end > buckets.c.period_start),
+        )
+        .filter(*window_filters)
+        .group_by(buckets.c.period_start, buckets.c.period_end, *group_columns)
+        .order_by(buckets.c.period_start, *order)
         .all()
     )
 
-    summaries: List[schemas.UsageSummary] = []
+    storage = _storage_gib_hours(db, periods, group_by)
+    summaries: List[schemas.BillingWindowSummary] = []
     for row in rows:
+        group_key = (row.period_start, row.user_id if group_by == "user" else row.department)
         summaries.append(
-            schemas.UsageSummary(
-                user_id=row.user_id,
-                username=row.username,
-                full_name=row.full_name,
+            schemas.BillingWindowSummary(
+                period_start=row.period_start,
+                period_end=row.period_end,
+                user_id=getattr(row, "user_id", None),
+                username=getattr(row, "username", None),
+                full_name=getattr(row, "full_name", None),
+                department=getattr(row, "department", None),
                 total_sessions=row.total_sessions,
                 total_hours=float(row.total_hours or 0),
+                cpu_core_hours=float(row.cpu_core_hours or 0),
+                memory_gib_hours=float(row.memory_gib_hours or 0),
+                gpu_hours=float(row.gpu_hours or 0),
                 total_estimated_cost=float(row.total_estimated_cost or 0),
+                storage_gib_hours=storage.pop(group_key, {}).get("storage_gib_hours", 0.0),
+            )
+        )
+    # Groups that only held storage in a period.
+    for entry in storage.values():
+        summaries.append(
+            schemas.BillingWindowSummary(
+                **entry,
+                total_sessions=0,
+                total_hours=0.0,
+                cpu_core_hours=0.0,
+                memory_gib_hours=0.0,
+                gpu_hours=0.0,
+                total_estimated_cost=0.0,
             )
         )
+    if storage:
+        summaries.sort(key=lambda item: (item.period_start, item.username or item.department or ""))
     return summaries
+
+
+def _storage_gib_hours(db: Session, periods: List[Tuple[datetime, datetime]], group_by: str) -> dict:
+    """Rolled-up PVC storage per (period_start, user id or department); days count whole.
+
+    Departments are the users' current ones, as for the session usage beside it.
+
+    A day belongs to the period its midnight falls in, or to the first period
+    when the window starts within it.
+    """
+    rollup_table = models.UsageRollupDaily
+    first_day = periods[0][0].date()
+    last_end = periods[-1][1]
+    if group_by == "user":
+        group_columns = [models.User.id, models.User.username, models.User.full_name]
+    else:
+        group_columns = [func.coalesce(models.User.department, "").label("department")]
+    rows = (
+        db.query(rollup_table.day, *group_columns, func.sum(rollup_table.storage_gib_hours).label("gib_hours"))
+        .join(models.User, models.User.id == rollup_table.user_id)
+        .filter(rollup_table.resource_profile == rollup.STORAGE_PROFILE)
+        .filter(rollup_table.day >= first_day)
+        .filter(rollup_table.day <= last_end.date())
+        .group_by(rollup_table.day, *group_columns)
+        .all()
+    )
+    totals: dict = {}
+    for row in rows:
+        day_start = datetime.combine(row.day, datetime.min.time())
+        if day_start >= last_end:
+            continue
+        period = next(((start, end) for start, end in periods if start <= day_start < end), periods[0])
+        if group_by == "user":
+            key = (period[0], row.id)
+            entry = {"user_id": row.id, "username": row.username, "full_name": row.full_name}
+        else:
+            key = (period[0], row.department)
+            entry = {"department": row.department}
+        target = totals.setdefault(
+            key, {"period_start": period[0], "period_end": period[1], "storage_gib_hours": 0.0, **entry}
+        )
+        target["storage_gib_hours"] += float(row.gib_hours or 0)
+    return totals
+
+
+def get_billing_costs(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    group_by: str = "user",
+    breakdown: Optional[str] = None,
+    rate_cards: Optional[List[schemas.RateCardCreate]] = None,
+) -> List[schemas.CostSummary]:
+    """Usage priced by the rate cards, per period; ``rate_cards`` reprices under hypothetical cards.
+
+    Raises ValueError like get_billing_window.
+    """
+    start = ensure_naive_local(start)
+    end = ensure_naive_local(end)
+    periods = _billing_window_periods(start, end, group_by, breakdown)
+    rates = pricing.rates_from_payload(rate_cards) if rate_cards is not None else None
+    summaries: List[schemas.CostSummary] = []
+    for period_start, period_end in periods:
+        summaries.extend(pricing.period_costs(db, period_start, period_end, group_by, rates))
+    return summaries
+
+
+# Rate cards
+
+def get_rate_cards(db: Session) -> List[models.RateCard]:
+    return (
+        db.query(models.RateCard)
+        .order_by(models.RateCard.resource, models.RateCard.gpu_model, models.RateCard.effective_from)
+        .all()
+    )
+
+
+def create_rate_card(db: Session, payload: schemas.RateCardCreate) -> models.RateCard:
+    """Add a card; raises ValueError when one already exists for the same resource, model and date."""
+    values = payload.dict()
+    values["effective_from"] = ensure_naive_local(values["effective_from"])
+    duplicate = (
+        db.query(models.RateCard.id)
+        .filter(models.RateCard.resource == values["resource"])
+        .filter(models.RateCard.gpu_model == values["gpu_model"])
+        .filter(models.RateCard.effective_from == values["effective_from"])
+        .first()
+    )
+    if duplicate:
+        raise ValueError("a rate card for this resource, GPU model and effective date already exists")
+    card = models.RateCard(**values)
+    db.add(card)
+    db.commit()
+    db.refresh(card)
+    cache.invalidate_costs()
+    return card
@@ -1,7 +1,17 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+try:
+    import asyncpg  # noqa: F401
+except ImportError:  # pragma: no cover - optional dependency
+    asyncpg = None
+
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql+psycopg2://usage_app:usage_app@db:5432/usage_db",
@@ -12,9 +22,65 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _async_database_url(url: str) -> str:
+    """Same database as DATABASE_URL, reached through the asyncpg driver."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        return ""
+    return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+
+# Request handlers use the async engine; background jobs keep the sync engine above.
+async_engine = None
+AsyncSessionLocal = None
+if asyncpg is not None and ASYNC_DATABASE_URL:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=int(os.getenv("ASYNC_DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20")),
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+class ThreadedSession:
+    """Fallback with AsyncSession's run_sync() when asyncpg is unavailable: runs on a worker thread."""
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.sync_session.close)
+
+
+@asynccontextmanager
+async def async_session():
+    """An AsyncSession, or a ThreadedSession when asyncpg is unavailable."""
+    if AsyncSessionLocal is None:
+        db = ThreadedSession(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_db():
+    """Request-scoped session; handlers call ``await db.run_sync(crud_fn, ...)``."""
+    async with async_session() as db:
+        yield db
@@ -0,0 +1,129 @@
+"""Streaming CSV / NDJSON export of container sessions."""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .timeutils import naive_now_local
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+GZIP_MEDIA_TYPE = "application/gzip"
+# Rows fetched per round trip from the server-side cursor, and rows per emitted chunk.
+FETCH_SIZE = 2000
+CHUNK_ROWS = 1000
+
+_session = models.ContainerSession
+EXPORT_COLUMNS = [
+    _session.id,
+    _session.user_id,
+    models.User.username,
+    _session.container_name,
+    _session.container_id,
+    _session.status,
+    _session.start_time,
+    _session.end_time,
+    _session.requested_cpu,
+    _session.requested_memory_mb,
+    _session.requested_gpu,
+    _session.cost_rate_per_hour,
+    _session.node_name,
+    _session.resource_profile,
+    _session.actual_cpu_hours,
+    _session.actual_memory_mb_hours,
+    _session.notes,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _rows(db: Session, filters: dict) -> Iterator[tuple]:
+    query = (
+        db.query(*EXPORT_COLUMNS)
+        .join(models.User, models.User.id == _session.user_id)
+        .order_by(_session.start_time, _session.id)
+    )
+    query = crud.filter_sessions(query, **filters)
+    # stream_results keeps a server-side cursor open instead of buffering the whole result.
+    yield from query.execution_options(stream_results=True, yield_per=FETCH_SIZE)
+
+
+def _csv_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    # Send the header right away so the client sees the download start.
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        record = {field: _plain(value) for field, value in zip(EXPORT_FIELDS, row)}
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # Sync flush so every chunk is decodable on arrival rather than held in the compressor.
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_sessions(
+    session_factory: Callable[[], Session],
+    fmt: str,
+    filters: dict,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """Yield the encoded export; owns its DB session because it outlives the request handler."""
+    db = session_factory()
+    try:
+        rows = _rows(db, filters)
+        text_chunks = _csv_chunks(rows) if fmt == "csv" else _ndjson_chunks(rows)
+        chunks = (chunk.encode("utf-8") for chunk in text_chunks)
+        yield from (_gzip_chunks(chunks) if gzip else chunks)
+    finally:
+        db.close()
+
+
+def export_filename(fmt: str, gzip: bool, now: Optional[datetime] = None) -> str:
+    stamp = (now or naive_now_local()).strftime("%Y%m%d-%H%M%S")
+    return f"sessions-{stamp}.{fmt}{'.gz' if gzip else ''}"
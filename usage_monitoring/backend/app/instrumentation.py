@@ -0,0 +1,170 @@
+"""Per-route request metrics, the /metrics endpoint and the on-demand profiler.
+
+``instrument(app)`` adds ``RequestMetricsMiddleware`` and the routes below to
+a FastAPI app. Call it right after the app is created, before any other
+middleware is added: the middleware then sits innermost, sees paths with the
+service prefix already stripped, and times the handler rather than the
+compression around it. Requests are labelled by route template
+(``/users/{username}/limits``), so path parameters do not multiply the series.
+
+Admin routes need ``INSTRUMENTATION_TOKEN`` (falling back to
+``DASHBOARD_TOKEN``) as a Bearer or ``X-Admin-Token`` header; the profiler is
+unavailable while no token is configured. /metrics takes the same token when
+one is set and is open otherwise. Apps with their own admin check pass it as
+``admin``.
+"""
+
+import hmac
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from starlette.routing import Match, Router
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import Gauge, Histogram, render_prometheus
+from .profiler import PROFILER_MAX_REQUESTS, SamplingProfiler
+
+INSTRUMENTATION_TOKEN = os.getenv("INSTRUMENTATION_TOKEN") or os.getenv("DASHBOARD_TOKEN", "")
+UNMATCHED_ROUTE = "<unmatched>"
+# Matching walks the route table (~25-50 us on the portal); recent paths are remembered.
+ROUTE_CACHE_SIZE = 4096
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Time until the response body was sent", ("method", "route", "status")
+)
+requests_in_flight = Gauge("http_requests_in_flight", "Requests being handled", ("method", "route"))
+profiler = SamplingProfiler()
+
+
+def route_template(router: Router, scope: Scope) -> str:
+    """Path template of the route that will handle ``scope``, matched the way the router does."""
+    partial = None
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+        if match == Match.PARTIAL and partial is None:
+            partial = getattr(route, "path", None)
+    return partial or UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """Latency histogram and in-flight gauge per (method, route); hands armed requests to the profiler."""
+
+    def __init__(self, app: ASGIApp, router: Router):
+        self.app = app
+        self.router = router
+        self._routes: Dict[Tuple[str, str, str], str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        key = (scope["method"], scope.get("root_path", ""), scope["path"])
+        route = self._routes.get(key)
+        if route is None:
+            route = route_template(self.router, scope)
+            if len(self._routes) >= ROUTE_CACHE_SIZE:
+                self._routes.clear()
+            self._routes[key] = route
+        return route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self._route(scope)
+        profiled = profiler.claim(method, route)
+        requests_in_flight.inc(method, route)
+        status = "500"
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_seconds.observe(time.perf_counter() - started, method, route, status)
+            requests_in_flight.dec(method, route)
+            if profiled:
+                profiler.release()
+
+
+def _token_matches(authorization: str, x_admin_token: str) -> bool:
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() == "bearer" and hmac.compare_digest(value.strip(), INSTRUMENTATION_TOKEN):
+        return True
+    return bool(x_admin_token) and hmac.compare_digest(x_admin_token.strip(), INSTRUMENTATION_TOKEN)
+
+
+def require_instrumentation_token(authorization: str = Header(default=""), x_admin_token: str = Header(default="")):
+    if not INSTRUMENTATION_TOKEN:
+        raise HTTPException(status_code=403, detail="未設定 INSTRUMENTATION_TOKEN，無法使用效能分析")
+    if not _token_matches(authorization, x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin token")
+
+
+def token_if_configured(authorization: str = Header(default=""), x_admin_token: str = Header(default="")):
+    if INSTRUMENTATION_TOKEN and not _token_matches(authorization, x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin token")
+
+
+class ProfileRequest(BaseModel):
+    route: str = Field(..., description="Route template, e.g. /users/{username}/limits")
+    method: str = "GET"
+    requests: int = Field(default=10, ge=1, le=PROFILER_MAX_REQUESTS)
+    interval_ms: float = Field(default=5, ge=1, le=100)
+
+
+def instrumentation_router(app: FastAPI, admin: Optional[Callable] = None) -> APIRouter:
+    router = APIRouter(include_in_schema=False)
+    admin_dependency = Depends(admin or require_instrumentation_token)
+    metrics_dependency = Depends(admin or token_if_configured)
+
+    @router.get("/metrics", dependencies=[metrics_dependency])
+    def metrics():
+        return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+    @router.get("/admin/profile", dependencies=[admin_dependency])
+    def profile_status():
+        return profiler.status()
+
+    @router.post("/admin/profile", status_code=202, dependencies=[admin_dependency])
+    def arm_profile(payload: ProfileRequest):
+        method = payload.method.upper()
+        templates = {
+            getattr(route, "path", None)
+            for route in app.router.routes
+            if method in (getattr(route, "methods", None) or {method})
+        }
+        if payload.route not in templates:
+            raise HTTPException(status_code=400, detail=f"找不到路由 {method} {payload.route}")
+        profiler.arm(method, payload.route, payload.requests, payload.interval_ms / 1000)
+        return profiler.status()
+
+    @router.get("/admin/profile/folded", dependencies=[admin_dependency])
+    def profile_folded():
+        """Folded stacks for flamegraph.pl / speedscope; partial while the profile is still running."""
+        status = profiler.status()
+        if status["state"] in {"idle", "armed", "cancelled"} and not status["samples"]:
+            raise HTTPException(status_code=404, detail="尚無效能分析結果")
+        return PlainTextResponse(profiler.folded(), headers={"X-Profile-State": str(status["state"])})
+
+    @router.delete("/admin/profile", dependencies=[admin_dependency])
+    def cancel_profile():
+        profiler.disarm()
+        return profiler.status()
+
+    return router
+
+
+def instrument(app: FastAPI, admin: Optional[Callable] = None) -> None:
+    app.add_middleware(RequestMetricsMiddleware, router=app.router)
+    app.include_router(instrumentation_router(app, admin))
@@ -74,6 +74,14 @@ def _extract_username(metadata: Dict[str, dict], pod_name: str) -> Tuple[str, st
     return "(unknown)", "(unknown)"
 
 
+def _pvc_owner(metadata: dict, name: str) -> str:
+    """Username from the hub.jupyter.org labels KubeSpawner sets, else from the claim name."""
+    user, _ = _extract_username(metadata, "")
+    if user != "(unknown)":
+        return user
+    return _normalize_username_for_key(name[len(SINGLEUSER_PVC_PREFIX) :]) if name else ""
+
+
 def list_singleuser_pvcs() -> List[dict]:
     """Return metadata of singleuser PVCs (names starting with SINGLEUSER_PVC_PREFIX)."""
     args = ["get", "pvc", "-n", JHUB_NAMESPACE, "-o", "json"]
@@ -100,6 +108,7 @@ def list_singleuser_pvcs() -> List[dict]:
         items.append(
             {
                 "name": name,
+                "user": _pvc_owner(metadata, name),
                 "namespace": metadata.get("namespace", JHUB_NAMESPACE),
                 "storage_class": spec.get("storageClassName") or "",
                 "volume_name": status.get("boundVolume") or status.get("volumeName") or "",
@@ -119,6 +128,17 @@ def delete_pvc(name: str) -> None:
     run_kubectl(args)
 
 
+def pod_claim_names(spec: dict) -> List[str]:
+    """claimNames of every PVC volume in a pod spec, mounted by any container or not."""
+    claims: List[str] = []
+    for vol in spec.get("volumes", []) or []:
+        pvc = (vol.get("persistentVolumeClaim") or {}) if isinstance(vol, dict) else {}
+        claim_name = pvc.get("claimName") if isinstance(pvc, dict) else None
+        if claim_name:
+            claims.append(claim_name)
+    return claims
+
+
 def list_pvc_claims_in_use() -> Set[str]:
     """Return claimNames referenced by any non-terminal Pod in the JupyterHub namespace."""
     args = ["get", "pods", "-n", JHUB_NAMESPACE, "-o", "json"]
@@ -130,12 +150,7 @@ def list_pvc_claims_in_use() -> Set[str]:
         phase = str(status.get("phase") or "").lower()
         if phase in {"succeeded", "failed"}:
             continue
-        spec = item.get("spec", {}) or {}
-        for vol in spec.get("volumes", []) or []:
-            pvc = (vol.get("persistentVolumeClaim") or {}) if isinstance(vol, dict) else {}
-            claim_name = pvc.get("claimName") if isinstance(pvc, dict) else None
-            if claim_name:
-                in_use.add(claim_name)
+        in_use.update(pod_claim_names(item.get("spec", {}) or {}))
     return in_use
 
 
@@ -271,18 +286,101 @@ def collect_volume_mounts(pod_spec: dict, container_spec: dict) -> List[dict]:
     return mounts
 
 
+_SINGLEUSER_PODS_ARGS = [
+    "get",
+    "pods",
+    "-n",
+    JHUB_NAMESPACE,
+    "-l",
+    "component=singleuser-server",
+    "-o",
+    "json",
+]
+
+
+def _pod_info(item: dict, metrics_map: Dict[str, Dict[str, Optional[float]]]) -> dict:
+    metadata = item.get("metadata", {})
+    status = item.get("status", {})
+    spec = item.get("spec", {})
+    containers = spec.get("containers", [])
+    container = containers[0] if containers else {}
+    resources = container.get("resources", {})
+    requests = resources.get("requests", {})
+    limits = resources.get("limits", {})
+    labels = metadata.get("labels", {})
+    pod_name = metadata.get("name", "")
+    user, display_user = _extract_username(metadata, pod_name)
+    server_name = labels.get("hub.jupyter.org/servername", "")
+    metrics_entry = metrics_map.get(pod_name, {})
+    start_time_raw = status.get("startTime")
+    start_time_local = None
+    age_seconds = None
+    if start_time_raw:
+        try:
+            start_dt = datetime.fromisoformat(start_time_raw.replace("Z", "+00:00")).astimezone(LOCAL_TZ)
+            start_time_local = start_dt
+            age_seconds = (datetime.now(LOCAL_TZ) - start_dt).total_seconds()
+        except Exception:
+            age_seconds = None
+    container_ids: List[str] = []
+    for cs in status.get("containerStatuses", []):
+        cid = _normalize_container_id(cs.get("containerID"))
+        if cid:
+            container_ids.append(cid)
+    node_name = spec.get("nodeName") or status.get("nodeName")
+    pod_info = {
+        "podName": pod_name,
+        "user": user,
+        "displayUser": display_user,
+        "serverName": server_name,
+        "phase": status.get("phase"),
+        "node": node_name,
+        "ip": status.get("podIP"),
+        "startTime": isoformat_local(start_time_local) if start_time_local else start_time_raw,
+        "ageSeconds": age_seconds,
+        "image": container.get("image"),
+        "requests": {
+            "cpu": requests.get("cpu"),
+            "memory": requests.get("memory"),
+            "gpu": requests.get("nvidia.com/gpu"),
+            "cpuMillicores": parse_cpu_to_millicores(requests.get("cpu")),
+            "memoryMiB": parse_mem_to_mebibytes(requests.get("memory")),
+        },
+        "limits": {
+            "cpu": limits.get("cpu"),
+            "memory": limits.get("memory"),
+            "gpu": limits.get("nvidia.com/gpu"),
+            "cpuMillicores": parse_cpu_to_millicores(limits.get("cpu")),
+            "memoryMiB": parse_mem_to_mebibytes(limits.get("memory")),
+        },
+        "usage": {
+            "cpu": metrics_entry.get("cpuRaw"),
+            "memory": metrics_entry.get("memRaw"),
+            "cpuMillicores": metrics_entry.get("cpuMillicores"),
+            "memoryMiB": metrics_entry.get("memMib"),
+        },
+        "volumes": collect_volume_mounts(spec, container),
+        "claims": pod_claim_names(spec),
+        "containerIds": container_ids,
+        "gpuUsage": {
+            "memoryUsedMiB": 0.0,
+            "memoryTotalMiB": 0.0,
+            "utilization": 0.0,
+            "processCount": 0,
+            "deviceCount": 0,
+        },
+    }
+    return pod_info
+
+
+def list_singleuser_pods() -> List[dict]:
+    """Pods of single-user servers from one ``kubectl get``; no metrics, kubectl top or nvidia-smi."""
+    data = json.loads(run_kubectl(_SINGLEUSER_PODS_ARGS))
+    return [_pod_info(item, {}) for item in data.get("items", [])]
+
+
 def collect_usage_payload() -> dict:
-    args = [
-        "get",
-        "pods",
-        "-n",
-        JHUB_NAMESPACE,
-        "-l",
-        "component=singleuser-server",
-        "-o",
-        "json",
-    ]
-    raw = run_kubectl(args)
+    raw = run_kubectl(_SINGLEUSER_PODS_ARGS)
     data = json.loads(raw)
     metrics_available, metrics_map = fetch_pod_metrics()
 
@@ -290,76 +388,9 @@ def collect_usage_payload() -> dict:
     container_index: Dict[str, dict] = {}
     pod_lookup: Dict[str, dict] = {}
     for item in data.get("items", []):
-        metadata = item.get("metadata", {})
-        status = item.get("status", {})
-        spec = item.get("spec", {})
-        containers = spec.get("containers", [])
-        container = containers[0] if containers else {}
-        resources = container.get("resources", {})
-        requests = resources.get("requests", {})
-        limits = resources.get("limits", {})
-        labels = metadata.get("labels", {})
-        pod_name = metadata.get("name", "")
-        user, display_user = _extract_username(metadata, pod_name)
-        server_name = labels.get("hub.jupyter.org/servername", "")
-        metrics_entry = metrics_map.get(pod_name, {})
-        start_time_raw = status.get("startTime")
-        start_time_local = None
-        age_seconds = None
-        if start_time_raw:
-            try:
-                start_dt = datetime.fromisoformat(start_time_raw.replace("Z", "+00:00")).astimezone(LOCAL_TZ)
-                start_time_local = start_dt
-                age_seconds = (datetime.now(LOCAL_TZ) - start_dt).total_seconds()
-            except Exception:
-                age_seconds = None
-        container_ids: List[str] = []
-        for cs in status.get("containerStatuses", []):
-            cid = _normalize_container_id(cs.get("containerID"))
-            if cid:
-                container_ids.append(cid)
-        node_name = spec.get("nodeName") or status.get("nodeName")
-        pod_info = {
-            "podName": pod_name,
-            "user": user,
-            "displayUser": display_user,
-            "serverName": server_name,
-            "phase": status.get("phase"),
-            "node": node_name,
-            "ip": status.get("podIP"),
-            "startTime": isoformat_local(start_time_local) if start_time_local else start_time_raw,
-            "ageSeconds": age_seconds,
-            "image": container.get("image"),
-            "requests": {
-                "cpu": requests.get("cpu"),
-                "memory": requests.get("memory"),
-                "gpu": requests.get("nvidia.com/gpu"),
-                "cpuMillicores": parse_cpu_to_millicores(requests.get("cpu")),
-                "memoryMiB": parse_mem_to_mebibytes(requests.get("memory")),
-            },
-            "limits": {
-                "cpu": limits.get("cpu"),
-                "memory": limits.get("memory"),
-                "gpu": limits.get("nvidia.com/gpu"),
-                "cpuMillicores": parse_cpu_to_millicores(limits.get("cpu")),
-                "memoryMiB": parse_mem_to_mebibytes(limits.get("memory")),
-            },
-            "usage": {
-                "cpu": metrics_entry.get("cpuRaw"),
-                "memory": metrics_entry.get("memRaw"),
-                "cpuMillicores": metrics_entry.get("cpuMillicores"),
-                "memoryMiB": metrics_entry.get("memMib"),
-            },
-            "volumes": collect_volume_mounts(spec, container),
-            "containerIds": container_ids,
-            "gpuUsage": {
-                "memoryUsedMiB": 0.0,
-                "memoryTotalMiB": 0.0,
-                "utilization": 0.0,
-                "processCount": 0,
-                "deviceCount": 0,
-            },
-        }
+        pod_info = _pod_info(item, metrics_map)
+        pod_name = pod_info["podName"]
+        container_ids = pod_info["containerIds"]
         pods.append(pod_info)
         pod_lookup[pod_name] = pod_info
         for cid in container_ids:
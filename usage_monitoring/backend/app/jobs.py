@@ -0,0 +1,502 @@
+"""Background jobs for the node scripts (add_node.sh / del_node.sh).
+
+Submitting a job returns its id at once; the scripts run in a bounded worker
+pool instead of holding an API thread for the minutes a MicroK8s join takes.
+Every output line is handed to live subscribers (the SSE endpoint) as it is
+read and written to script_job_logs in small batches, so finished jobs can be
+replayed and other portal processes can follow a job from the database.
+
+Each job records the portal process that owns it and a heartbeat. A job is
+failed as interrupted only once its owner is gone: the heartbeat went stale,
+or the owner was a process on this host that no longer exists.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models, schemas
+from .timeutils import naive_now_local
+
+JOB_WORKERS = int(os.getenv("SCRIPT_JOB_WORKERS", "4"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("SCRIPT_JOB_TIMEOUT_SECONDS", "3600"))
+LOG_FLUSH_SECONDS = float(os.getenv("SCRIPT_JOB_LOG_FLUSH_SECONDS", "1"))
+# Comment frames keep idle SSE connections open through proxies.
+HEARTBEAT_SECONDS = 15.0
+# How often a portal process stamps the jobs it owns; after OWNER_STALE_BEATS missed beats they count as orphaned.
+OWNER_HEARTBEAT_SECONDS = float(os.getenv("SCRIPT_JOB_HEARTBEAT_SECONDS", "15"))
+OWNER_STALE_BEATS = 4
+
+ACTIVE_STATUSES = ("queued", "running")
+REDACTED = "******"
+
+SessionFactory = Callable[[], Session]
+
+
+class JobConflict(ValueError):
+    """Another job for the same target is still queued or running."""
+
+
+@dataclass(frozen=True)
+class LogLine:
+    seq: int
+    stream: str
+    line: str
+    created_at: datetime
+
+
+def failure_hint(script_name: str, stdout: str, stderr: str) -> Optional[str]:
+    combined = f"{stdout}\n{stderr}".lower()
+    if "registered with dqlite" in combined:
+        return (
+            "MicroK8s 回報該節點仍註冊在 dqlite。"
+            "請先登入該節點執行 'sudo microk8s leave' 並清理 MicroK8s，"
+            "之後再重新刪除；若節點已無法登入，可勾選「強制移除」使用 --force"
+        )
+    if script_name == "del_node.sh" and "FailedMount" in stdout:
+        return (
+            "刪除前請確認節點上的 Pod/PVC 已清除；必要時可手動 cordon/drain 後再嘗試。"
+        )
+    return None
+
+
+class _LiveJob:
+    """Output of a job running in this process, with wake-ups for asyncio subscribers."""
+
+    def __init__(self) -> None:
+        self.lines: List[LogLine] = []
+        self.done = False
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def append(self, stream: str, line: str) -> LogLine:
+        with self._lock:
+            entry = LogLine(len(self.lines) + 1, stream, line, naive_now_local())
+            self.lines.append(entry)
+        self._wake()
+        return entry
+
+    def finish(self) -> None:
+        with self._lock:
+            self.done = True
+        self._wake()
+
+    def lines_after(self, seq: int) -> Tuple[List[LogLine], bool]:
+        with self._lock:
+            return self.lines[seq:], self.done
+
+    def subscribe(self) -> asyncio.Event:
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.append((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, event: asyncio.Event) -> None:
+        with self._lock:
+            self._waiters = [item for item in self._waiters if item[1] is not event]
+
+    def _wake(self) -> None:
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop is gone; it unsubscribes on its own way out.
+                pass
+
+
+def _read_job(job: models.ScriptJob) -> schemas.ScriptJobRead:
+    return schemas.ScriptJobRead(
+        id=job.id,
+        script=job.script,
+        target=job.target,
+        status=job.status,
+        ok=None if job.status in ACTIVE_STATUSES else job.status == "succeeded",
+        params=json.loads(job.params) if job.params else {},
+        exit_code=job.exit_code,
+        hint=job.hint,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class ScriptJobRunner:
+    """Runs portal scripts in a bounded pool and records their state and output."""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        script_dir: Path,
+        workers: int = JOB_WORKERS,
+        timeout_seconds: float = JOB_TIMEOUT_SECONDS,
+        on_finish: Optional[Callable[[], None]] = None,
+    ):
+        self._session_factory = session_factory
+        self.script_dir = script_dir
+        self.workers = max(1, int(workers))
+        self.timeout_seconds = timeout_seconds
+        self._on_finish = on_finish
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="script-job")
+        self._lock = threading.Lock()
+        self._live: Dict[str, _LiveJob] = {}
+        self._host = socket.gethostname()
+        # The nonce tells this process apart from an earlier one that had the same pid (e.g. pid 1 in a container).
+        self.owner = f"{self._host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # Submission
+
+    def submit(
+        self,
+        script_name: str,
+        answers: Sequence[str],
+        target: str,
+        params: dict,
+        secrets: Sequence[str] = (),
+    ) -> schemas.ScriptJobRead:
+        """Queue a script run fed with ``answers`` on stdin.
+
+        ``answers`` and ``secrets`` stay in memory only; ``secrets`` are masked
+        in the recorded output. Raises JobConflict when ``target`` is busy.
+        """
+        job_id = uuid.uuid4().hex
+        # A job whose owner died must not hold its target until the next sweep.
+        self.recover()
+        db = self._session_factory()
+        try:
+            job = models.ScriptJob(
+                id=job_id,
+                script=script_name,
+                target=target,
+                params=json.dumps(params, ensure_ascii=False),
+                status="queued",
+                owner=self.owner,
+                heartbeat_at=naive_now_local(),
+            )
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError as exc:
+                # uq_script_jobs_active_target: another queued or running job holds the target.
+                db.rollback()
+                busy = (
+                    db.query(models.ScriptJob.id)
+                    .filter(models.ScriptJob.target == target, models.ScriptJob.status.in_(ACTIVE_STATUSES))
+                    .first()
+                )
+                raise JobConflict(f"Job {busy.id if busy else '?'} for {target} is still running") from exc
+            result = _read_job(job)
+        finally:
+            db.close()
+        cleaned = [(value or "").replace("\n", "").strip() for value in answers]
+        with self._lock:
+            self._live[job_id] = _LiveJob()
+        self._executor.submit(self._run, job_id, script_name, cleaned, [value for value in secrets if value])
+        return result
+
+    def start(self) -> None:
+        """Start stamping this process's jobs and sweeping jobs orphaned by other processes."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="script-job-heartbeat", daemon=True)
+        self._thread.start()
+
+    def recover(self) -> int:
+        """Fail queued or running jobs whose owning process is gone; their scripts died with it."""
+        now = naive_now_local()
+        stale_before = now - timedelta(seconds=OWNER_HEARTBEAT_SECONDS * OWNER_STALE_BEATS)
+        db = self._session_factory()
+        try:
+            active = (
+                db.query(models.ScriptJob.id, models.ScriptJob.owner, models.ScriptJob.heartbeat_at)
+                .filter(models.ScriptJob.status.in_(ACTIVE_STATUSES))
+                .all()
+            )
+            orphaned = [row.id for row in active if self._owner_gone(row.owner, row.heartbeat_at, stale_before)]
+            if not orphaned:
+                return 0
+            count = (
+                db.query(models.ScriptJob)
+                .filter(models.ScriptJob.id.in_(orphaned), models.ScriptJob.status.in_(ACTIVE_STATUSES))
+                .update(
+                    {
+                        models.ScriptJob.status: "failed",
+                        models.ScriptJob.error: "Interrupted: the portal process running it stopped",
+                        models.ScriptJob.finished_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def _owner_gone(self, owner: Optional[str], heartbeat_at: Optional[datetime], stale_before: datetime) -> bool:
+        if owner == self.owner:
+            return False
+        if not owner or heartbeat_at is None or heartbeat_at < stale_before:
+            return True
+        host, _, rest = owner.partition(":")
+        if host != self._host:
+            return False
+        try:
+            pid = int(rest.split(":", 1)[0])
+        except ValueError:
+            return False
+        # Our own pid under another nonce is an earlier incarnation of this process.
+        return pid == os.getpid() or not _pid_alive(pid)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop_event.wait(OWNER_HEARTBEAT_SECONDS):
+            try:
+                self._beat()
+                interrupted = self.recover()
+                if interrupted:
+                    print(f"[script-jobs] marked {interrupted} orphaned job(s) as failed")
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[script-jobs] heartbeat failed: {exc}")
+
+    def _beat(self) -> None:
+        with self._lock:
+            if not self._live:
+                return
+        db = self._session_factory()
+        try:
+            db.query(models.ScriptJob).filter(
+                models.ScriptJob.owner == self.owner, models.ScriptJob.status.in_(ACTIVE_STATUSES)
+            ).update({models.ScriptJob.heartbeat_at: naive_now_local()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def shutdown(self) -> None:
+        """Drop queued jobs; running scripts are left to finish so no join is cut in half."""
+        self._stop_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Execution
+
+    def _run(self, job_id: str, script_name: str, answers: List[str], secrets: List[str]) -> None:
+        live = self._live[job_id]
+        status, exit_code, error = "failed", None, None
+        flushed = 0
+        proc = None
+        try:
+            self._update(job_id, status="running", started_at=naive_now_local())
+            script_path = self.script_dir / script_name
+            proc = subprocess.Popen(
+                ["bash", str(script_path)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                cwd=str(self.script_dir),
+                env=os.environ.copy(),
+            )
+            readers = [
+                threading.Thread(target=self._pump, args=(proc.stdout, "stdout", live, secrets), daemon=True),
+                threading.Thread(target=self._pump, args=(proc.stderr, "stderr", live, secrets), daemon=True),
+            ]
+            for reader in readers:
+                reader.start()
+            try:
+                proc.stdin.write("\n".join(answers) + "\n")
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            deadline = time.monotonic() + self.timeout_seconds
+            while True:
+                try:
+                    exit_code = proc.wait(timeout=LOG_FLUSH_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    try:
+                        flushed = self._flush(job_id, live, flushed)
+                    except Exception as exc:
+                        # The lines stay in memory and go out with the next flush; keep waiting on the script.
+                        print(f"[script-jobs] failed to store output of job {job_id}: {exc}")
+                    if time.monotonic() > deadline:
+                        proc.kill()
+                        error = f"Timed out after {int(self.timeout_seconds)}s"
+            for reader in readers:
+                reader.join(timeout=5)
+            status = "succeeded" if exit_code == 0 and error is None else "failed"
+        except Exception as exc:
+            error = str(exc)
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        finally:
+            try:
+                self._flush(job_id, live, flushed)
+                lines, _ = live.lines_after(0)
+                stdout = "\n".join(entry.line for entry in lines if entry.stream == "stdout")
+                stderr = "\n".join(entry.line for entry in lines if entry.stream == "stderr")
+                self._update(
+                    job_id,
+                    status=status,
+                    exit_code=exit_code,
+                    error=error,
+                    hint=failure_hint(script_name, stdout, stderr) if status == "failed" else None,
+                    finished_at=naive_now_local(),
+                )
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[script-jobs] failed to record job {job_id}: {exc}")
+            live.finish()
+            with self._lock:
+                self._live.pop(job_id, None)
+            if self._on_finish:
+                self._on_finish()
+
+    @staticmethod
+    def _pump(pipe, stream: str, live: _LiveJob, secrets: List[str]) -> None:
+        for raw in iter(pipe.readline, ""):
+            line = raw.rstrip("\n")
+            for secret in secrets:
+                line = line.replace(secret, REDACTED)
+            live.append(stream, line)
+        pipe.close()
+
+    def _flush(self, job_id: str, live: _LiveJob, flushed: int) -> int:
+        """Persist lines after ``flushed``; returns the new high-water mark."""
+        lines, _ = live.lines_after(flushed)
+        if not lines:
+            return flushed
+        db = self._session_factory()
+        try:
+            db.bulk_insert_mappings(
+                models.ScriptJobLog,
+                [
+                    {"job_id": job_id, "seq": e.seq, "stream": e.stream, "line": e.line, "created_at": e.created_at}
+                    for e in lines
+                ],
+            )
+            db.commit()
+        finally:
+            db.close()
+        return lines[-1].seq
+
+    def _update(self, job_id: str, **values) -> None:
+        db = self._session_factory()
+        try:
+            db.query(models.ScriptJob).filter(models.ScriptJob.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    # Reading
+
+    def get_job(self, job_id: str, with_log: bool = False) -> Optional[schemas.ScriptJobDetail]:
+        db = self._session_factory()
+        try:
+            job = db.get(models.ScriptJob, job_id)
+            if job is None:
+                return None
+            log = self._stored_lines(db, job_id, 0) if with_log else []
+            return schemas.ScriptJobDetail(
+                **_read_job(job).model_dump(),
+                log=[schemas.ScriptJobLogLine(**entry.__dict__) for entry in log],
+            )
+        finally:
+            db.close()
+
+    def list_jobs(self, limit: int = 50) -> List[schemas.ScriptJobRead]:
+        db = self._session_factory()
+        try:
+            jobs = db.query(models.ScriptJob).order_by(models.ScriptJob.created_at.desc()).limit(limit).all()
+            return [_read_job(job) for job in jobs]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _stored_lines(db: Session, job_id: str, after: int) -> List[LogLine]:
+        rows = (
+            db.query(models.ScriptJobLog)
+            .filter(models.ScriptJobLog.job_id == job_id, models.ScriptJobLog.seq > after)
+            .order_by(models.ScriptJobLog.seq)
+            .all()
+        )
+        return [LogLine(row.seq, row.stream, row.line, row.created_at) for row in rows]
+
+    def _poll_store(self, job_id: str, after: int) -> Tuple[List[LogLine], Optional[schemas.ScriptJobRead]]:
+        db = self._session_factory()
+        try:
+            job = db.get(models.ScriptJob, job_id)
+            return self._stored_lines(db, job_id, after), (_read_job(job) if job else None)
+        finally:
+            db.close()
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncIterator[str]:
+        """SSE frames: one ``line`` event per output line (id = seq), then a final ``done`` event."""
+        seq = after
+        with self._lock:
+            live = self._live.get(job_id)
+        if live is not None:
+            event = live.subscribe()
+            try:
+                while True:
+                    event.clear()
+                    lines, done = live.lines_after(seq)
+                    for entry in lines:
+                        seq = entry.seq
+                        yield _sse("line", {"stream": entry.stream, "line": entry.line}, entry.seq)
+                    if done:
+                        break
+                    try:
+                        await asyncio.wait_for(event.wait(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+            finally:
+                live.unsubscribe(event)
+        # Finished jobs, and jobs running in another portal process, are read from the database.
+        idle = 0.0
+        while True:
+            lines, job = await run_in_threadpool(self._poll_store, job_id, seq)
+            for entry in lines:
+                seq = entry.seq
+                yield _sse("line", {"stream": entry.stream, "line": entry.line}, entry.seq)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                break
+            await asyncio.sleep(LOG_FLUSH_SECONDS)
+            idle = 0.0 if lines else idle + LOG_FLUSH_SECONDS
+            if idle >= HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+        if job is not None:
+            yield _sse("done", job.model_dump(mode="json"))
@@ -0,0 +1,137 @@
+"""Startup lifecycle: timed startup phases and a deferred database bootstrap.
+
+Importing the app performs no database I/O. ``DatabaseBootstrap`` applies the
+schema migrations on a background thread once the server is accepting
+requests, retrying with exponential backoff while the database is
+unreachable, and only then starts the workers that need it. Until that
+succeeds the service stays up in a degraded mode. ``StartupReport`` records
+how long each phase took.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DB_BOOTSTRAP_RETRY_SECONDS = float(os.getenv("DB_BOOTSTRAP_RETRY_SECONDS", "1"))
+DB_BOOTSTRAP_RETRY_MAX_SECONDS = float(os.getenv("DB_BOOTSTRAP_RETRY_MAX_SECONDS", "30"))
+
+
+class StartupReport:
+    """Named phase durations and milestones, in seconds since the app module started importing."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._phases: List[Tuple[str, float]] = []
+        self._milestones: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._phases.append((name, seconds))
+
+    def mark(self, name: str) -> float:
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            self._milestones.setdefault(name, elapsed)
+        return elapsed
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            phases = list(self._phases)
+            milestones = dict(self._milestones)
+        return {
+            "milestones": {name: round(seconds, 4) for name, seconds in milestones.items()},
+            "phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in phases],
+        }
+
+
+class DatabaseBootstrap:
+    """Runs ``upgrade`` until it succeeds, then the ``on_ready`` callbacks, on a daemon thread."""
+
+    def __init__(
+        self,
+        upgrade: Callable[[], None],
+        report: Optional[StartupReport] = None,
+        retry_seconds: float = DB_BOOTSTRAP_RETRY_SECONDS,
+        retry_max_seconds: float = DB_BOOTSTRAP_RETRY_MAX_SECONDS,
+    ):
+        self.upgrade = upgrade
+        self.report = report or StartupReport()
+        self.retry_seconds = max(0.1, retry_seconds)
+        self.retry_max_seconds = max(self.retry_seconds, retry_max_seconds)
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self._callbacks: List[Tuple[str, Callable[[], None]]] = []
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def on_ready(self, name: str, callback: Callable[[], None]) -> None:
+        self._callbacks.append((name, callback))
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-bootstrap", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        delay = self.retry_seconds
+        while not self._stop.is_set():
+            self.attempts += 1
+            try:
+                with self.report.phase(f"migrations (attempt {self.attempts})"):
+                    self.upgrade()
+                break
+            except Exception as exc:
+                message = str(exc).strip()
+                self.last_error = message.splitlines()[0] if message else type(exc).__name__
+                print(
+                    f"[db-bootstrap] attempt {self.attempts} failed: {self.last_error}; retrying in {delay:.0f}s",
+                    flush=True,
+                )
+                if self._stop.wait(delay):
+                    return
+                delay = min(delay * 2, self.retry_max_seconds)
+        if self._stop.is_set():
+            return
+        self.last_error = None
+        self._ready.set()
+        self.report.record("database bootstrap", time.perf_counter() - started)
+        elapsed = self.report.mark("database_ready")
+        print(f"[db-bootstrap] database ready after {self.attempts} attempt(s), {elapsed:.2f}s", flush=True)
+        for name, callback in self._callbacks:
+            if self._stop.is_set():
+                return
+            try:
+                with self.report.phase(name):
+                    callback()
+            except Exception as exc:  # pragma: no cover - one worker failing must not block the rest
+                print(f"[db-bootstrap] {name} failed: {exc}", flush=True)
+
+    def state(self) -> dict:
+        return {"ready": self.ready, "attempts": self.attempts, "last_error": self.last_error}
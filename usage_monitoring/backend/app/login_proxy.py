@@ -0,0 +1,172 @@
+"""Streaming reverse proxy for the portal login endpoint.
+
+One pooled httpx.AsyncClient is shared by every login request, so a login
+rush reuses keep-alive (and HTTP/2, when the ``h2`` package is installed)
+connections to the upstream instead of paying a TCP/TLS handshake each. The
+request and response bodies are streamed through without buffering. httpx is
+imported when the client is created, so it costs nothing when no login
+upstream is configured.
+"""
+
+import importlib.util
+import os
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .metrics import Histogram
+
+if TYPE_CHECKING:  # pragma: no cover
+    import httpx
+
+# HTTP/2 needs the optional h2 package (httpx[http2]).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+LOGIN_PROXY_TARGET = os.getenv("PORTAL_LOGIN_PROXY_TARGET", "")
+LOGIN_PROXY_TIMEOUT = float(os.getenv("PORTAL_LOGIN_PROXY_TIMEOUT", "10"))
+LOGIN_PROXY_MAX_CONNECTIONS = int(os.getenv("PORTAL_LOGIN_PROXY_MAX_CONNECTIONS", "100"))
+LOGIN_PROXY_MAX_KEEPALIVE = int(os.getenv("PORTAL_LOGIN_PROXY_MAX_KEEPALIVE", "50"))
+LOGIN_PROXY_KEEPALIVE_SECONDS = float(os.getenv("PORTAL_LOGIN_PROXY_KEEPALIVE_SECONDS", "30"))
+LOGIN_PROXY_HTTP2 = os.getenv("PORTAL_LOGIN_PROXY_HTTP2", "true").lower() in {"1", "true", "yes", "on"}
+
+# Hop-by-hop headers (RFC 9110 7.6.1) describe a single connection and are not forwarded.
+_HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Time until the upstream's response headers, and until its body has been relayed.
+upstream_headers_seconds = Histogram(
+    "portal_login_upstream_headers_seconds", "Login upstream time to response headers", ("status",)
+)
+upstream_total_seconds = Histogram(
+    "portal_login_upstream_total_seconds", "Login upstream time until the response body was relayed", ("status",)
+)
+
+
+def _forward_headers(headers) -> Dict[str, str]:
+    connection_tokens = {token.strip().lower() for token in headers.get("connection", "").split(",") if token.strip()}
+    return {
+        key: value
+        for key, value in headers.items()
+        if key.lower() not in _HOP_BY_HOP and key.lower() not in connection_tokens and key.lower() != "host"
+    }
+
+
+class LoginProxy:
+    """Owns the pooled upstream client; ``start``/``stop`` follow the app lifecycle."""
+
+    def __init__(
+        self,
+        target: str = LOGIN_PROXY_TARGET,
+        timeout_seconds: float = LOGIN_PROXY_TIMEOUT,
+        max_connections: int = LOGIN_PROXY_MAX_CONNECTIONS,
+        max_keepalive: int = LOGIN_PROXY_MAX_KEEPALIVE,
+        keepalive_seconds: float = LOGIN_PROXY_KEEPALIVE_SECONDS,
+        http2: bool = LOGIN_PROXY_HTTP2,
+    ):
+        self.target = target
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_seconds = keepalive_seconds
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.target)
+
+    async def start(self) -> None:
+        if self.configured and self._client is None:
+            import httpx
+
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_seconds,
+            )
+            self._client = httpx.AsyncClient(timeout=self.timeout_seconds, limits=limits, http2=self.http2)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _target_url(self, query_string: str) -> str:
+        if not query_string:
+            return self.target
+        separator = "&" if "?" in self.target else "?"
+        return f"{self.target}{separator}{query_string}"
+
+    async def forward(self, request: Request) -> StreamingResponse:
+        if not self.configured:
+            raise HTTPException(status_code=503, detail="登入服務尚未設定")
+        if self._client is None:
+            await self.start()
+        import httpx
+
+        upstream_request = self._client.build_request(
+            request.method,
+            self._target_url(request.url.query),
+            headers=_forward_headers(request.headers),
+            content=request.stream(),
+        )
+        started = time.perf_counter()
+        try:
+            upstream = await self._client.send(upstream_request, stream=True)
+        except httpx.TimeoutException as exc:
+            self._record_error("timeout", started)
+            raise HTTPException(status_code=504, detail="登入服務逾時") from exc
+        except httpx.HTTPError as exc:
+            self._record_error("error", started)
+            raise HTTPException(status_code=502, detail=f"無法連線登入服務：{exc}") from exc
+        status = str(upstream.status_code)
+        upstream_headers_seconds.observe(time.perf_counter() - started, status)
+
+        async def relay():
+            # Raw bytes keep the upstream's content-encoding, so its headers stay valid as they are.
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                # Also runs when the client disconnects, returning the connection to the pool.
+                await upstream.aclose()
+                upstream_total_seconds.observe(time.perf_counter() - started, status)
+
+        return StreamingResponse(
+            relay(),
+            status_code=upstream.status_code,
+            headers=_forward_headers(upstream.headers),
+        )
+
+    def _record_error(self, kind: str, started: float) -> None:
+        self.errors += 1
+        elapsed = time.perf_counter() - started
+        upstream_headers_seconds.observe(elapsed, kind)
+        upstream_total_seconds.observe(elapsed, kind)
+
+    def stats(self) -> dict:
+        return {
+            "target": self.target,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive,
+            "keepalive_expiry_seconds": self.keepalive_seconds,
+            "errors": self.errors,
+            "upstream_headers": upstream_headers_seconds.snapshot(),
+            "upstream_total": upstream_total_seconds.snapshot(),
+        }
+
+
+login_proxy = LoginProxy()
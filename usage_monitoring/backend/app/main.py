@@ -1,214 +1,182 @@
-import json
 import os
 import shlex
-import subprocess
-import threading
 import time
-from datetime import datetime, timezone
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import httpx
-from . import crud, jhub, models, schemas
-from .config import DEFAULT_CPU_LIMIT_CORES, DEFAULT_GPU_LIMIT, DEFAULT_MEMORY_LIMIT_GIB
+from . import cache, crud, exports, jhub, migrations, models, pvc_usage, schemas
+from .assets import COMPRESSION_ENABLED, CompressionMiddleware, StaticAssets
 from .auto_recorder import recorder_from_env
-from .database import Base, engine, get_db, SessionLocal
+from .database import SessionLocal, async_session, engine
+from .fastjson import json_response
+from .instrumentation import instrument
+from .jobs import JobConflict, ScriptJobRunner
+from .lifecycle import DatabaseBootstrap, StartupReport
+from .login_proxy import login_proxy
 from .mysql_sync import pod_report_sync_from_env
-
-PVC_MAX_AGE_DAYS = int(os.getenv("PVC_MAX_AGE_DAYS", "7"))
-PVC_JANITOR_INTERVAL_SECONDS = int(os.getenv("PVC_JANITOR_INTERVAL_SECONDS", str(24 * 3600)))
-
-
-def _ensure_user_limit_columns() -> None:
-    dialect = engine.dialect.name
-    with engine.begin() as connection:
-        if dialect == "sqlite":
-            existing = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(users)").fetchall()}
-
-            def _add(column: str, default: int) -> None:
-                connection.exec_driver_sql(
-                    f"ALTER TABLE users ADD COLUMN {column} INTEGER NOT NULL DEFAULT {default}"
-                )
-
-            if "cpu_limit_cores" not in existing:
-                _add("cpu_limit_cores", DEFAULT_CPU_LIMIT_CORES)
-            if "memory_limit_gib" not in existing:
-                _add("memory_limit_gib", DEFAULT_MEMORY_LIMIT_GIB)
-            if "gpu_limit" not in existing:
-                _add("gpu_limit", DEFAULT_GPU_LIMIT)
-        else:
-            statements = [
-                f"ALTER TABLE users ADD COLUMN IF NOT EXISTS cpu_limit_cores INTEGER NOT NULL DEFAULT {DEFAULT_CPU_LIMIT_CORES}",
-                f"ALTER TABLE users ADD COLUMN IF NOT EXISTS memory_limit_gib INTEGER NOT NULL DEFAULT {DEFAULT_MEMORY_LIMIT_GIB}",
-                f"ALTER TABLE users ADD COLUMN IF NOT EXISTS gpu_limit INTEGER NOT NULL DEFAULT {DEFAULT_GPU_LIMIT}",
-            ]
-            for stmt in statements:
-                connection.exec_driver_sql(stmt)
-
-
-Base.metadata.create_all(bind=engine)
-_ensure_user_limit_columns()
+from .outbox import outbox_relay_from_env
+from .pagination import NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER
+from .partitions import partition_maintainer_from_env
+from .pvc_janitor import PVC_MAX_AGE_DAYS, PvcJanitor
+from .rollup import rollup_accruer_from_env
+from .snapshot import NodeAllocation, cluster_snapshot, index_by_node, node_inventory, pvc_inventory
+from .storage import storage_accruer_from_env
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_LIMITS_BATCH = 500
+
+startup_report = StartupReport()
+# Migrations run after the server is up, retrying until the database answers; see on_startup.
+db_bootstrap = DatabaseBootstrap(lambda: migrations.upgrade(engine), report=startup_report)
 
 LOGIN_API = os.getenv("PORTAL_LOGIN_API", "/iam/command")
 LOGIN_PROXY_PATH = os.getenv("PORTAL_LOGIN_PROXY_PATH", "/iam/command")
-LOGIN_PROXY_TARGET = os.getenv("PORTAL_LOGIN_PROXY_TARGET", "")
-LOGIN_PROXY_TIMEOUT = float(os.getenv("PORTAL_LOGIN_PROXY_TIMEOUT", "10"))
 ROOT_DIR = Path(__file__).resolve().parents[3]
 
 
+def require_dashboard_token(
+    authorization: str = Header(default=""),
+    x_dashboard_token: str = Header(default=""),
+):
+    token = jhub.DASHBOARD_TOKEN
+    if not token:
+        return
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() == "bearer" and value.strip() == token:
+        return
+    if x_dashboard_token and x_dashboard_token.strip() == token:
+        return
+    raise HTTPException(status_code=401, detail="Invalid or missing dashboard token")
+
+
 app = FastAPI(title="Usage Portal", version="2.0.0")
+# First, so its middleware is innermost and times the handlers; see instrumentation.
+instrument(app, admin=require_dashboard_token)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
 
 BASE_DIR = Path(__file__).resolve().parent
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 static_dir = BASE_DIR / "static"
+with startup_report.phase("static assets"):
+    static_assets = StaticAssets(static_dir, url_prefix="/static")
+templates.env.globals["static_url"] = static_assets.url
 if static_dir.exists():
-    app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+    app.mount("/static", static_assets, name="static")
 
 recorder = recorder_from_env()
 pod_report_sync = pod_report_sync_from_env(SessionLocal)
-pvc_janitor = None
+outbox_relay = outbox_relay_from_env(SessionLocal, sinks=[pod_report_sync] if pod_report_sync else [])
+rollup_accruer = rollup_accruer_from_env(SessionLocal)
+partition_maintainer = partition_maintainer_from_env(engine)
+storage_accruer = storage_accruer_from_env(SessionLocal)
+# The node scripts change the node list, so finished jobs drop the cached inventory.
+script_jobs = ScriptJobRunner(SessionLocal, ROOT_DIR, on_finish=node_inventory.invalidate)
+pvc_janitor = PvcJanitor()
 
 
-class PvcJanitor:
-    def __init__(self, interval_seconds: int, max_age_days: int):
-        self.interval_seconds = interval_seconds
-        self.max_age_days = max_age_days
-        self._stop = threading.Event()
-        self._thread: Optional[threading.Thread] = None
+def _empty_usage() -> dict:
+    return {"cpu_cores": 0.0, "memory_gib": 0.0, "gpu": 0.0}
 
-    def cleanup_once(self, max_age_days: Optional[int] = None) -> dict:
-        """Delete singleuser PVCs that have been idle (not mounted by any Pod) for max_age_days."""
-        threshold_idle_days = max_age_days or self.max_age_days
-        deleted = []
-        errors = []
-        try:
-            pvcs = jhub.list_singleuser_pvcs()
-            in_use = jhub.list_pvc_claims_in_use()
-        except Exception as exc:  # pragma: no cover - defensive
-            return {"deleted": deleted, "errors": [str(exc)], "scanned": 0}
-
-        now = datetime.now(timezone.utc)
-        for pvc in pvcs:
-            name = pvc.get("name")
-            if not name:
-                continue
-            if name in in_use:
-                try:
-                    jhub.touch_pvc_last_used(name, now=now)
-                except Exception as exc:  # pragma: no cover - best effort
-                    errors.append(f"{name}: update last-used failed: {exc}")
-                continue
-
-            annotations = pvc.get("annotations") or {}
-            last_used = jhub.parse_rfc3339(annotations.get(jhub.PVC_LAST_USED_ANNOTATION))
-            if not last_used:
-                try:
-                    # If last-used is unknown, initialize it so we only delete after
-                    # the PVC stays idle for threshold_idle_days from now on.
-                    jhub.touch_pvc_last_used(name, now=now)
-                except Exception as exc:  # pragma: no cover - best effort
-                    errors.append(f"{name}: init last-used failed: {exc}")
-                continue
-
-            idle_days = (now - last_used).total_seconds() / 86400.0
-            if idle_days < threshold_idle_days:
-                continue
-            try:
-                jhub.delete_pvc(name)
-                deleted.append(name)
-            except Exception as exc:  # pragma: no cover - defensive
-                errors.append(f"{name}: {exc}")
-        return {"deleted": deleted, "errors": errors, "scanned": len(pvcs)}
 
-    def _run_loop(self) -> None:
-        while not self._stop.wait(self.interval_seconds):
-            result = self.cleanup_once()
-            if result.get("deleted") or result.get("errors"):
-                print(f"[PVC Janitor] result={result}", flush=True)
+def _require_root_privileges() -> None:
+    if hasattr(os, "geteuid"):
+        if os.geteuid() != 0:
+            raise HTTPException(status_code=500, detail="Portal backend 必須以 root 身分執行 add_node.sh / del_node.sh")
 
-    def start(self) -> None:
-        if self._thread and self._thread.is_alive():
-            return
-        self._stop.clear()
-        self._thread = threading.Thread(target=self._run_loop, daemon=True)
-        self._thread.start()
 
-    def stop(self) -> None:
-        self._stop.set()
-        if self._thread:
-            self._thread.join(timeout=5)
+DATABASE_UNAVAILABLE = "資料庫暫時無法連線，請稍後再試"
 
 
-pvc_janitor = PvcJanitor(PVC_JANITOR_INTERVAL_SECONDS, PVC_MAX_AGE_DAYS)
+def require_database() -> None:
+    if not db_bootstrap.ready:
+        raise HTTPException(status_code=503, detail="資料庫尚未就緒，請稍後再試")
 
 
-def _empty_usage() -> dict:
-    return {"cpu_cores": 0.0, "memory_gib": 0.0, "gpu": 0.0}
+async def get_ready_db():
+    """Request-scoped session like get_async_db; 503 until the bootstrap succeeded or while the DB is down.
 
+    Only a failure to get a connection (or one invalidated mid-request) maps
+    to 503; any other error raised by the handler propagates as a 500.
+    """
+    require_database()
+    async with async_session() as db:
+        try:
+            # Check a connection out up front, so connect failures are told apart from handler errors.
+            await db.run_sync(lambda session: session.connection())
+        except (OSError, DBAPIError) as exc:
+            # asyncpg reports an unreachable server as a bare OSError, which SQLAlchemy does not wrap.
+            _database_unreachable(exc)
+        try:
+            yield db
+        except DBAPIError as exc:
+            if not exc.connection_invalidated:
+                raise
+            _database_unreachable(exc)
+
+
+def get_ready_sync_db():
+    """get_ready_db on the sync engine, for handlers whose crud call is CPU-heavy.
+
+    On the asyncpg path run_sync() executes its function on the event loop, so
+    encoding large lists or pricing there would stall every other request;
+    these handlers call crud through run_in_threadpool with this session instead.
+    """
+    require_database()
+    db = SessionLocal()
+    try:
+        try:
+            db.connection()
+        except (OSError, DBAPIError) as exc:
+            _database_unreachable(exc)
+        try:
+            yield db
+        except DBAPIError as exc:
+            if not exc.connection_invalidated:
+                raise
+            _database_unreachable(exc)
+    finally:
+        db.close()
 
-def _require_root_privileges() -> None:
-    if hasattr(os, "geteuid"):
-        if os.geteuid() != 0:
-            raise HTTPException(status_code=500, detail="Portal backend 必須以 root 身分執行 add_node.sh / del_node.sh")
 
+def _database_unreachable(exc: Exception) -> None:
+    first_line = (str(exc).strip().splitlines() or [repr(exc)])[0]
+    print(f"[db] database unreachable: {first_line}", flush=True)
+    raise HTTPException(status_code=503, detail=DATABASE_UNAVAILABLE) from exc
 
-def _run_portal_script(script_name: str, answers: List[str]) -> schemas.ScriptExecutionResult:
+
+def _submit_script_job(
+    script_name: str, answers: List[str], target: str, params: dict, secrets: List[str]
+) -> schemas.ScriptJobRead:
+    require_database()
     script_path = ROOT_DIR / script_name
     if not script_path.exists():
         raise HTTPException(status_code=500, detail=f"找不到腳本 {script_path}")
     _require_root_privileges()
-    cleaned = [(value or "").replace("\n", "").strip() for value in answers]
-    input_data = "\n".join(cleaned) + "\n"
     try:
-        proc = subprocess.run(
-            ["bash", str(script_path)],
-            input=input_data,
-            text=True,
-            capture_output=True,
-            cwd=str(ROOT_DIR),
-            env=os.environ.copy(),
-        )
-    except OSError as exc:
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
-    hint = None
-    if proc.returncode != 0:
-        hint = _script_failure_hint(script_name, proc.stdout or "", proc.stderr or "")
-    return schemas.ScriptExecutionResult(
-        ok=proc.returncode == 0,
-        stdout=proc.stdout or "",
-        stderr=proc.stderr or "",
-        exit_code=proc.returncode,
-        hint=hint,
-    )
+        return script_jobs.submit(script_name, answers, target=target, params=params, secrets=secrets)
+    except JobConflict as exc:
+        raise HTTPException(status_code=409, detail=f"{target} 已有執行中的工作") from exc
 
 
-def _script_failure_hint(script_name: str, stdout: str, stderr: str) -> Optional[str]:
-    combined = f"{stdout}\n{stderr}".lower()
-    if "registered with dqlite" in combined:
-        return (
-            "MicroK8s 回報該節點仍註冊在 dqlite。"
-            "請先登入該節點執行 'sudo microk8s leave' 並清理 MicroK8s，"
-            "之後再重新刪除；若節點已無法登入，可勾選「強制移除」使用 --force"
-        )
-    if script_name == "del_node.sh" and "FailedMount" in stdout:
-        return (
-            "刪除前請確認節點上的 Pod/PVC 已清除；必要時可手動 cordon/drain 後再嘗試。"
-        )
-    return None
-
 def _canonical_username(raw: str) -> str:
     base = (raw or "").strip()
     if not base:
@@ -217,35 +185,30 @@ def _canonical_username(raw: str) -> str:
     return normalized or base
 
 
-def _usage_for_user(username: str) -> Tuple[bool, dict]:
+def _usage_for_user(username: str, fresh: bool = False) -> Tuple[bool, dict]:
+    """Requested resources of the user's running pods, from the shared pod snapshot.
+
+    Blocks on kubectl only when the snapshot is stale (or ``fresh`` is set);
+    otherwise it is a dictionary lookup.
+    """
+    if not _canonical_username(username):
+        return True, _empty_usage()
+    if fresh:
+        available = cluster_snapshot.refresh()
+    else:
+        available = cluster_snapshot.ensure_fresh()
+    return _snapshot_usage(username, available)
+
+
+def _snapshot_usage(username: str, available: bool) -> Tuple[bool, dict]:
+    """Like _usage_for_user, from the snapshot as it is: never refreshes, never blocks."""
     normalized = _canonical_username(username)
     if not normalized:
         return True, _empty_usage()
-    try:
-        payload = jhub.collect_usage_payload()
-    except jhub.PodActionError:
+    if not available:
         return False, _empty_usage()
-    for entry in payload.get("users", []) or []:
-        entry_name = _canonical_username(entry.get("user") or "")
-        if entry_name != normalized:
-            continue
-        cpu_millicores = entry.get("totalRequestedCpuMillicores") or 0.0
-        mem_mib = entry.get("totalRequestedMemoryMiB") or 0.0
-        gpu_requested = entry.get("gpuRequested") or 0.0
-        try:
-            cpu_val = float(cpu_millicores) / 1000.0
-        except (TypeError, ValueError):
-            cpu_val = 0.0
-        try:
-            mem_val = float(mem_mib) / 1024.0
-        except (TypeError, ValueError):
-            mem_val = 0.0
-        try:
-            gpu_val = float(gpu_requested)
-        except (TypeError, ValueError):
-            gpu_val = 0.0
-        return True, {"cpu_cores": cpu_val, "memory_gib": mem_val, "gpu": gpu_val}
-    return True, _empty_usage()
+    usage = cluster_snapshot.usage_for(normalized)
+    return True, {"cpu_cores": usage.cpu_cores, "memory_gib": usage.memory_gib, "gpu": usage.gpu}
 
 
 def _generate_placeholder_email(db: Session, username: str) -> str:
@@ -259,7 +222,15 @@ def _generate_placeholder_email(db: Session, username: str) -> str:
     return candidate
 
 
-def _ensure_portal_user(db: Session, username: str) -> models.User:
+def _cached_portal_user(username: str) -> Optional[schemas.UserRead]:
+    original = (username or "").strip()
+    if not original:
+        return None
+    canonical = _canonical_username(original)
+    return crud.cached_user(canonical) or (crud.cached_user(original) if canonical != original else None)
+
+
+def _ensure_portal_user(db: Session, username: str) -> schemas.UserRead:
     original = (username or "").strip()
     if not original:
         raise HTTPException(status_code=400, detail="Username is required")
@@ -269,7 +240,7 @@ def _ensure_portal_user(db: Session, username: str) -> models.User:
         # Backward compatibility: accept legacy, non-canonical usernames without creating duplicates
         existing = crud.get_user_by_username(db, original)
     if existing:
-        return existing
+        return crud.remember_user(existing)
     placeholder_email = _generate_placeholder_email(db, canonical)
     placeholder = schemas.UserCreate(
         username=canonical,
@@ -277,22 +248,37 @@ def _ensure_portal_user(db: Session, username: str) -> models.User:
         email=placeholder_email,
         department="auto-generated",
     )
-    return crud.create_user(db, placeholder)
+    return crud.remember_user(crud.create_user(db, placeholder))
 
 
 @app.get("/pvcs")
 def list_singleuser_pvcs():
-    """List singleuser PVCs with creation time and age."""
+    """List singleuser PVCs with creation time, age, owner and last use."""
     try:
-        items = jhub.list_singleuser_pvcs()
+        items = pvc_inventory.pvcs()
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
-    return {"items": items}
+    if not db_bootstrap.ready:
+        return {"items": items}
+    db = SessionLocal()
+    try:
+        usage = pvc_usage.usage_by_name(db)
+    finally:
+        db.close()
+    empty = dict.fromkeys(("first_seen_at", "last_used_at", "capacity_bytes", "used_bytes", "used_sampled_at"))
+    return {"items": [{**item, **empty, **usage.get(item["name"], {})} for item in items]}
 
 
 @app.post("/pvcs/cleanup")
-def cleanup_singleuser_pvcs(threshold_days: int = Query(PVC_MAX_AGE_DAYS, ge=1, le=365)):
-    result = pvc_janitor.cleanup_once(threshold_days)
+def cleanup_singleuser_pvcs(
+    threshold_days: int = Query(PVC_MAX_AGE_DAYS, ge=1, le=365),
+    dry_run: bool = Query(default=False, description="只回傳清理計畫，不執行"),
+):
+    require_database()
+    try:
+        result = pvc_janitor.cleanup_once(threshold_days, dry_run=dry_run)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
     return {"status": "ok", "threshold_days": threshold_days, **result}
 
 
@@ -302,24 +288,10 @@ def delete_singleuser_pvc(name: str):
         jhub.delete_pvc(name)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    pvc_inventory.invalidate()
     return {"status": "ok", "deleted": name}
 
 
-def require_dashboard_token(
-    authorization: str = Header(default=""),
-    x_dashboard_token: str = Header(default=""),
-):
-    token = jhub.DASHBOARD_TOKEN
-    if not token:
-        return
-    scheme, _, value = authorization.partition(" ")
-    if scheme.lower() == "bearer" and value.strip() == token:
-        return
-    if x_dashboard_token and x_dashboard_token.strip() == token:
-        return
-    raise HTTPException(status_code=401, detail="Invalid or missing dashboard token")
-
-
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     return templates.TemplateResponse(
@@ -336,21 +308,12 @@ def index(request: Request):
 
 @app.post(LOGIN_PROXY_PATH)
 async def proxy_login(request: Request):
-    if not LOGIN_PROXY_TARGET:
-        raise HTTPException(status_code=503, detail="登入服務尚未設定")
-    query_string = request.url.query
-    target_url = LOGIN_PROXY_TARGET
-    if query_string:
-        separator = '&' if '?' in target_url else '?'
-        target_url = f"{target_url}{separator}{query_string}"
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    body = await request.body()
-    async with httpx.AsyncClient(timeout=LOGIN_PROXY_TIMEOUT) as client:
-        upstream = await client.post(target_url, content=body, headers=headers)
-    excluded = {"content-length", "content-encoding", "transfer-encoding", "connection"}
-    response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in excluded}
-    return Response(content=upstream.content, status_code=upstream.status_code, headers=response_headers)
+    return await login_proxy.forward(request)
+
+
+@app.get("/login-proxy/stats")
+def login_proxy_stats(_: None = Depends(require_dashboard_token)):
+    return login_proxy.stats()
 
 
 def _parse_cpu_quantity(value: Optional[str]) -> float:
@@ -413,14 +376,28 @@ def _parse_gpu_quantity(value: Optional[str]) -> float:
         return 0.0
 
 
+def _machine_pod(pod: dict) -> schemas.MachinePod:
+    requests = pod.get("requests") or {}
+    return schemas.MachinePod(
+        name=pod.get("podName") or "",
+        user=pod.get("displayUser") or pod.get("user"),
+        phase=pod.get("phase"),
+        cpu=(requests.get("cpuMillicores") or 0.0) / 1000.0,
+        memory_gib=(requests.get("memoryMiB") or 0.0) / 1024.0,
+        gpu=_parse_gpu_quantity(requests.get("gpu")),
+    )
+
+
 def _collect_machine_status() -> List[schemas.MachineInfo]:
     try:
-        raw = jhub.run_kubectl(["get", "nodes", "-o", "json"])
-    except jhub.PodActionError as exc:
+        nodes = node_inventory.nodes()
+    except (jhub.PodActionError, ValueError, OSError) as exc:
         raise HTTPException(status_code=500, detail=f"無法取得節點資訊：{exc}")
-    data = json.loads(raw)
+    cluster_snapshot.ensure_fresh()
+    allocations = index_by_node(cluster_snapshot.pods())
+    snapshot_age = cluster_snapshot.age_seconds()
     machines: List[schemas.MachineInfo] = []
-    for item in data.get("items", []):
+    for item in nodes:
         metadata = item.get("metadata") or {}
         status = item.get("status") or {}
         node_info = status.get("nodeInfo") or {}
@@ -435,9 +412,14 @@ def _collect_machine_status() -> List[schemas.MachineInfo]:
         roles = metadata.get("labels", {}).get("kubernetes.io/role") or metadata.get("labels", {}).get("node-role.kubernetes.io/master")
         capacity = status.get("capacity") or {}
         allocatable = status.get("allocatable") or {}
+        name = metadata.get("name", "unknown")
+        allocation = allocations.get(name) or NodeAllocation()
+        allocatable_cpu = _parse_cpu_quantity(allocatable.get("cpu"))
+        allocatable_memory = _parse_memory_gib(allocatable.get("memory"))
+        allocatable_gpu = _parse_gpu_quantity(allocatable.get("nvidia.com/gpu"))
         machines.append(
             schemas.MachineInfo(
-                name=metadata.get("name", "unknown"),
+                name=name,
                 status=node_status,
                 ready=ready,
                 roles=roles,
@@ -447,16 +429,26 @@ def _collect_machine_status() -> List[schemas.MachineInfo]:
                 capacity_cpu=_parse_cpu_quantity(capacity.get("cpu")),
                 capacity_memory_gib=_parse_memory_gib(capacity.get("memory")),
                 capacity_gpu=_parse_gpu_quantity(capacity.get("nvidia.com/gpu")),
-                allocatable_cpu=_parse_cpu_quantity(allocatable.get("cpu")),
-                allocatable_memory_gib=_parse_memory_gib(allocatable.get("memory")),
-                allocatable_gpu=_parse_gpu_quantity(allocatable.get("nvidia.com/gpu")),
+                allocatable_cpu=allocatable_cpu,
+                allocatable_memory_gib=allocatable_memory,
+                allocatable_gpu=allocatable_gpu,
+                requested_cpu=allocation.cpu_cores,
+                requested_memory_gib=allocation.memory_gib,
+                requested_gpu=allocation.gpu,
+                used_cpu=allocation.used_cpu_cores if allocation.pods else 0.0,
+                used_memory_gib=allocation.used_memory_gib if allocation.pods else 0.0,
+                used_gpu=allocation.used_gpu if allocation.pods else 0.0,
+                free_cpu=max(0.0, allocatable_cpu - allocation.cpu_cores),
+                free_memory_gib=max(0.0, allocatable_memory - allocation.memory_gib),
+                free_gpu=max(0.0, allocatable_gpu - allocation.gpu),
+                pods=[_machine_pod(pod) for pod in allocation.pods],
+                snapshot_age_seconds=snapshot_age,
             )
         )
     return machines
 
 
-@app.post("/users", response_model=schemas.UserRead)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def _create_user(db: Session, user: schemas.UserCreate) -> models.User:
     canonical = _canonical_username(user.username)
     usernames_to_check = {canonical, user.username}
     existing = db.query(models.User).filter(models.User.username.in_(list(usernames_to_check))).first()
@@ -469,15 +461,27 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db, payload)
 
 
+@app.post("/users", response_model=schemas.UserRead)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_ready_db)):
+    return await db.run_sync(_create_user, user)
+
+
 @app.get("/users", response_model=List[schemas.UserRead])
-def list_users(db: Session = Depends(get_db)):
-    return crud.get_users(db)
+async def list_users(
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(default=None),
+    db: Session = Depends(get_ready_sync_db),
+):
+    if limit is None and after is None:
+        return json_response(await run_in_threadpool(crud.get_users_json, db))
+    try:
+        page = await run_in_threadpool(crud.get_users_page, db, limit=limit or DEFAULT_PAGE_SIZE, after=after)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return json_response(crud.USER_ROWS.encode(page.items), headers=page.headers())
 
 
-@app.get("/users/{username}/limits", response_model=schemas.UserLimitResponse)
-def user_limits(username: str, db: Session = Depends(get_db)):
-    user = _ensure_portal_user(db, username)
-    usage_available, usage_stats = _usage_for_user(user.username)
+def _limit_response(user: schemas.UserRead, usage_available: bool, usage_stats: dict) -> schemas.UserLimitResponse:
     usage = schemas.UserUsageStats(
         available=usage_available,
         cpu_cores=usage_stats["cpu_cores"],
@@ -494,12 +498,65 @@ def user_limits(username: str, db: Session = Depends(get_db)):
     )
 
 
+@app.get("/users/limits", response_model=schemas.UserLimitsBatch)
+async def users_limits(
+    names: str = Query(..., description="以逗號分隔的使用者名稱"),
+    db: AsyncSession = Depends(get_ready_db),
+):
+    """Limits and current usage of several users in one call; unknown names are listed in ``missing``, not created."""
+    requested: List[Tuple[str, str]] = []
+    seen = set()
+    for raw in names.split(","):
+        original = raw.strip()
+        canonical = _canonical_username(original)
+        if canonical and canonical not in seen:
+            seen.add(canonical)
+            requested.append((original, canonical))
+    if len(requested) > MAX_LIMITS_BATCH:
+        raise HTTPException(status_code=400, detail=f"一次最多查詢 {MAX_LIMITS_BATCH} 位使用者")
+    # Like /users/{username}/limits, legacy non-canonical usernames are found under the name as given.
+    lookup = {name for pair in requested for name in pair}
+    users = await db.run_sync(crud.get_users_by_usernames, sorted(lookup))
+    # One freshness check for the whole batch; a failed refresh reports usage unavailable for all.
+    available = cluster_snapshot.is_fresh() or await run_in_threadpool(cluster_snapshot.ensure_fresh)
+    by_name = {user.username: user for user in users}
+    items: List[schemas.UserLimitResponse] = []
+    missing: List[str] = []
+    for original, canonical in requested:
+        user = by_name.get(canonical) or by_name.get(original)
+        if user is None:
+            missing.append(original)
+        else:
+            items.append(_limit_response(user, *_snapshot_usage(user.username, available)))
+    return schemas.UserLimitsBatch(items=items, missing=missing)
+
+
+@app.get("/users/{username}/limits", response_model=schemas.UserLimitResponse)
+async def user_limits(
+    username: str,
+    fresh: bool = Query(default=False, description="先重新讀取 pod 清單再回傳用量"),
+    db: AsyncSession = Depends(get_ready_db),
+):
+    # Spawn checks hit this on every start; the common case is served without the database or kubectl.
+    user = _cached_portal_user(username) or await db.run_sync(_ensure_portal_user, username)
+    if not fresh and cluster_snapshot.is_fresh():
+        usage_available, usage_stats = _snapshot_usage(user.username, True)
+    else:
+        usage_available, usage_stats = await run_in_threadpool(_usage_for_user, user.username, fresh)
+    return _limit_response(user, usage_available, usage_stats)
+
+
+@app.get("/cache/stats")
+def cache_stats(_: None = Depends(require_dashboard_token)):
+    return cache.cache_stats()
+
+
 @app.get("/machines", response_model=List[schemas.MachineInfo])
 def list_machines(_: None = Depends(require_dashboard_token)):
     return _collect_machine_status()
 
 
-@app.post("/machines/add", response_model=schemas.ScriptExecutionResult)
+@app.post("/machines/add", response_model=schemas.ScriptJobRead, status_code=202)
 def add_machine(payload: schemas.MachineAddRequest):
     worker_ip = (payload.worker_ip or "").strip()
     if not worker_ip:
@@ -515,10 +572,11 @@ def add_machine(payload: schemas.MachineAddRequest):
         ssh_password,
         str(ssh_port),
     ]
-    return _run_portal_script("add_node.sh", answers)
+    params = {"worker_ip": worker_ip, "ssh_username": ssh_user, "ssh_port": ssh_port}
+    return _submit_script_job("add_node.sh", answers, worker_ip, params, [ssh_password])
 
 
-@app.post("/machines/delete", response_model=schemas.ScriptExecutionResult)
+@app.post("/machines/delete", response_model=schemas.ScriptJobRead, status_code=202)
 def delete_machine(payload: schemas.MachineDeleteRequest):
     node_name = (payload.node_name or "").strip()
     if not node_name:
@@ -528,6 +586,8 @@ def delete_machine(payload: schemas.MachineDeleteRequest):
         "y" if payload.drain else "n",
         "y" if payload.force_remove else "n",
     ]
+    params = {"node_name": node_name, "drain": payload.drain, "force_remove": payload.force_remove}
+    secrets: List[str] = []
     remote_cleanup = payload.remote_cleanup
     remote_enabled = remote_cleanup is not None
     answers.append("y" if remote_enabled else "n")
@@ -548,47 +608,215 @@ def delete_machine(payload: schemas.MachineDeleteRequest):
                 str(ssh_port),
             ]
         )
-    return _run_portal_script("del_node.sh", answers)
+        params["remote_cleanup"] = {"worker_ip": worker_ip, "ssh_username": ssh_user, "ssh_port": ssh_port}
+        secrets.append(ssh_password)
+    return _submit_script_job("del_node.sh", answers, node_name, params, secrets)
+
+
+@app.get("/machines/jobs", response_model=List[schemas.ScriptJobRead])
+def list_machine_jobs(
+    limit: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE),
+    _: None = Depends(require_dashboard_token),
+):
+    require_database()
+    return script_jobs.list_jobs(limit)
+
+
+@app.get("/machines/jobs/{job_id}", response_model=schemas.ScriptJobDetail)
+def get_machine_job(job_id: str, _: None = Depends(require_dashboard_token)):
+    require_database()
+    job = script_jobs.get_job(job_id, with_log=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到工作")
+    return job
+
+
+@app.get("/machines/jobs/{job_id}/events")
+async def stream_machine_job(
+    job_id: str,
+    after: int = Query(default=0, ge=0),
+    last_event_id: Optional[str] = Header(default=None),
+    _: None = Depends(require_dashboard_token),
+):
+    require_database()
+    if await run_in_threadpool(script_jobs.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="找不到工作")
+    # A reconnecting EventSource resumes after the last line it received.
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    return StreamingResponse(
+        script_jobs.events(job_id, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.patch("/users/{full_name}", response_model=schemas.UserRead)
-def update_user(full_name: str, payload: schemas.UserUpdate, db: Session = Depends(get_db)):
-    user = crud.update_user_by_full_name(db, full_name, payload)
+async def update_user(full_name: str, payload: schemas.UserUpdate, db: AsyncSession = Depends(get_ready_db)):
+    user = await db.run_sync(crud.update_user_by_full_name, full_name, payload)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
 @app.get("/sessions", response_model=List[schemas.ContainerSessionRead])
-def list_sessions(user_id: Optional[int] = Query(default=None), db: Session = Depends(get_db)):
-    return crud.get_sessions(db, user_id=user_id)
+async def list_sessions(
+    user_id: Optional[int] = Query(default=None),
+    username: Optional[str] = Query(default=None),
+    status: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="start_time >= start"),
+    end: Optional[datetime] = Query(default=None, description="start_time < end"),
+    gpu_only: bool = Query(default=False),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(default=None),
+    db: Session = Depends(get_ready_sync_db),
+):
+    filters = {
+        "user_id": user_id,
+        "username": _canonical_username(username) if username else None,
+        "status": status,
+        "start": start,
+        "end": end,
+        "gpu_only": gpu_only,
+    }
+    if limit is None and after is None:
+        return json_response(await run_in_threadpool(crud.get_sessions_json, db, **filters))
+    try:
+        page = await run_in_threadpool(
+            crud.get_sessions_page, db, limit=limit or DEFAULT_PAGE_SIZE, after=after, **filters
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return json_response(crud.SESSION_ROWS.encode(page.items), headers=page.headers())
+
+
+@app.get("/sessions/export")
+def export_sessions(
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    user_id: Optional[int] = Query(default=None),
+    username: Optional[str] = Query(default=None),
+    status: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="start_time >= start"),
+    end: Optional[datetime] = Query(default=None, description="start_time < end"),
+    gpu_only: bool = Query(default=False),
+    gzip: bool = Query(default=False),
+):
+    require_database()
+    filters = {
+        "user_id": user_id,
+        "username": _canonical_username(username) if username else None,
+        "status": status,
+        "start": start,
+        "end": end,
+        "gpu_only": gpu_only,
+    }
+    filename = exports.export_filename(format, gzip)
+    return StreamingResponse(
+        exports.stream_sessions(SessionLocal, format, filters, gzip=gzip),
+        media_type=exports.GZIP_MEDIA_TYPE if gzip else exports.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @app.post("/sessions", response_model=schemas.ContainerSessionRead)
-def create_session(payload: schemas.ContainerSessionCreate, db: Session = Depends(get_db)):
-    user = crud.get_user(db, payload.user_id)
+async def create_session(payload: schemas.ContainerSessionCreate, db: AsyncSession = Depends(get_ready_db)):
+    user = await db.run_sync(crud.get_user, payload.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return crud.create_container_session(db, payload)
+    try:
+        return await db.run_sync(crud.create_container_session, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @app.patch("/sessions/{session_id}", response_model=schemas.ContainerSessionRead)
-def update_session(session_id: int, payload: schemas.ContainerSessionUpdate, db: Session = Depends(get_db)):
-    session = crud.update_container_session(db, session_id, payload)
+async def update_session(
+    session_id: int, payload: schemas.ContainerSessionUpdate, db: AsyncSession = Depends(get_ready_db)
+):
+    try:
+        session = await db.run_sync(crud.update_container_session, session_id, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
 
 
-@app.get("/billing/summary", response_model=List[schemas.UsageSummary])
-def billing_summary(db: Session = Depends(get_db)):
-    return crud.get_usage_summary(db)
+@app.get(
+    "/billing/summary",
+    response_model=Union[List[schemas.UsageSummary], List[schemas.BillingWindowSummary]],
+)
+async def billing_summary(
+    start: Optional[datetime] = Query(default=None, description="區間起點（含）"),
+    end: Optional[datetime] = Query(default=None, description="區間終點（不含）"),
+    group_by: str = Query(default="user", pattern="^(user|department)$"),
+    breakdown: Optional[str] = Query(default=None, pattern="^month$"),
+    db: AsyncSession = Depends(get_ready_db),
+):
+    if start is None and end is None and breakdown is None:
+        return await db.run_sync(crud.get_usage_summary)
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="start 與 end 必須同時提供")
+    try:
+        return await db.run_sync(crud.get_billing_window, start, end, group_by=group_by, breakdown=breakdown)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/billing/costs", response_model=List[schemas.CostSummary])
+async def billing_costs(
+    start: datetime = Query(..., description="區間起點（含）"),
+    end: datetime = Query(..., description="區間終點（不含）"),
+    group_by: str = Query(default="user", pattern="^(user|department)$"),
+    breakdown: Optional[str] = Query(default=None, pattern="^month$"),
+    db: Session = Depends(get_ready_sync_db),
+):
+    try:
+        return await run_in_threadpool(crud.get_billing_costs, db, start, end, group_by=group_by, breakdown=breakdown)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.post("/billing/what-if", response_model=List[schemas.CostSummary])
+async def billing_what_if(payload: schemas.WhatIfRequest, db: Session = Depends(get_ready_sync_db)):
+    try:
+        return await run_in_threadpool(
+            crud.get_billing_costs,
+            db,
+            payload.start,
+            payload.end,
+            group_by=payload.group_by,
+            breakdown=payload.breakdown,
+            rate_cards=payload.rate_cards,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/rate-cards", response_model=List[schemas.RateCardRead])
+async def list_rate_cards(db: AsyncSession = Depends(get_ready_db)):
+    return await db.run_sync(crud.get_rate_cards)
+
+
+@app.post("/rate-cards", response_model=schemas.RateCardRead)
+async def create_rate_card(
+    payload: schemas.RateCardCreate,
+    db: AsyncSession = Depends(get_ready_db),
+    _: None = Depends(require_dashboard_token),
+):
+    try:
+        return await db.run_sync(crud.create_rate_card, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @app.get("/api/usage")
 def jhub_usage(_: None = Depends(require_dashboard_token)):
     try:
-        return jhub.collect_usage_payload()
+        collected_at = time.monotonic()
+        payload = jhub.collect_usage_payload()
+        cluster_snapshot.publish(payload.get("pods", []), taken_at=collected_at)
+        return payload
     except jhub.PodActionError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
@@ -622,27 +850,67 @@ def trigger_pod_report_sync(_: None = Depends(require_dashboard_token)):
 
 @app.get("/health")
 def healthcheck():
-    return {"status": "ok"}
+    """Liveness: always 200 while the process serves; "degraded" until the database is bootstrapped."""
+    return {"status": "ok" if db_bootstrap.ready else "degraded", "database": db_bootstrap.state()}
+
+
+@app.get("/health/ready")
+def readiness():
+    if not db_bootstrap.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "database": db_bootstrap.state()})
+    return {"status": "ready", "database": db_bootstrap.state()}
+
+
+@app.get("/health/startup")
+def startup_timings(_: None = Depends(require_dashboard_token)):
+    return {**startup_report.as_dict(), "database": db_bootstrap.state()}
+
+
+def _start_database_workers() -> None:
+    interrupted = script_jobs.recover()
+    if interrupted:
+        print(f"[script-jobs] marked {interrupted} interrupted job(s) as failed")
+    script_jobs.start()
+    workers = (recorder, pod_report_sync, outbox_relay, rollup_accruer, partition_maintainer, storage_accruer, pvc_janitor)
+    for worker in workers:
+        if worker:
+            worker.start()
+
+
+db_bootstrap.on_ready("database workers", _start_database_workers)
+startup_report.mark("imported")
 
 
 @app.on_event("startup")
-def on_startup():
-    if recorder:
-        recorder.start()
-    if pod_report_sync:
-        pod_report_sync.start()
-    if pvc_janitor:
-        pvc_janitor.start()
+async def on_startup():
+    with startup_report.phase("startup"):
+        cluster_snapshot.start()
+        await login_proxy.start()
+        db_bootstrap.start()
+    elapsed = startup_report.mark("serving")
+    print(f"[startup] serving after {elapsed:.2f}s; database bootstrap continues in the background", flush=True)
 
 
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
+    db_bootstrap.stop()
+    cluster_snapshot.stop()
     if recorder:
         recorder.stop()
     if pod_report_sync:
         pod_report_sync.stop()
+    if outbox_relay:
+        outbox_relay.stop()
+    if rollup_accruer:
+        rollup_accruer.stop()
+    if partition_maintainer:
+        partition_maintainer.stop()
+    if storage_accruer:
+        storage_accruer.stop()
     if pvc_janitor:
         pvc_janitor.stop()
+    script_jobs.shutdown()
+    await login_proxy.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""In-process latency histograms and gauges, exported in the Prometheus text format."""
+
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Seconds; tuned for HTTP handlers and upstream calls (1 ms .. 30 s).
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+Labels = Tuple[str, ...]
+
+# Every histogram and gauge registers here; render_prometheus() exports them all.
+REGISTRY: List["Metric"] = []
+
+
+class _Series:
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self, size: int):
+        # One slot per bucket plus the +Inf overflow.
+        self.counts = [0] * (size + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+
+class Histogram:
+    """Latency histogram keyed by a fixed tuple of label values; safe across threads."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[List["Metric"]] = REGISTRY,
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, _Series] = {}
+        if registry is not None:
+            registry.append(self)
+
+    def observe(self, seconds: float, *labels: str) -> None:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _Series(len(self.buckets))
+            series.counts[index] += 1
+            series.count += 1
+            series.total += seconds
+            series.maximum = max(series.maximum, seconds)
+
+    def _quantile(self, counts: List[int], total_count: int, maximum: float, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the max for the overflow bucket)."""
+        if not total_count:
+            return None
+        rank = q * total_count
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(self.buckets[index], maximum) if index < len(self.buckets) else maximum
+        return maximum
+
+    def snapshot(self) -> List[dict]:
+        """One summary per label set: count, mean, max and bucketed p50 / p95 / p99."""
+        with self._lock:
+            items = [
+                (labels, series.count, series.total, series.maximum, list(series.counts))
+                for labels, series in self._series.items()
+            ]
+        summaries = []
+        for labels, count, total, maximum, counts in sorted(items):
+            summaries.append(
+                {
+                    **dict(zip(self.label_names, labels)),
+                    "count": count,
+                    "mean_seconds": round(total / count, 6) if count else None,
+                    "max_seconds": round(maximum, 6),
+                    "p50_seconds": self._quantile(counts, count, maximum, 0.50),
+                    "p95_seconds": self._quantile(counts, count, maximum, 0.95),
+                    "p99_seconds": self._quantile(counts, count, maximum, 0.99),
+                }
+            )
+        return summaries
+
+    def prometheus_lines(self) -> List[str]:
+        """Text exposition format lines (HELP, TYPE, _bucket, _sum, _count)."""
+        lines = [f"# HELP {self.name} {self.description or self.name}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(
+                (labels, list(series.counts), series.count, series.total) for labels, series in self._series.items()
+            )
+        for labels, counts, count, total in items:
+            base = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(base + ['le="' + le + '"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(base)}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Gauge:
+    """Current value per label set, e.g. requests in flight; safe across threads."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        registry: Optional[List["Metric"]] = REGISTRY,
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+        if registry is not None:
+            registry.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [{**dict(zip(self.label_names, labels)), "value": value} for labels, value in items]
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description or self.name}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            base = [f'{name}="{_escape(label)}"' for name, label in zip(self.label_names, labels)]
+            suffix = f"{{{','.join(base)}}}" if base else ""
+            lines.append(f"{self.name}{suffix} {value:g}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Gauge):
+    """Monotonic count per label set, e.g. cache hits and misses."""
+
+    kind = "counter"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        raise TypeError(f"{self.name} is a counter and cannot be decremented")
+
+
+Metric = Union[Histogram, Gauge]
+
+
+def render_prometheus(registry: Sequence[Metric] = REGISTRY) -> str:
+    lines: List[str] = []
+    for metric in registry:
+        lines.extend(metric.prometheus_lines())
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
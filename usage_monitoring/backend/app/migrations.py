@@ -0,0 +1,306 @@
+"""Versioned, idempotent schema migrations for the Usage Portal database.
+
+Migrations run at service start, and can also be applied offline while the
+portal is stopped::
+
+    cd usage_monitoring/backend
+    python -m app.migrations upgrade   # apply pending migrations
+    python -m app.migrations status    # list applied / pending versions
+    python -m app.migrations explain   # show query plans of the hot-path queries
+"""
+
+import argparse
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models, partitions, pricing
+from .config import DEFAULT_CPU_LIMIT_CORES, DEFAULT_GPU_LIMIT, DEFAULT_MEMORY_LIMIT_GIB
+from .database import Base
+from .timeutils import naive_now_local
+
+# Arbitrary constant shared by every portal process so that concurrent upgrades serialize.
+_ADVISORY_LOCK_KEY = 7_204_118
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        if any(item.version == version for item in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version=version, description=description, upgrade=func))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return func
+
+    return register
+
+
+def _create_indexes(connection: Connection, table, names: Sequence[str]) -> None:
+    indexes = {index.name: index for index in table.indexes}
+    for name in names:
+        indexes[name].create(bind=connection, checkfirst=True)
+
+
+def _add_columns(connection: Connection, table: str, columns: Dict[str, str]) -> None:
+    """Add columns given as {name: type-and-constraints DDL} unless they already exist."""
+    if connection.dialect.name == "sqlite":
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()}
+        for column, ddl in columns.items():
+            if column not in existing:
+                connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        return
+    for column, ddl in columns.items():
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}")
+
+
+@migration(1, "per-user resource limit columns")
+def _user_limit_columns(connection: Connection) -> None:
+    _add_columns(
+        connection,
+        "users",
+        {
+            "cpu_limit_cores": f"INTEGER NOT NULL DEFAULT {DEFAULT_CPU_LIMIT_CORES}",
+            "memory_limit_gib": f"INTEGER NOT NULL DEFAULT {DEFAULT_MEMORY_LIMIT_GIB}",
+            "gpu_limit": f"INTEGER NOT NULL DEFAULT {DEFAULT_GPU_LIMIT}",
+        },
+    )
+
+
+@migration(2, "hot-path indexes for container_sessions and users")
+def _hot_path_indexes(connection: Connection) -> None:
+    _create_indexes(
+        connection,
+        models.ContainerSession.__table__,
+        [
+            "ix_container_sessions_open_container",
+            "ix_container_sessions_start",
+            "ix_container_sessions_user_start",
+            "ix_container_sessions_end_time",
+        ],
+    )
+    _create_indexes(connection, models.User.__table__, ["ix_users_created_at", "ix_users_full_name"])
+
+
+@migration(3, "usage rollup watermark, node and profile columns on container_sessions")
+def _usage_rollup_columns(connection: Connection) -> None:
+    _add_columns(
+        connection,
+        "container_sessions",
+        {
+            "node_name": "VARCHAR(128)",
+            "resource_profile": "VARCHAR(64)",
+            "accounted_until": "TIMESTAMP" if connection.dialect.name == "postgresql" else "DATETIME",
+        },
+    )
+    models.UsageRollupDaily.__table__.create(bind=connection, checkfirst=True)
+    _create_indexes(connection, models.ContainerSession.__table__, ["ix_container_sessions_unrolled"])
+
+
+@migration(4, "monthly range partitions for container_sessions")
+def _session_partitions(connection: Connection) -> None:
+    models.SessionPartition.__table__.create(bind=connection, checkfirst=True)
+    if connection.dialect.name == "postgresql":
+        # Also creates the monthly partitions and moves existing rows into them.
+        partitions.convert_to_partitioned(connection)
+    else:
+        partitions.ensure_partitions(connection)
+
+
+@migration(5, "effective-dated rate cards")
+def _rate_cards(connection: Connection) -> None:
+    table = models.RateCard.__table__
+    table.create(bind=connection, checkfirst=True)
+    if connection.execute(select(table.c.id).limit(1)).first() is None:
+        # Same prices as before rate cards existed: GPU_RATE_PER_HOUR per GPU, CPU and memory free.
+        connection.execute(
+            table.insert().values(
+                resource="gpu_hour",
+                gpu_model="",
+                price_per_hour=pricing.DEFAULT_GPU_RATE_PER_HOUR,
+                effective_from=pricing.DEFAULT_RATES_EFFECTIVE_FROM,
+                created_at=naive_now_local(),
+            )
+        )
+
+
+@migration(6, "script jobs and their output for the node scripts")
+def _script_jobs(connection: Connection) -> None:
+    models.ScriptJob.__table__.create(bind=connection, checkfirst=True)
+    models.ScriptJobLog.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(7, "pvc_usage: PVC last-used tracking")
+def _pvc_usage(connection: Connection) -> None:
+    models.PvcUsage.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(8, "PVC capacity / used bytes and storage GiB-hours in the usage rollup")
+def _pvc_storage(connection: Connection) -> None:
+    timestamp = "TIMESTAMP" if connection.dialect.name == "postgresql" else "DATETIME"
+    _add_columns(
+        connection,
+        "pvc_usage",
+        {
+            "capacity_bytes": "BIGINT",
+            "used_bytes": "BIGINT",
+            "sampled_at": timestamp,
+            "storage_accounted_until": timestamp,
+        },
+    )
+    _add_columns(connection, "usage_rollup_daily", {"storage_gib_hours": "FLOAT NOT NULL DEFAULT 0"})
+
+
+@migration(9, "department a session's rollup credit is filed under")
+def _accounted_department(connection: Connection) -> None:
+    # Left NULL on sessions accrued earlier; retract_session() falls back to the user's department for them.
+    _add_columns(connection, "container_sessions", {"accounted_department": "VARCHAR(128)"})
+
+
+@migration(10, "script job owners, heartbeats and one active job per target")
+def _script_job_owners(connection: Connection) -> None:
+    timestamp = "TIMESTAMP" if connection.dialect.name == "postgresql" else "DATETIME"
+    _add_columns(connection, "script_jobs", {"owner": "VARCHAR(255)", "heartbeat_at": timestamp})
+    # Submits used to race; keep the newest active job per target so the unique index can be built.
+    connection.exec_driver_sql(
+        "UPDATE script_jobs SET status = 'failed', error = 'Superseded by a concurrent job for the same target' "
+        "WHERE status IN ('queued', 'running') AND EXISTS ("
+        "SELECT 1 FROM script_jobs AS newer WHERE newer.target = script_jobs.target "
+        "AND newer.status IN ('queued', 'running') AND (newer.created_at > script_jobs.created_at "
+        "OR (newer.created_at = script_jobs.created_at AND newer.id > script_jobs.id)))"
+    )
+    _create_indexes(connection, models.ScriptJob.__table__, ["uq_script_jobs_active_target"])
+
+
+def _applied_versions(connection: Connection) -> Dict[int, object]:
+    table = models.SchemaMigration.__table__
+    rows = connection.execute(select(table.c.version, table.c.applied_at)).all()
+    return {row.version: row.applied_at for row in rows}
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Create missing tables, then apply pending migrations in order. Returns applied versions."""
+    Base.metadata.create_all(bind=engine)
+    applied_now: List[int] = []
+    with engine.connect() as lock_conn:
+        if engine.dialect.name == "postgresql":
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+        try:
+            with engine.connect() as connection:
+                applied = _applied_versions(connection)
+            for item in MIGRATIONS:
+                if item.version in applied:
+                    continue
+                # One transaction per migration: a failure leaves earlier versions recorded.
+                with engine.begin() as connection:
+                    item.upgrade(connection)
+                    connection.execute(
+                        models.SchemaMigration.__table__.insert().values(
+                            version=item.version,
+                            description=item.description,
+                            applied_at=naive_now_local(),
+                        )
+                    )
+                applied_now.append(item.version)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+                lock_conn.commit()
+    return applied_now
+
+
+def status(engine: Engine) -> List[dict]:
+    Base.metadata.create_all(bind=engine, tables=[models.SchemaMigration.__table__])
+    with engine.connect() as connection:
+        applied = _applied_versions(connection)
+    return [
+        {
+            "version": item.version,
+            "description": item.description,
+            "applied_at": applied.get(item.version),
+        }
+        for item in MIGRATIONS
+    ]
+
+
+def _hot_path_queries() -> Dict[str, object]:
+    sessions = models.ContainerSession
+    rollup = models.UsageRollupDaily
+    now = naive_now_local()
+    window_start = now - timedelta(days=30)
+    return {
+        "recorder: open session by container": select(sessions.id)
+        .where(sessions.container_name == "jupyter-example")
+        .where(sessions.end_time.is_(None)),
+        "recorder: all open sessions": select(sessions.id, sessions.container_name).where(
+            sessions.end_time.is_(None)
+        ),
+        "listing: newest sessions": select(sessions).order_by(sessions.start_time.desc(), sessions.id.desc()).limit(50),
+        "listing: newest sessions of one user": select(sessions)
+        .where(sessions.user_id == 1)
+        .order_by(sessions.start_time.desc(), sessions.id.desc())
+        .limit(50),
+        "billing: sessions overlapping a window": select(sessions.id)
+        .where(sessions.start_time < now)
+        .where(or_(sessions.end_time.is_(None), sessions.end_time > window_start)),
+        "rollup: sessions not yet accrued": select(sessions.id, sessions.user_id).where(
+            text(models.UNROLLED_SESSION_PREDICATE)
+        ),
+        "billing: rollup days in a window": select(rollup.user_id, rollup.cost).where(
+            rollup.day >= window_start.date()
+        ),
+        "janitor: idle PVCs": select(models.PvcUsage.name).where(models.PvcUsage.last_used_at < window_start),
+    }
+
+
+def explain(engine: Engine, queries: Optional[Dict[str, object]] = None) -> Dict[str, List[str]]:
+    """Return the planner output for each hot-path query.
+
+    Run it against a database of realistic size: on a near-empty table the
+    planner rightly prefers sequential scans.
+    """
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    plans: Dict[str, List[str]] = {}
+    with engine.connect() as connection:
+        for label, query in (queries or _hot_path_queries()).items():
+            compiled = query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+            rows = connection.exec_driver_sql(f"{prefix} {compiled}").fetchall()
+            plans[label] = [str(row[-1]) for row in rows]
+    return plans
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Usage Portal schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "explain"], nargs="?", default="upgrade")
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        applied = upgrade(engine)
+        print(f"[migrations] applied: {applied or 'none (up to date)'}")
+    elif args.command == "status":
+        for item in status(engine):
+            state = item["applied_at"] or "pending"
+            print(f"{item['version']:>4}  {item['description']:<56} {state}")
+    else:
+        for label, lines in explain(engine).items():
+            print(f"== {label}")
+            for line in lines:
+                print(f"   {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
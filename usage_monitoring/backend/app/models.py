@@ -1,13 +1,33 @@
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from .config import DEFAULT_CPU_LIMIT_CORES, DEFAULT_GPU_LIMIT, DEFAULT_MEMORY_LIMIT_GIB
 from .database import Base
 from .timeutils import naive_now_local
 
+UNROLLED_SESSION_PREDICATE = "end_time IS NULL OR accounted_until IS NULL OR accounted_until < end_time"
+
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_created_at", "created_at", "id"),
+        Index("ix_users_full_name", "full_name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(64), nullable=False, unique=True, index=True)
@@ -39,6 +59,25 @@ class User(Base):
 
 class ContainerSession(Base):
     __tablename__ = "container_sessions"
+    __table_args__ = (
+        # Recorder lookups and the close-finished scan only ever touch open sessions.
+        Index(
+            "ix_container_sessions_open_container",
+            "container_name",
+            postgresql_where=text("end_time IS NULL"),
+            sqlite_where=text("end_time IS NULL"),
+        ),
+        Index("ix_container_sessions_start", "start_time", "id"),
+        Index("ix_container_sessions_user_start", "user_id", "start_time", "id"),
+        Index("ix_container_sessions_end_time", "end_time"),
+        # Sessions whose time has not been folded into usage_rollup_daily yet.
+        Index(
+            "ix_container_sessions_unrolled",
+            "user_id",
+            postgresql_where=text(UNROLLED_SESSION_PREDICATE),
+            sqlite_where=text(UNROLLED_SESSION_PREDICATE),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -54,6 +93,12 @@ class ContainerSession(Base):
     actual_cpu_hours = Column(Float, default=0)
     actual_memory_mb_hours = Column(Float, default=0)
     notes = Column(Text, nullable=True)
+    node_name = Column(String(128), nullable=True)
+    resource_profile = Column(String(64), nullable=True)
+    # Watermark up to which this session's usage is included in usage_rollup_daily.
+    accounted_until = Column(DateTime, nullable=True)
+    # Department the rollup credit is filed under, fixed at the first accrual.
+    accounted_department = Column(String(128), nullable=True)
 
     user = relationship("User", back_populates="sessions")
 
@@ -61,3 +106,155 @@ class ContainerSession(Base):
     def usage_seconds(self) -> float:
         end = self.end_time or naive_now_local()
         return (end - self.start_time).total_seconds()
+
+
+class UsageRollupDaily(Base):
+    """Per-day usage totals, maintained incrementally from container_sessions."""
+
+    __tablename__ = "usage_rollup_daily"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "department",
+            "resource_profile",
+            "node_name",
+            "day",
+            name="uq_usage_rollup_daily_key",
+        ),
+        Index("ix_usage_rollup_daily_day", "day"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    department = Column(String(128), nullable=False, default="", server_default="")
+    resource_profile = Column(String(64), nullable=False, default="", server_default="")
+    node_name = Column(String(128), nullable=False, default="", server_default="")
+    day = Column(Date, nullable=False)
+    session_count = Column(Integer, nullable=False, default=0, server_default="0")
+    wall_hours = Column(Float, nullable=False, default=0, server_default="0")
+    cpu_core_hours = Column(Float, nullable=False, default=0, server_default="0")
+    memory_gib_hours = Column(Float, nullable=False, default=0, server_default="0")
+    gpu_hours = Column(Float, nullable=False, default=0, server_default="0")
+    cost = Column(Float, nullable=False, default=0, server_default="0")
+    # Only on rows with resource_profile "storage", accrued from the PVC samples.
+    storage_gib_hours = Column(Float, nullable=False, default=0, server_default="0")
+
+
+class RateCard(Base):
+    """Price per unit-hour of one resource, valid from ``effective_from`` until the next card."""
+
+    __tablename__ = "rate_cards"
+    __table_args__ = (
+        UniqueConstraint("resource", "gpu_model", "effective_from", name="uq_rate_cards_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # cpu_core_hour, memory_gib_hour or gpu_hour
+    resource = Column(String(32), nullable=False)
+    # GPU model the card applies to (e.g. "h100"); "" covers every model without its own card.
+    gpu_model = Column(String(64), nullable=False, default="", server_default="")
+    price_per_hour = Column(Float, nullable=False)
+    effective_from = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=naive_now_local, nullable=False)
+
+
+class SessionPartition(Base):
+    """One row per calendar month of container_sessions (a real partition on PostgreSQL)."""
+
+    __tablename__ = "session_partitions"
+
+    name = Column(String(64), primary_key=True)
+    range_start = Column(DateTime, nullable=False, unique=True)
+    range_end = Column(DateTime, nullable=False)
+    # Set once the month holds only closed, fully rolled-up sessions and has been compacted.
+    archived_at = Column(DateTime, nullable=True)
+    # Latest end_time in an archived month; lets billing windows skip it entirely.
+    max_end_time = Column(DateTime, nullable=True)
+
+
+class SyncOutbox(Base):
+    """Change records written in the same transaction as the rows they describe."""
+
+    __tablename__ = "sync_outbox"
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(32), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=naive_now_local, nullable=False)
+
+
+class ScriptJob(Base):
+    """One run of add_node.sh / del_node.sh. SSH credentials are never stored."""
+
+    __tablename__ = "script_jobs"
+    __table_args__ = (
+        Index("ix_script_jobs_created_at", "created_at"),
+        Index("ix_script_jobs_target_status", "target", "status"),
+        # At most one queued/running job per target, enforced by the database so concurrent submits cannot race.
+        Index(
+            "uq_script_jobs_active_target",
+            "target",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id = Column(String(32), primary_key=True)
+    script = Column(String(64), nullable=False)
+    # Worker IP or node name the script acts on.
+    target = Column(String(128), nullable=False)
+    # JSON of the non-secret request parameters.
+    params = Column(Text, nullable=True)
+    # queued, running, succeeded or failed
+    status = Column(String(16), nullable=False, default="queued")
+    exit_code = Column(Integer, nullable=True)
+    hint = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=naive_now_local, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # host:pid:nonce of the portal process running the job, refreshed every heartbeat while it is active.
+    owner = Column(String(255), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+class ScriptJobLog(Base):
+    """Output of a script job, one row per line in emission order."""
+
+    __tablename__ = "script_job_logs"
+
+    job_id = Column(String(32), ForeignKey("script_jobs.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    # stdout or stderr
+    stream = Column(String(8), nullable=False)
+    line = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=naive_now_local, nullable=False)
+
+
+class PvcUsage(Base):
+    """When each single-user PVC was last mounted, and by whom; replaces the last-used annotation."""
+
+    __tablename__ = "pvc_usage"
+    __table_args__ = (Index("ix_pvc_usage_last_used", "last_used_at"),)
+
+    name = Column(String(253), primary_key=True)
+    username = Column(String(64), nullable=False, default="", server_default="")
+    first_seen_at = Column(DateTime, default=naive_now_local, nullable=False)
+    last_used_at = Column(DateTime, nullable=False)
+    # last_used_at value most recently mirrored into the PVC annotation, if mirroring is on.
+    annotated_at = Column(DateTime, nullable=True)
+    capacity_bytes = Column(BigInteger, nullable=True)
+    # Latest kubelet sample; only mounted volumes report one, so it is carried while unmounted.
+    used_bytes = Column(BigInteger, nullable=True)
+    sampled_at = Column(DateTime, nullable=True)
+    # Watermark up to which this claim's storage is included in usage_rollup_daily.
+    storage_accounted_until = Column(DateTime, nullable=True)
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(256), nullable=False)
+    applied_at = Column(DateTime, default=naive_now_local, nullable=False)
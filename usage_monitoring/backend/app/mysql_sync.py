@@ -1,5 +1,7 @@
 """Background job that mirrors local container session records into MySQL jupyterhub.pod_report."""
 
+import importlib
+import importlib.util
 import os
 import threading
 import time
@@ -8,19 +10,26 @@ from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 from sqlalchemy.orm import Session
 
-from . import models
+from . import models, partitions
 from .timeutils import ensure_naive_local, naive_now_local
 
-try:  # pragma: no cover - optional dependency when sync is disabled
-    import mysql.connector
-    from mysql.connector import MySQLConnection
-except Exception:  # pragma: no cover - handled gracefully at runtime
-    mysql = None  # type: ignore[assignment]
-    MySQLConnection = None  # type: ignore[misc,assignment]
-
 SessionFactory = Callable[[], Session]
 
 
+def mysql_available() -> bool:
+    """Whether mysql-connector is installed, without paying for its import."""
+    try:
+        return importlib.util.find_spec("mysql.connector") is not None
+    except ImportError:  # pragma: no cover - "mysql" exists but is not a package
+        return False
+
+
+def _connect(conn_kwargs: Dict[str, object]):
+    # Imported on first use: the connector is optional and slow to import.
+    connector = importlib.import_module("mysql.connector")
+    return connector.connect(**conn_kwargs)
+
+
 class PodReportSync:
     """Periodically replaces jupyterhub.pod_report using local container session records."""
 
@@ -32,7 +41,7 @@ class PodReportSync:
         session_factory: SessionFactory,
         interval_seconds: int = 1800,
     ):
-        if mysql is None:  # pragma: no cover - defensive guard
+        if not mysql_available():  # pragma: no cover - defensive guard
             raise RuntimeError("mysql-connector 不存在，無法啟用 PodReportSync")
         if not callable(session_factory):
             raise ValueError("session_factory 必須可呼叫")
@@ -88,29 +97,48 @@ class PodReportSync:
             self._lock.release()
 
     def _sync_once(self) -> Dict[str, int]:
-        rows = self._session_rows()
-        self._replace_table(rows)
+        rows, horizon = self._session_rows()
+        self._replace_table(rows, horizon)
         return {"records": len(rows), "written": len(rows)}
 
-    def _session_rows(self) -> List[Tuple]:
+    def apply_session_changes(
+        self, changes: Sequence[Tuple[models.ContainerSession, models.User]]
+    ) -> None:
+        """Outbox sink: upsert only the changed sessions instead of rewriting the table."""
+        rows = self._latest_rows(changes)
+        if not rows:
+            return
+        with self._lock:
+            self._upsert_rows(rows)
+
+    def _session_rows(self) -> Tuple[List[Tuple], Optional[datetime]]:
+        """Rows for every session from the hot horizon on; archived months are already mirrored."""
         db: Session = self._session_factory()
-        rows_map: Dict[Tuple[str, str], Tuple[Tuple, datetime]] = {}
         try:
+            horizon = partitions.hot_horizon(db)
             query = (
                 db.query(models.ContainerSession, models.User)
                 .join(models.User, models.User.id == models.ContainerSession.user_id)
             )
-            for session_obj, user_obj in query.all():
-                result = self._session_to_row(session_obj, user_obj)
-                if not result:
-                    continue
-                row, start_time = result
-                key = (row[0], row[3])
-                current = rows_map.get(key)
-                if not current or start_time > current[1]:
-                    rows_map[key] = (row, start_time)
+            if horizon is not None:
+                query = query.filter(models.ContainerSession.start_time >= horizon)
+            return self._latest_rows(query.all()), horizon
         finally:
             db.close()
+
+    def _latest_rows(
+        self, pairs: Sequence[Tuple[models.ContainerSession, models.User]]
+    ) -> List[Tuple]:
+        rows_map: Dict[Tuple[str, str], Tuple[Tuple, datetime]] = {}
+        for session_obj, user_obj in pairs:
+            result = self._session_to_row(session_obj, user_obj)
+            if not result:
+                continue
+            row, start_time = result
+            key = (row[0], row[3])
+            current = rows_map.get(key)
+            if not current or start_time > current[1]:
+                rows_map[key] = (row, start_time)
         return [entry[0] for entry in rows_map.values()]
 
     def _session_to_row(
@@ -146,22 +174,62 @@ class PodReportSync:
         )
         return row, start_time
 
-    def _replace_table(self, rows: Sequence[Tuple]) -> None:
-        conn: MySQLConnection = mysql.connector.connect(**self.conn_kwargs)
+    def _insert_statement(self) -> str:
+        return f"""
+            INSERT INTO {self.table_name}
+            (user_id, user_name, namespace, pod_name, cpu_usage, memory_usage,
+             gpu_count, storage_request, live_time, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+
+    def _upsert_rows(self, rows: Sequence[Tuple]) -> None:
+        keys = [(row[0], row[3]) for row in rows]
+        conn = _connect(self.conn_kwargs)
         try:
             cursor = conn.cursor()
             try:
-                cursor.execute(f"DELETE FROM {self.table_name}")
-                if rows:
+                placeholders = ", ".join(["(%s, %s)"] * len(keys))
+                cursor.execute(
+                    f"SELECT user_id, pod_name, MAX(created_at) FROM {self.table_name} "
+                    f"WHERE (user_id, pod_name) IN ({placeholders}) GROUP BY user_id, pod_name",
+                    [value for key in keys for value in key],
+                )
+                existing = {(user_id, pod_name): created_at for user_id, pod_name, created_at in cursor.fetchall()}
+                # A change to an older session must not replace the row of a newer one for the same pod.
+                fresh = [
+                    row
+                    for row in rows
+                    if existing.get((row[0], row[3])) is None or existing[(row[0], row[3])] <= row[9]
+                ]
+                if fresh:
                     cursor.executemany(
-                        f"""
-                        INSERT INTO {self.table_name}
-                        (user_id, user_name, namespace, pod_name, cpu_usage, memory_usage,
-                         gpu_count, storage_request, live_time, created_at, updated_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        rows,
+                        f"DELETE FROM {self.table_name} WHERE user_id = %s AND pod_name = %s",
+                        [(row[0], row[3]) for row in fresh],
                     )
+                    cursor.executemany(self._insert_statement(), fresh)
+                conn.commit()
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _replace_table(self, rows: Sequence[Tuple], horizon: Optional[datetime] = None) -> None:
+        conn = _connect(self.conn_kwargs)
+        try:
+            cursor = conn.cursor()
+            try:
+                if horizon is None:
+                    cursor.execute(f"DELETE FROM {self.table_name}")
+                else:
+                    # Keep the mirrored rows of archived months; a pod that reappeared gets its newer row.
+                    cursor.execute(f"DELETE FROM {self.table_name} WHERE created_at >= %s", (horizon,))
+                    if rows:
+                        cursor.executemany(
+                            f"DELETE FROM {self.table_name} WHERE user_id = %s AND pod_name = %s",
+                            [(row[0], row[3]) for row in rows],
+                        )
+                if rows:
+                    cursor.executemany(self._insert_statement(), rows)
                 conn.commit()
             finally:
                 cursor.close()
@@ -186,7 +254,7 @@ def pod_report_sync_from_env(session_factory: Optional[SessionFactory] = None) -
     enabled = os.getenv("POD_REPORT_SYNC_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
     if not enabled:
         return None
-    if mysql is None:
+    if not mysql_available():
         print("[pod-report-sync] mysql-connector-python 未安裝，無法啟用")
         return None
     if session_factory is None:
@@ -0,0 +1,135 @@
+"""Transactional outbox that streams container session changes to downstream sinks."""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+SESSION_ENTITY = "container_session"
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+# Switched on by outbox_relay_from_env once a relay with at least one sink exists;
+# without one nothing would read the rows, so sessions are written without them.
+_enqueueing = False
+
+SessionFactory = Callable[[], Session]
+SessionChange = Tuple[models.ContainerSession, models.User]
+
+
+class OutboxSink(Protocol):
+    """Anything that can absorb a batch of changed sessions idempotently."""
+
+    def apply_session_changes(self, changes: Sequence[SessionChange]) -> None:
+        ...
+
+
+def enqueue_session_change(db: Session, session_obj: models.ContainerSession) -> None:
+    """Record that a session changed; the caller's commit makes it visible to the relay.
+
+    A no-op unless a relay with a sink was created.
+    """
+    if not _enqueueing:
+        return
+    if session_obj.id is None:
+        db.flush()
+    db.add(models.SyncOutbox(entity=SESSION_ENTITY, entity_id=session_obj.id))
+
+
+class OutboxRelay:
+    """Drains sync_outbox in batches and delivers compacted changes with at-least-once semantics."""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        sinks: Sequence[OutboxSink],
+        poll_seconds: float = 2.0,
+        batch_size: int = 500,
+    ):
+        self._session_factory = session_factory
+        self.sinks: List[OutboxSink] = list(sinks)
+        self.poll_seconds = max(0.5, float(poll_seconds))
+        self.batch_size = max(1, int(batch_size))
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                result = self.drain_once()
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[outbox] relay failed: {exc}")
+                result = {"records": 0}
+            # Keep draining without sleeping while a backlog remains.
+            if result["records"] < self.batch_size:
+                self._stop_event.wait(self.poll_seconds)
+
+    def drain_once(self) -> Dict[str, int]:
+        with self._lock:
+            return self._drain_batch()
+
+    def _drain_batch(self) -> Dict[str, int]:
+        db: Session = self._session_factory()
+        try:
+            records = (
+                db.query(models.SyncOutbox.id, models.SyncOutbox.entity_id)
+                .filter(models.SyncOutbox.entity == SESSION_ENTITY)
+                .order_by(models.SyncOutbox.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not records:
+                return {"records": 0, "delivered": 0}
+            # Several records for the same session collapse into one delivery of its latest state.
+            session_ids = sorted({record.entity_id for record in records})
+            changes: List[SessionChange] = (
+                db.query(models.ContainerSession, models.User)
+                .join(models.User, models.User.id == models.ContainerSession.user_id)
+                .filter(models.ContainerSession.id.in_(session_ids))
+                .all()
+            )
+            for sink in self.sinks:
+                sink.apply_session_changes(changes)
+            # Only acknowledge after every sink succeeded; a failure leaves the batch for retry.
+            db.query(models.SyncOutbox).filter(
+                models.SyncOutbox.id.in_([record.id for record in records])
+            ).delete(synchronize_session=False)
+            db.commit()
+            return {"records": len(records), "delivered": len(changes)}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def outbox_relay_from_env(
+    session_factory: SessionFactory, sinks: Sequence[OutboxSink]
+) -> Optional[OutboxRelay]:
+    """The relay, or None when the outbox is disabled or there is no sink to deliver to."""
+    global _enqueueing
+    if not OUTBOX_ENABLED or not sinks:
+        return None
+    _enqueueing = True
+    poll_seconds = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+    batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+    return OutboxRelay(
+        session_factory=session_factory,
+        sinks=sinks,
+        poll_seconds=poll_seconds,
+        batch_size=batch_size,
+    )
@@ -0,0 +1,58 @@
+"""Keyset (cursor) pagination helpers shared by the listing endpoints."""
+
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Generic, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Query, Session
+
+T = TypeVar("T")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_ESTIMATE_HEADER = "X-Total-Count-Estimate"
+
+
+@dataclass
+class Page(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    total_estimate: Optional[int] = None
+
+    def headers(self) -> dict:
+        headers = {}
+        if self.next_cursor:
+            headers[NEXT_CURSOR_HEADER] = self.next_cursor
+        if self.total_estimate is not None:
+            headers[TOTAL_ESTIMATE_HEADER] = str(self.total_estimate)
+        return headers
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_raw, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(sort_raw), int(row_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def estimate_count(db: Session, query: Query) -> int:
+    """Cheap row-count estimate: planner statistics on Postgres, COUNT(*) elsewhere."""
+    statement = query.order_by(None).limit(None).statement
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        compiled = statement.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+        rows = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}").scalar()
+        if isinstance(rows, str):
+            rows = json.loads(rows)
+        return int(rows[0]["Plan"]["Plan Rows"])
+    return int(db.execute(select(func.count()).select_from(statement.subquery())).scalar() or 0)
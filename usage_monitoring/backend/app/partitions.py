@@ -0,0 +1,322 @@
+"""Monthly partitioning and archival of container_sessions.
+
+On PostgreSQL container_sessions is range-partitioned by start_time, one
+partition per calendar month plus a DEFAULT catch-all. SQLite keeps a single
+table; the same month bookkeeping in session_partitions drives archival and
+the hot-horizon predicate, so callers behave identically on both.
+
+A month is archived once it is older than ARCHIVE_AFTER_MONTHS and holds only
+closed sessions that are fully folded into usage_rollup_daily. Archived
+partitions stay attached (history and exports still read them) but are
+rewritten compactly and excluded from hot-path queries.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import models
+from .timeutils import naive_now_local
+
+PARENT_TABLE = "container_sessions"
+DEFAULT_PARTITION = "container_sessions_default"
+PARTITIONS_AHEAD = int(os.getenv("SESSION_PARTITIONS_AHEAD", "2"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("SESSION_ARCHIVE_AFTER_MONTHS", "6"))
+# Optional tablespace (e.g. on a compressing filesystem) that archived partitions move to.
+ARCHIVE_TABLESPACE = os.getenv("SESSION_ARCHIVE_TABLESPACE", "").strip()
+_HORIZON_TTL_SECONDS = 60.0
+
+_partitions = models.SessionPartition.__table__
+_horizon_lock = threading.Lock()
+_horizon_cache = {"value": None, "expires": 0.0}
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(
+        connection.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+            ),
+            {"name": PARENT_TABLE},
+        ).scalar()
+    )
+
+
+def _create_month_partition(connection: Connection, month: datetime) -> None:
+    """Create and attach one monthly partition, first moving any rows parked in DEFAULT."""
+    name = partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE start_time >= :start AND start_time < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    lower = month.strftime("%Y-%m-%d %H:%M:%S")
+    upper = bounds["end"].strftime("%Y-%m-%d %H:%M:%S")
+    connection.exec_driver_sql(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    )
+
+
+def ensure_partitions(connection: Connection, now: Optional[datetime] = None) -> List[str]:
+    """Make sure every month from the oldest session up to PARTITIONS_AHEAD months ahead exists."""
+    now = now or naive_now_local()
+    oldest = connection.execute(select(func.min(models.ContainerSession.start_time))).scalar()
+    first = month_start(min(oldest, now) if oldest else now)
+    last = add_months(month_start(now), PARTITIONS_AHEAD)
+    known = {row[0] for row in connection.execute(select(_partitions.c.range_start)).all()}
+    partitioned = is_partitioned(connection)
+    created: List[str] = []
+    month = first
+    while month <= last:
+        if month not in known:
+            if partitioned:
+                _create_month_partition(connection, month)
+            connection.execute(
+                _partitions.insert().values(
+                    name=partition_name(month), range_start=month, range_end=add_months(month, 1)
+                )
+            )
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(connection: Connection) -> None:
+    """Rebuild a plain container_sessions table as a range-partitioned one (PostgreSQL only)."""
+    if connection.dialect.name != "postgresql" or is_partitioned(connection):
+        return
+    legacy = f"{PARENT_TABLE}_legacy"
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": PARENT_TABLE}).scalar()
+    connection.exec_driver_sql(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}")
+    # Free the constraint and index names for the new parent table.
+    for (constraint,) in connection.execute(
+        text("SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass)"), {"table": legacy}
+    ).all():
+        connection.exec_driver_sql(f'ALTER TABLE {legacy} DROP CONSTRAINT "{constraint}"')
+    for (index_name,) in connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy}
+    ).all():
+        connection.exec_driver_sql(f'DROP INDEX "{index_name}"')
+
+    # The partition key has to be part of the primary key; the ORM keeps identifying rows by id.
+    connection.exec_driver_sql(
+        f"CREATE TABLE {PARENT_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (start_time)"
+    )
+    connection.exec_driver_sql(
+        f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {PARENT_TABLE}_pkey PRIMARY KEY (id, start_time)"
+    )
+    connection.exec_driver_sql(
+        f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {PARENT_TABLE}_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+    )
+    connection.exec_driver_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+    for index in models.ContainerSession.__table__.indexes:
+        index.create(bind=connection)
+    connection.execute(_partitions.delete())
+    connection.exec_driver_sql(f"INSERT INTO {DEFAULT_PARTITION} SELECT * FROM {legacy}")
+    ensure_partitions(connection)
+    if sequence:
+        connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id")
+    connection.exec_driver_sql(f"DROP TABLE {legacy}")
+
+
+def _archivable(connection: Connection, range_start: datetime, range_end: datetime) -> bool:
+    sessions = models.ContainerSession
+    pending = connection.execute(
+        select(sessions.id)
+        .where(sessions.start_time >= range_start)
+        .where(sessions.start_time < range_end)
+        .where(text(f"({models.UNROLLED_SESSION_PREDICATE})"))
+        .limit(1)
+    ).first()
+    return pending is None
+
+
+def _compact(engine: Engine, name: str) -> None:
+    # VACUUM cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql(
+            f"ALTER TABLE {name} SET (fillfactor = 100, autovacuum_enabled = false, toast.autovacuum_enabled = false)"
+        )
+        if connection.dialect.server_version_info >= (14,):
+            try:
+                connection.exec_driver_sql(f"ALTER TABLE {name} ALTER COLUMN notes SET COMPRESSION lz4")
+            except DBAPIError:
+                pass  # server built without lz4: keep the default pglz TOAST compression
+        if ARCHIVE_TABLESPACE:
+            connection.exec_driver_sql(f'ALTER TABLE {name} SET TABLESPACE "{ARCHIVE_TABLESPACE}"')
+        connection.exec_driver_sql(f"VACUUM (FULL, ANALYZE) {name}")
+
+
+def archive_partitions(engine: Engine, now: Optional[datetime] = None) -> List[str]:
+    """Archive months older than ARCHIVE_AFTER_MONTHS that hold only closed, rolled-up sessions."""
+    if ARCHIVE_AFTER_MONTHS <= 0:
+        return []
+    now = now or naive_now_local()
+    cutoff = add_months(month_start(now), -ARCHIVE_AFTER_MONTHS)
+    with engine.connect() as connection:
+        candidates = connection.execute(
+            select(_partitions.c.name, _partitions.c.range_start, _partitions.c.range_end)
+            .where(_partitions.c.archived_at.is_(None))
+            .where(_partitions.c.range_end <= cutoff)
+            .order_by(_partitions.c.range_start)
+        ).all()
+        partitioned = is_partitioned(connection)
+    archived: List[str] = []
+    for candidate in candidates:
+        with engine.begin() as connection:
+            if not _archivable(connection, candidate.range_start, candidate.range_end):
+                continue
+            max_end = connection.execute(
+                select(func.max(models.ContainerSession.end_time))
+                .where(models.ContainerSession.start_time >= candidate.range_start)
+                .where(models.ContainerSession.start_time < candidate.range_end)
+            ).scalar()
+        if partitioned:
+            _compact(engine, candidate.name)
+        with engine.begin() as connection:
+            connection.execute(
+                _partitions.update()
+                .where(_partitions.c.name == candidate.name)
+                .values(archived_at=naive_now_local(), max_end_time=max_end or candidate.range_start)
+            )
+        archived.append(candidate.name)
+    if archived:
+        invalidate_horizon()
+    return archived
+
+
+def invalidate_horizon() -> None:
+    with _horizon_lock:
+        _horizon_cache["expires"] = 0.0
+
+
+def _leading_skippable_bound(db, keep_condition) -> Optional[datetime]:
+    """Start of the first month matching ``keep_condition`` when every earlier month can be skipped.
+
+    None means there is nothing to skip (or nothing known), i.e. no bound at all.
+    """
+    first_known, last_known = db.execute(
+        select(func.min(_partitions.c.range_start), func.max(_partitions.c.range_end))
+    ).one()
+    if first_known is None:
+        return None
+    first_kept = db.execute(select(func.min(_partitions.c.range_start)).where(keep_condition)).scalar()
+    if first_kept is None:
+        return last_known
+    if first_kept == first_known:
+        return None
+    return first_kept
+
+
+def _compute_horizon(db) -> Optional[datetime]:
+    return _leading_skippable_bound(db, _partitions.c.archived_at.is_(None))
+
+
+def hot_horizon(db: Session) -> Optional[datetime]:
+    """Lower start_time bound of every session that can still be open or change (None: no bound).
+
+    Archived months hold only closed sessions and reject writes, so open-session
+    lookups can add ``start_time >= hot_horizon`` and let PostgreSQL prune the
+    archived partitions. A stale cached value is only ever too early, which is still correct.
+    """
+    now = time.monotonic()
+    with _horizon_lock:
+        if _horizon_cache["expires"] > now:
+            return _horizon_cache["value"]
+    value = _compute_horizon(db)
+    with _horizon_lock:
+        _horizon_cache.update(value=value, expires=now + _HORIZON_TTL_SECONDS)
+    return value
+
+
+def billing_lower_bound(db: Session, window_start: datetime) -> Optional[datetime]:
+    """Earliest start_time a session overlapping a window that begins at ``window_start`` can have."""
+    return _leading_skippable_bound(
+        db,
+        _partitions.c.archived_at.is_(None) | (_partitions.c.max_end_time > window_start),
+    )
+
+
+def ensure_writable(db: Session, start_time: datetime) -> None:
+    """Sessions before the archive horizon are frozen; raise ValueError for writes to them."""
+    horizon = _compute_horizon(db)
+    if horizon is not None and start_time < horizon:
+        raise ValueError(f"sessions starting before {horizon:%Y-%m} are archived and can no longer be changed")
+
+
+class PartitionMaintainer:
+    """Creates upcoming monthly partitions and archives old ones on a schedule."""
+
+    def __init__(self, engine_factory: Callable[[], Engine], interval_seconds: int = 3600):
+        self._engine_factory = engine_factory
+        self.interval_seconds = max(60, interval_seconds)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="session-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def run_once(self) -> dict:
+        engine = self._engine_factory()
+        with engine.begin() as connection:
+            created = ensure_partitions(connection)
+        archived = archive_partitions(engine)
+        return {"created": created, "archived": archived}
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                result = self.run_once()
+                if result["created"] or result["archived"]:
+                    print(f"[partitions] created={result['created']} archived={result['archived']}")
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[partitions] maintenance failed: {exc}")
+            self._stop_event.wait(self.interval_seconds)
+
+
+def partition_maintainer_from_env(engine: Engine) -> Optional[PartitionMaintainer]:
+    enabled = os.getenv("SESSION_PARTITION_MAINTENANCE", "true").lower() in {"1", "true", "yes", "on"}
+    if not enabled:
+        return None
+    interval = int(os.getenv("SESSION_PARTITION_INTERVAL_SECONDS", "3600"))
+    return PartitionMaintainer(lambda: engine, interval_seconds=interval)
@@ -0,0 +1,293 @@
+"""Rate cards and the vectorized cost engine.
+
+Prices are effective-dated cards per resource: CPU core-hours, memory
+GiB-hours and GPU-hours (optionally per GPU model). A billing period loads the
+overlapping sessions once into NumPy arrays (a SessionFrame); pricing a frame
+is a handful of array operations per rate segment, so repricing tens of
+thousands of sessions under different cards costs milliseconds.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Float, cast, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import cache, models, partitions, rollup, schemas
+from .timeutils import ensure_naive_local, naive_now_local
+
+RESOURCES = ("cpu_core_hour", "memory_gib_hour", "gpu_hour")
+# Seeds the catch-all GPU card, which reproduces the former GPU_RATE_PER_HOUR * gpu_count pricing.
+DEFAULT_GPU_RATE_PER_HOUR = float(os.getenv("GPU_RATE_PER_HOUR", "4"))
+DEFAULT_RATES_EFFECTIVE_FROM = datetime(2000, 1, 1)
+
+_GIB_PER_MB = 1_000_000 / 1024 ** 3
+_EPOCH = np.datetime64("1970-01-01T00:00:00", "us")
+
+
+@dataclass(frozen=True)
+class Rate:
+    resource: str
+    gpu_model: str
+    price_per_hour: float
+    effective_from: datetime
+
+
+@dataclass
+class SessionFrame:
+    """Sessions overlapping one period, column-wise; times are epoch seconds clipped to the period."""
+
+    period_start: datetime
+    period_end: datetime
+    user_id: np.ndarray
+    username: np.ndarray
+    full_name: np.ndarray
+    department: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    cpu: np.ndarray
+    memory_gib: np.ndarray
+    gpu: np.ndarray
+    gpu_model_code: np.ndarray
+    gpu_models: List[str]
+
+    def __len__(self) -> int:
+        return len(self.user_id)
+
+    @property
+    def hours(self) -> np.ndarray:
+        return (self.end - self.start) / 3600.0
+
+
+def gpu_model(profile: Optional[str], gpu_count: int) -> str:
+    """GPU model of a spawner profile ("h100-2v" -> "h100"); "" for CPU-only sessions."""
+    if not gpu_count:
+        return ""
+    profile = profile or rollup.resource_profile(gpu_count)
+    return profile.rsplit("-", 1)[0] if "-" in profile else profile
+
+
+def _to_epoch(value: datetime) -> float:
+    return float((np.datetime64(value, "us") - _EPOCH).astype(np.int64)) / 1e6
+
+
+# Rate cards
+
+def load_rates(db: Session) -> List[Rate]:
+    hit, rates = cache.rate_card_cache.get("all")
+    if not hit:
+        cards = db.query(models.RateCard).order_by(models.RateCard.effective_from).all()
+        rates = [
+            Rate(card.resource, card.gpu_model or "", float(card.price_per_hour), card.effective_from)
+            for card in cards
+        ]
+        cache.rate_card_cache.set("all", rates)
+    return list(rates)
+
+
+def rates_from_payload(cards: Sequence[schemas.RateCardCreate]) -> List[Rate]:
+    return [
+        Rate(card.resource, card.gpu_model or "", float(card.price_per_hour), ensure_naive_local(card.effective_from))
+        for card in cards
+    ]
+
+
+def _schedule(rates: Sequence[Rate], resource: str, model: str = "") -> List[Tuple[float, float]]:
+    """(effective_from epoch, price) steps for one resource; a GPU model falls back to the catch-all cards."""
+    matching = [rate for rate in rates if rate.resource == resource and rate.gpu_model == model]
+    if not matching and model:
+        matching = [rate for rate in rates if rate.resource == resource and rate.gpu_model == ""]
+    return sorted((_to_epoch(rate.effective_from), rate.price_per_hour) for rate in matching)
+
+
+def hourly_rate(
+    rates: Sequence[Rate], cpu: float, memory_mb: float, gpu_count: int, profile: Optional[str], at: datetime
+) -> float:
+    """Price per hour of a session at one instant, e.g. for the cost_rate_per_hour snapshot on new rows."""
+    moment = _to_epoch(at)
+
+    def price(resource: str, model: str = "") -> float:
+        current = 0.0
+        for effective_from, value in _schedule(rates, resource, model):
+            if effective_from <= moment:
+                current = value
+        return current
+
+    return (
+        price("cpu_core_hour") * (cpu or 0)
+        + price("memory_gib_hour") * (memory_mb or 0) * _GIB_PER_MB
+        + price("gpu_hour", gpu_model(profile, gpu_count)) * (gpu_count or 0)
+    )
+
+
+# Session frames
+
+def load_frame(
+    db: Session, period_start: datetime, period_end: datetime, now: Optional[datetime] = None
+) -> SessionFrame:
+    """Fetch every session overlapping [period_start, period_end) in one query."""
+    now = now or naive_now_local()
+    sessions = models.ContainerSession
+    query = (
+        select(
+            sessions.user_id,
+            models.User.username,
+            models.User.full_name,
+            func.coalesce(models.User.department, ""),
+            # Epoch seconds computed by the database: converting datetimes in Python dominates otherwise.
+            cast(func.extract("epoch", sessions.start_time), Float),
+            cast(func.extract("epoch", func.coalesce(sessions.end_time, now)), Float),
+            sessions.requested_cpu,
+            sessions.requested_memory_mb,
+            sessions.requested_gpu,
+            func.coalesce(sessions.resource_profile, ""),
+        )
+        .join(models.User, models.User.id == sessions.user_id)
+        .where(sessions.start_time < period_end)
+        .where(or_(sessions.end_time.is_(None), sessions.end_time > period_start))
+    )
+    lower_bound = partitions.billing_lower_bound(db, period_start)
+    if lower_bound is not None:
+        query = query.where(sessions.start_time >= lower_bound)
+    rows = db.execute(query).all()
+    columns = list(zip(*rows)) if rows else [()] * 10
+    user_id, username, full_name, department, start, end, cpu, memory_mb, gpu, profile = columns
+
+    gpu_counts = np.array(gpu, dtype=np.float64)
+    profiles, profile_codes = np.unique(np.array(profile, dtype=object).astype(str), return_inverse=True)
+    # Models are resolved per distinct profile, not per row.
+    models_per_profile = [gpu_model(name, 1) if name else "" for name in profiles]
+    gpu_models = sorted(set(models_per_profile) | {""})
+    model_index = np.array([gpu_models.index(name) for name in models_per_profile], dtype=np.int64)
+    gpu_model_code = model_index[profile_codes] if len(profiles) else np.zeros(0, dtype=np.int64)
+    if len(gpu_counts):
+        # Sessions without a recorded profile still get the default model for their GPU count.
+        missing = (np.array(profile, dtype=object) == "") & (gpu_counts > 0)
+        if missing.any():
+            default_model = gpu_model(None, 1)
+            if default_model not in gpu_models:
+                gpu_models.append(default_model)
+            gpu_model_code = np.where(missing, gpu_models.index(default_model), gpu_model_code)
+
+    lower, upper = _to_epoch(period_start), _to_epoch(min(period_end, now))
+    return SessionFrame(
+        period_start=period_start,
+        period_end=period_end,
+        user_id=np.array(user_id, dtype=np.int64),
+        username=np.array(username, dtype=object),
+        full_name=np.array(full_name, dtype=object),
+        department=np.array(department, dtype=object),
+        start=np.maximum(np.array(start, dtype=np.float64), lower),
+        end=np.maximum(np.minimum(np.array(end, dtype=np.float64), upper), lower),
+        cpu=np.array(cpu, dtype=np.float64),
+        memory_gib=np.array(memory_mb, dtype=np.float64) * _GIB_PER_MB,
+        gpu=gpu_counts,
+        gpu_model_code=gpu_model_code.astype(np.int64),
+        gpu_models=gpu_models,
+    )
+
+
+def cached_frame(db: Session, period_start: datetime, period_end: datetime) -> SessionFrame:
+    """Frames of periods that ended are stable and kept; the current period is always reloaded."""
+    now = naive_now_local()
+    if period_end > now:
+        return load_frame(db, period_start, period_end, now)
+    key = (period_start, period_end)
+    hit, frame = cache.frame_cache.get(key)
+    if not hit:
+        frame = load_frame(db, period_start, period_end, now)
+        cache.frame_cache.set(key, frame)
+    return frame
+
+
+# Engine
+
+def _apply_schedule(start: np.ndarray, end: np.ndarray, schedule: List[Tuple[float, float]]) -> np.ndarray:
+    """Price per unit for each session: hours in every rate segment times that segment's price."""
+    cost = np.zeros(len(start), dtype=np.float64)
+    for index, (effective_from, price) in enumerate(schedule):
+        segment_end = schedule[index + 1][0] if index + 1 < len(schedule) else np.inf
+        hours = np.clip(np.minimum(end, segment_end) - np.maximum(start, effective_from), 0.0, None) / 3600.0
+        cost += hours * price
+    return cost
+
+
+def price_frame(frame: SessionFrame, rates: Sequence[Rate]) -> Dict[str, np.ndarray]:
+    """Per-session cost arrays (cpu_cost, memory_cost, gpu_cost) under the given cards."""
+    cpu_cost = _apply_schedule(frame.start, frame.end, _schedule(rates, "cpu_core_hour")) * frame.cpu
+    memory_cost = _apply_schedule(frame.start, frame.end, _schedule(rates, "memory_gib_hour")) * frame.memory_gib
+    gpu_cost = np.zeros(len(frame), dtype=np.float64)
+    for code, model in enumerate(frame.gpu_models):
+        mask = frame.gpu_model_code == code
+        if not mask.any():
+            continue
+        unit = _apply_schedule(frame.start[mask], frame.end[mask], _schedule(rates, "gpu_hour", model))
+        gpu_cost[mask] = unit * frame.gpu[mask]
+    return {"cpu_cost": cpu_cost, "memory_cost": memory_cost, "gpu_cost": gpu_cost}
+
+
+def summarize(frame: SessionFrame, costs: Dict[str, np.ndarray], group_by: str = "user") -> List[schemas.CostSummary]:
+    if not len(frame):
+        return []
+    keys = frame.user_id if group_by == "user" else frame.department.astype(str)
+    groups, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    hours = frame.hours
+
+    def total(weights: np.ndarray) -> np.ndarray:
+        return np.bincount(inverse, weights=weights, minlength=len(groups))
+
+    sessions = np.bincount(inverse, minlength=len(groups))
+    sums = {
+        "total_hours": total(hours),
+        "cpu_core_hours": total(hours * frame.cpu),
+        "memory_gib_hours": total(hours * frame.memory_gib),
+        "gpu_hours": total(hours * frame.gpu),
+        **{name: total(values) for name, values in costs.items()},
+    }
+    summaries = []
+    for index in range(len(groups)):
+        row = first[index]
+        values = {name: float(array[index]) for name, array in sums.items()}
+        summaries.append(
+            schemas.CostSummary(
+                period_start=frame.period_start,
+                period_end=frame.period_end,
+                user_id=int(frame.user_id[row]) if group_by == "user" else None,
+                username=frame.username[row] if group_by == "user" else None,
+                full_name=frame.full_name[row] if group_by == "user" else None,
+                department=None if group_by == "user" else str(groups[index]),
+                total_sessions=int(sessions[index]),
+                total_cost=values["cpu_cost"] + values["memory_cost"] + values["gpu_cost"],
+                **values,
+            )
+        )
+    order = (lambda item: item.username or "") if group_by == "user" else (lambda item: item.department or "")
+    return sorted(summaries, key=order)
+
+
+def period_costs(
+    db: Session,
+    period_start: datetime,
+    period_end: datetime,
+    group_by: str = "user",
+    rates: Optional[Sequence[Rate]] = None,
+) -> List[schemas.CostSummary]:
+    """Costs of one period; results under the stored cards are cached once the period has ended."""
+    if rates is not None:
+        frame = cached_frame(db, period_start, period_end)
+        return summarize(frame, price_frame(frame, rates), group_by)
+    key = (period_start, period_end, group_by)
+    finished = period_end <= naive_now_local()
+    if finished:
+        hit, result = cache.cost_cache.get(key)
+        if hit:
+            return list(result)
+    frame = cached_frame(db, period_start, period_end)
+    result = summarize(frame, price_frame(frame, load_rates(db)), group_by)
+    if finished:
+        cache.cost_cache.set(key, result)
+    return list(result)
+
@@ -0,0 +1,211 @@
+"""On-demand sampling profiler for the next N requests of one route.
+
+While an armed request is in flight, a daemon thread samples the Python stacks
+of every busy thread (``sys._current_frames``) at a fixed interval. Idle
+threads, those parked in a wait, a select or a queue read, are skipped, so the
+samples show the event loop and the threadpool workers doing the request's
+work. Time a request spends suspended on an ``await`` (asyncpg, httpx, a
+threadpool hand-off) runs on no thread, so the await chain of each profiled
+request's task is sampled as well, under an ``awaiting`` root. Other requests
+served at the same time land in the same thread stacks; profile under quiet
+traffic for a clean picture. Stacks are folded (``root;outer;...;inner
+count``), the input format of flamegraph.pl, speedscope and inferno.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+PROFILER_MAX_REQUESTS = 1000
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "120"))
+PROFILER_MAX_STACK_DEPTH = 128
+
+# (file name suffix, function) of frames where a thread sits idle.
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("runners.py", "run"),
+    ("socket.py", "accept"),
+}
+
+
+def _await_chain(task: "asyncio.Task") -> list:
+    """Frames of a suspended task, outermost first, following each coroutine's cr_await."""
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(labels) < PROFILER_MAX_STACK_DEPTH:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            labels.append(type(awaitable).__name__)
+            break
+        labels.append(_frame_label(frame.f_code))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return labels
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    marker = path.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        path = path[marker + len("site-packages") + 1 :]
+    else:
+        path = os.path.basename(path)
+    # ';' separates frames in the folded format; the count follows the last space.
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Profiles the next ``requests`` requests of (method, route); one profile at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.method: Optional[str] = None
+        self.route: Optional[str] = None
+        self.remaining = 0
+        self.requested = 0
+        self.completed = 0
+        self.interval_seconds = 0.005
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._active = 0
+        self._tasks: Dict[int, Tuple["asyncio.Task", asyncio.AbstractEventLoop]] = {}
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def arm(self, method: str, route: str, requests: int, interval_seconds: float) -> None:
+        self.disarm()
+        with self._lock:
+            self.method = method.upper()
+            self.route = route
+            self.remaining = max(1, min(requests, PROFILER_MAX_REQUESTS))
+            self.requested = self.remaining
+            self.completed = 0
+            self.interval_seconds = min(max(interval_seconds, 0.001), 0.1)
+            self.samples = 0
+            self.started_at = None
+            self.finished_at = None
+            self._active = 0
+            self._tasks = {}
+            self._stacks = Counter()
+
+    def disarm(self) -> None:
+        with self._lock:
+            self.remaining = 0
+            self._active = 0
+            self._tasks = {}
+            if self.started_at is not None and self.finished_at is None:
+                self.finished_at = time.time()
+        self._stop_sampler()
+
+    def claim(self, method: str, route: str) -> bool:
+        """Called from the request's task as it starts; True when this request is to be profiled."""
+        if not self.remaining or route != self.route or method != self.method:
+            return False
+        task = asyncio.current_task()
+        with self._lock:
+            if not self.remaining:
+                return False
+            self.remaining -= 1
+            self._active += 1
+            if task is not None:
+                self._tasks[id(task)] = (task, task.get_loop())
+            if self.started_at is None:
+                self.started_at = time.time()
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        return True
+
+    def release(self) -> None:
+        """Called from the claimed request's task when it finished."""
+        task = asyncio.current_task()
+        with self._lock:
+            if task is not None:
+                self._tasks.pop(id(task), None)
+            self._active = max(0, self._active - 1)
+            self.completed += 1
+            done = self._active == 0 and self.remaining == 0
+            if done:
+                self.finished_at = time.time()
+        if done:
+            # Runs on the event loop: signal the sampler rather than wait for it.
+            self._stop.set()
+
+    def _stop_sampler(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1)
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + PROFILER_MAX_SECONDS
+        while not self._stop.wait(self.interval_seconds):
+            if time.monotonic() > deadline:
+                print("[profiler] stopped after PROFILER_MAX_SECONDS", flush=True)
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            folded = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < PROFILER_MAX_STACK_DEPTH:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)).replace(";", ":"))
+                folded.append(";".join(reversed(labels)))
+            with self._lock:
+                tasks = list(self._tasks.values())
+            for task, loop in tasks:
+                # A running task's frames are already in its thread's stack.
+                if task.done() or asyncio.current_task(loop) is task:
+                    continue
+                chain = _await_chain(task)
+                if chain:
+                    folded.append(";".join(["awaiting"] + chain))
+            with self._lock:
+                self.samples += 1
+                self._stacks.update(folded)
+
+    def folded(self) -> str:
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            if not self.route:
+                state = "idle"
+            elif self.finished_at is not None:
+                state = "finished"
+            elif self.started_at is not None:
+                state = "running"
+            else:
+                state = "armed" if self.remaining else "cancelled"
+            return {
+                "state": state,
+                "method": self.method,
+                "route": self.route,
+                "requested": self.requested,
+                "remaining": self.remaining,
+                "completed": self.completed,
+                "in_flight": self._active,
+                "interval_ms": round(self.interval_seconds * 1000, 3),
+                "samples": self.samples,
+                "distinct_stacks": len(self._stacks),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
@@ -0,0 +1,284 @@
+"""Idle single-user PVC cleanup.
+
+A run reads the shared pod snapshot and the PVC inventory instead of listing
+pods itself, brings the pvc_usage table up to date (claims in use, new and
+vanished claims), and plans in one pass: delete the claims idle for longer
+than the threshold and, when the annotation mirror is on, refresh stale
+last-used annotations. Those kubectl calls then run through a bounded worker
+pool with a rate limit, so hundreds of claims take seconds instead of minutes
+without flooding the API server. ``dry_run`` returns the plan without
+executing it.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import jhub, pvc_usage
+from .database import SessionLocal
+from .snapshot import ClusterSnapshot, PvcInventory, claim_owners, cluster_snapshot, pvc_inventory
+from .timeutils import LOCAL_TZ, naive_now_local
+
+PVC_MAX_AGE_DAYS = int(os.getenv("PVC_MAX_AGE_DAYS", "7"))
+PVC_JANITOR_INTERVAL_SECONDS = int(os.getenv("PVC_JANITOR_INTERVAL_SECONDS", str(24 * 3600)))
+PVC_JANITOR_CONCURRENCY = int(os.getenv("PVC_JANITOR_CONCURRENCY", "8"))
+PVC_JANITOR_RATE_PER_SECOND = float(os.getenv("PVC_JANITOR_RATE_PER_SECOND", "10"))
+# 0 deletes every idle claim; otherwise the largest idle claims go first.
+PVC_JANITOR_MAX_DELETIONS = int(os.getenv("PVC_JANITOR_MAX_DELETIONS", "0"))
+
+ANNOTATE = "annotate"
+DELETE = "delete"
+
+SessionFactory = Callable[[], Session]
+
+
+@dataclass(frozen=True)
+class PvcAction:
+    name: str
+    action: str
+    # Naive UTC+8, as stored in pvc_usage.
+    last_used: Optional[datetime] = None
+    idle_days: Optional[float] = None
+    held_bytes: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        idle_days = None if self.idle_days is None else round(self.idle_days, 2)
+        last_used = None if self.last_used is None else self.last_used.isoformat(timespec="seconds")
+        return {
+            "name": self.name,
+            "action": self.action,
+            "last_used": last_used,
+            "idle_days": idle_days,
+            "held_bytes": self.held_bytes,
+        }
+
+
+class RateLimiter:
+    """Spaces ``acquire`` calls at least ``1 / rate_per_second`` apart across threads; 0 disables it."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def plan_cleanup(
+    listed: Set[str],
+    in_use: Set[str],
+    idle: List[Tuple[str, datetime, Optional[int]]],
+    mirror: List[Tuple[str, datetime]],
+    now: datetime,
+    max_deletions: int = 0,
+) -> List[PvcAction]:
+    """Deletions for idle claims that are listed and not mounted, then annotation refreshes for the rest.
+
+    ``idle`` comes largest first, so a ``max_deletions`` cap frees the most space.
+    """
+    plan: List[PvcAction] = []
+    deleting: Set[str] = set()
+    for name, last_used, held_bytes in idle:
+        if max_deletions and len(deleting) >= max_deletions:
+            break
+        if name in listed and name not in in_use:
+            idle_days = (now - last_used).total_seconds() / 86400.0
+            plan.append(PvcAction(name, DELETE, last_used, idle_days, held_bytes))
+            deleting.add(name)
+    for name, last_used in mirror:
+        if name in listed and name not in deleting:
+            plan.append(PvcAction(name, ANNOTATE, last_used))
+    return plan
+
+
+class PvcJanitor:
+    def __init__(
+        self,
+        interval_seconds: int = PVC_JANITOR_INTERVAL_SECONDS,
+        max_age_days: int = PVC_MAX_AGE_DAYS,
+        concurrency: int = PVC_JANITOR_CONCURRENCY,
+        rate_per_second: float = PVC_JANITOR_RATE_PER_SECOND,
+        max_deletions: int = PVC_JANITOR_MAX_DELETIONS,
+        session_factory: SessionFactory = SessionLocal,
+        snapshot: ClusterSnapshot = cluster_snapshot,
+        inventory: PvcInventory = pvc_inventory,
+    ):
+        self.interval_seconds = interval_seconds
+        self.max_age_days = max_age_days
+        self.concurrency = max(1, concurrency)
+        self.rate_per_second = rate_per_second
+        self.max_deletions = max(0, max_deletions)
+        self._session_factory = session_factory
+        self.snapshot = snapshot
+        self.inventory = inventory
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def plan(
+        self, max_age_days: Optional[int] = None, now: Optional[datetime] = None
+    ) -> Tuple[List[PvcAction], int]:
+        """Plan and number of PVCs scanned, after updating pvc_usage from fresh listings.
+
+        ``now`` is naive UTC+8 and must not be later than the listings. Raises
+        PodActionError when the pods cannot be listed: without them every claim
+        would look idle.
+        """
+        now = now or naive_now_local()
+        if not self.snapshot.refresh():
+            raise jhub.PodActionError(f"pod snapshot unavailable: {self.snapshot.last_error}")
+        self.inventory.invalidate()
+        pvcs = self.inventory.pvcs()
+        owners = claim_owners(self.snapshot.pods())
+        cutoff = now - timedelta(days=max_age_days or self.max_age_days)
+        db = self._session_factory()
+        try:
+            pvc_usage.mark_used(db, owners, now)
+            pvc_usage.reconcile(db, pvcs, now)
+            idle = pvc_usage.idle_claims(db, cutoff)
+            mirror = pvc_usage.mirror_due(db)
+            db.commit()
+        finally:
+            db.close()
+        listed = {pvc["name"] for pvc in pvcs if pvc.get("name")}
+        return plan_cleanup(listed, set(owners), idle, mirror, now, self.max_deletions), len(pvcs)
+
+    def cleanup_once(self, max_age_days: Optional[int] = None, dry_run: bool = False) -> dict:
+        """Delete singleuser PVCs that have been idle (not mounted by any Pod) for max_age_days.
+
+        Raises RuntimeError while another run is in progress.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("PVC cleanup is already running")
+        try:
+            return self._cleanup(max_age_days, dry_run)
+        finally:
+            self._run_lock.release()
+
+    def _cleanup(self, max_age_days: Optional[int], dry_run: bool) -> dict:
+        started = time.perf_counter()
+        now = naive_now_local()
+        try:
+            plan, scanned = self.plan(max_age_days, now)
+        except Exception as exc:  # pragma: no cover - defensive
+            return {"deleted": [], "errors": [str(exc)], "scanned": 0, "plan": [], "actions": [], "dry_run": dry_run}
+        result = {
+            "scanned": scanned,
+            "dry_run": dry_run,
+            "plan": [action.as_dict() for action in plan],
+            "planned": _count_actions(plan),
+        }
+        if dry_run:
+            return {**result, "deleted": [], "errors": [], "actions": [], "elapsed_seconds": _elapsed(started)}
+
+        actions = self.execute(plan)
+        deleted = [entry["name"] for entry in actions if entry["action"] == DELETE and entry["ok"]]
+        annotated = {
+            action.name: action.last_used
+            for action, entry in zip(plan, actions)
+            if action.action == ANNOTATE and entry["ok"]
+        }
+        self._record_results(deleted, annotated)
+        if deleted:
+            self.inventory.invalidate()
+        return {
+            **result,
+            "deleted": deleted,
+            "errors": [f"{entry['name']}: {entry['action']} failed: {entry['error']}" for entry in actions if not entry["ok"]],
+            "actions": actions,
+            "elapsed_seconds": _elapsed(started),
+        }
+
+    def _record_results(self, deleted: List[str], annotated: Dict[str, datetime]) -> None:
+        if not deleted and not annotated:
+            return
+        db = self._session_factory()
+        try:
+            pvc_usage.forget(db, deleted)
+            pvc_usage.mark_annotated(db, annotated)
+            db.commit()
+        finally:
+            db.close()
+
+    def execute(self, plan: List[PvcAction]) -> List[dict]:
+        """Run the planned kubectl calls; one timing entry per action, in plan order."""
+        if not plan:
+            return []
+        limiter = RateLimiter(self.rate_per_second)
+        workers = min(self.concurrency, len(plan))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pvc-janitor") as executor:
+            return list(executor.map(lambda action: self._run_action(action, limiter), plan))
+
+    def _run_action(self, action: PvcAction, limiter: RateLimiter) -> dict:
+        operation = _OPERATIONS[action.action]
+        limiter.acquire()
+        started = time.perf_counter()
+        error = None
+        try:
+            operation(action)
+        except Exception as exc:  # pragma: no cover - best effort, reported per action
+            error = str(exc)
+        return {
+            **action.as_dict(),
+            "ok": error is None,
+            "error": error,
+            "seconds": _elapsed(started),
+        }
+
+    def _run_loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                result = self.cleanup_once()
+            except RuntimeError:
+                continue
+            if result.get("deleted") or result.get("errors"):
+                summary = {key: result[key] for key in ("deleted", "errors", "scanned", "elapsed_seconds") if key in result}
+                print(f"[PVC Janitor] result={summary}", flush=True)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="pvc-janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+def _annotate(action: PvcAction) -> None:
+    jhub.touch_pvc_last_used(action.name, now=action.last_used.replace(tzinfo=LOCAL_TZ))
+
+
+def _delete(action: PvcAction) -> None:
+    jhub.delete_pvc(action.name)
+
+
+_OPERATIONS: Dict[str, Callable[[PvcAction], None]] = {ANNOTATE: _annotate, DELETE: _delete}
+
+
+def _count_actions(plan: List[PvcAction]) -> Dict[str, int]:
+    counts = {ANNOTATE: 0, DELETE: 0}
+    for action in plan:
+        counts[action.action] += 1
+    return counts
+
+
+def _elapsed(started: float) -> float:
+    return round(time.perf_counter() - started, 4)
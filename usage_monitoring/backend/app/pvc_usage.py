@@ -0,0 +1,194 @@
+"""Last-used bookkeeping of single-user PVCs in the pvc_usage table.
+
+The recorder marks the claims mounted by live pods as used with one bulk
+statement per sync, instead of patching a last-used annotation on every PVC
+through the API server. The janitor reconciles the table with the PVC listing
+(claims seen for the first time start their idle clock, deleted claims are
+dropped) and finds idle claims with one query on ``ix_pvc_usage_last_used``.
+The annotation survives only as an optional mirror, rewritten lazily.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+
+from . import jhub, models
+from .timeutils import ensure_naive_local
+
+# 0 disables the annotation mirror; otherwise the janitor rewrites an annotation
+# once the recorded last-used is this many seconds ahead of it.
+PVC_LAST_USED_MIRROR_SECONDS = float(os.getenv("PVC_LAST_USED_MIRROR_SECONDS", "0"))
+
+_TABLE = models.PvcUsage.__table__
+
+
+def _insert(db: Session, rows: List[dict], update_columns: Iterable[str] = ()) -> None:
+    """Insert rows keyed by name; existing rows get ``update_columns`` from the new row, or are kept."""
+    if not rows:
+        return
+    update_columns = list(update_columns)
+    dialect = db.get_bind().dialect.name
+    if dialect in {"postgresql", "sqlite"}:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(_TABLE).values(rows)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["name"], set_={name: stmt.excluded[name] for name in update_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["name"])
+        db.execute(stmt)
+        return
+
+    existing = set(db.execute(select(_TABLE.c.name).where(_TABLE.c.name.in_([row["name"] for row in rows]))).scalars())
+    for row in rows:
+        if row["name"] not in existing:
+            db.execute(_TABLE.insert().values(row))
+        elif update_columns:
+            db.execute(
+                _TABLE.update().where(_TABLE.c.name == row["name"]).values({name: row[name] for name in update_columns})
+            )
+
+
+def mark_used(db: Session, owners: Dict[str, str], now: datetime) -> int:
+    """Record the single-user claims in ``owners`` (claimName -> user) as used at ``now``."""
+    rows = [
+        {"name": name, "username": (user or "")[:64], "first_seen_at": now, "last_used_at": now}
+        for name, user in sorted(owners.items())
+        if name.startswith(jhub.SINGLEUSER_PVC_PREFIX)
+    ]
+    _insert(db, rows, update_columns=("username", "last_used_at"))
+    return len(rows)
+
+
+def _new_rows(pvcs: List[dict], known: Iterable[str], now: datetime) -> List[dict]:
+    """Rows for listed claims not in ``known``, starting at their legacy annotation or ``now``."""
+    known = set(known)
+    rows = []
+    for pvc in pvcs:
+        name = pvc.get("name")
+        if not name or name in known:
+            continue
+        annotations = pvc.get("annotations") or {}
+        annotated = ensure_naive_local(jhub.parse_rfc3339(annotations.get(jhub.PVC_LAST_USED_ANNOTATION)))
+        rows.append(
+            {
+                "name": name,
+                "username": (pvc.get("user") or "")[:64],
+                "first_seen_at": now,
+                "last_used_at": min(annotated, now) if annotated else now,
+                "annotated_at": annotated,
+            }
+        )
+    return rows
+
+
+def ensure_tracked(db: Session, pvcs: List[dict], now: datetime) -> int:
+    """Add rows for listed claims that have none yet; existing rows are left as they are."""
+    names = [pvc["name"] for pvc in pvcs if pvc.get("name")]
+    if not names:
+        return 0
+    known = db.execute(select(_TABLE.c.name).where(_TABLE.c.name.in_(names))).scalars()
+    rows = _new_rows(pvcs, known, now)
+    _insert(db, rows)
+    return len(rows)
+
+
+def reconcile(db: Session, pvcs: List[dict], now: datetime) -> Dict[str, int]:
+    """Align the table with a complete PVC listing taken after ``now``.
+
+    Claims without a row start at their legacy last-used annotation when they
+    carry one, otherwise at ``now``, so they are deleted only after staying
+    idle for the threshold from now on. Rows of claims no longer listed are
+    removed, unless the recorder added them after the listing was taken.
+    """
+    listed = {pvc["name"]: pvc for pvc in pvcs if pvc.get("name")}
+    known = dict(db.execute(select(_TABLE.c.name, _TABLE.c.username)).all())
+    rows = _new_rows(pvcs, known, now)
+    _insert(db, rows)
+    owners = [
+        {"b_name": name, "username": (pvc.get("user") or "")[:64]}
+        for name, pvc in listed.items()
+        if name in known and pvc.get("user") and not known[name]
+    ]
+    if owners:
+        db.execute(
+            _TABLE.update().where(_TABLE.c.name == bindparam("b_name")).values(username=bindparam("username")),
+            owners,
+        )
+    gone = [name for name in known if name not in listed]
+    removed = 0
+    if gone:
+        removed = db.execute(
+            _TABLE.delete().where(_TABLE.c.name.in_(gone)).where(_TABLE.c.first_seen_at < now)
+        ).rowcount
+    return {"inserted": len(rows), "removed": removed}
+
+
+def idle_claims(db: Session, cutoff: datetime) -> List[Tuple[str, datetime, Optional[int]]]:
+    """(name, last_used_at, bytes held) of claims unused since before ``cutoff``, largest first.
+
+    Bytes held are the last sampled used bytes, else the capacity; claims
+    of unknown size come last, longest idle first.
+    """
+    held = func.coalesce(_TABLE.c.used_bytes, _TABLE.c.capacity_bytes)
+    query = (
+        select(_TABLE.c.name, _TABLE.c.last_used_at, held.label("held_bytes"))
+        .where(_TABLE.c.last_used_at < cutoff)
+        .order_by(func.coalesce(held, -1).desc(), _TABLE.c.last_used_at)
+    )
+    return [(row.name, row.last_used_at, row.held_bytes) for row in db.execute(query)]
+
+
+def mirror_due(db: Session, min_lag_seconds: float = PVC_LAST_USED_MIRROR_SECONDS) -> List[Tuple[str, datetime]]:
+    """(name, last_used_at) of claims whose annotation lags the table by at least ``min_lag_seconds``."""
+    if min_lag_seconds <= 0:
+        return []
+    lag = timedelta(seconds=min_lag_seconds)
+    query = select(_TABLE.c.name, _TABLE.c.last_used_at, _TABLE.c.annotated_at).where(
+        (_TABLE.c.annotated_at.is_(None)) | (_TABLE.c.annotated_at < _TABLE.c.last_used_at)
+    )
+    return [
+        (row.name, row.last_used_at)
+        for row in db.execute(query)
+        if row.annotated_at is None or row.last_used_at - row.annotated_at >= lag
+    ]
+
+
+def mark_annotated(db: Session, values: Dict[str, datetime]) -> None:
+    """Remember the last-used value written into each claim's annotation."""
+    if not values:
+        return
+    db.execute(
+        _TABLE.update().where(_TABLE.c.name == bindparam("b_name")).values(annotated_at=bindparam("annotated_at")),
+        [{"b_name": name, "annotated_at": value} for name, value in values.items()],
+    )
+
+
+def forget(db: Session, names: Iterable[str]) -> None:
+    names = list(names)
+    if names:
+        db.execute(_TABLE.delete().where(_TABLE.c.name.in_(names)))
+
+
+def usage_by_name(db: Session) -> Dict[str, dict]:
+    """Owner, first and last use and the latest size sample of every tracked claim, for /pvcs."""
+    columns = ("username", "first_seen_at", "last_used_at", "capacity_bytes", "used_bytes", "sampled_at")
+    rows = db.execute(select(_TABLE.c.name, *(_TABLE.c[name] for name in columns)))
+    return {
+        row.name: {
+            "user": row.username,
+            "first_seen_at": row.first_seen_at,
+            "last_used_at": row.last_used_at,
+            "capacity_bytes": row.capacity_bytes,
+            "used_bytes": row.used_bytes,
+            "used_sampled_at": row.sampled_at,
+        }
+        for row in rows
+    }
@@ -0,0 +1,294 @@
+"""Incrementally maintained per-day usage rollup (usage_rollup_daily).
+
+Every container session carries a watermark, ``accounted_until``: usage before
+it is already folded into ``usage_rollup_daily``. The accruer advances the
+watermark of closed and running sessions in small locked chunks, so billing
+reads only the rollup plus the short unrolled tail of each session. A session's
+credit stays under the department it was first accrued with
+(``accounted_department``), so retracting it debits the same rows.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import models
+from .timeutils import naive_now_local
+
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+
+SessionFactory = Callable[[], Session]
+# (user_id, department, resource_profile, node_name, day)
+RollupKey = Tuple[int, str, str, str, date]
+MEASURES = (
+    "session_count",
+    "wall_hours",
+    "cpu_core_hours",
+    "memory_gib_hours",
+    "gpu_hours",
+    "cost",
+    "storage_gib_hours",
+)
+# Session columns the rollup credit is keyed on or computed from. Changing one on a
+# session that already has a watermark needs retract_session() first, so the
+# rollup rows it was credited to are the ones debited.
+CREDITED_FIELDS = frozenset(
+    {
+        "user_id",
+        "start_time",
+        "requested_cpu",
+        "requested_memory_mb",
+        "requested_gpu",
+        "cost_rate_per_hour",
+        "node_name",
+        "resource_profile",
+    }
+)
+# resource_profile of the rows holding PVC storage; they carry no session measures.
+STORAGE_PROFILE = "storage"
+
+# Parenthesized so it can be AND-ed with further filters.
+_UNROLLED = text(f"({models.UNROLLED_SESSION_PREDICATE})")
+_BYTES_PER_MB = 1_000_000
+_BYTES_PER_GIB = 1024 ** 3
+
+
+def resource_profile(gpu_count: int) -> str:
+    """Profile name as offered by the spawner (cpu-node, h100-1v, h100-2v, ...)."""
+    return f"h100-{gpu_count}v" if gpu_count else "cpu-node"
+
+
+def unrolled_sessions(db: Session):
+    """Sessions with usage not yet in the rollup; served by ix_container_sessions_unrolled."""
+    return db.query(models.ContainerSession).filter(_UNROLLED)
+
+
+def _split_by_day(start: datetime, end: datetime) -> Iterator[Tuple[date, float]]:
+    cursor = start
+    while cursor < end:
+        next_midnight = datetime.combine(cursor.date() + timedelta(days=1), time.min)
+        piece_end = min(end, next_midnight)
+        yield cursor.date(), (piece_end - cursor).total_seconds() / 3600.0
+        cursor = piece_end
+
+
+def _add_span(
+    totals: Dict[RollupKey, Dict[str, float]],
+    session: models.ContainerSession,
+    department: Optional[str],
+    start: datetime,
+    end: datetime,
+    count_session: bool,
+    sign: float = 1.0,
+) -> None:
+    profile = session.resource_profile or resource_profile(session.requested_gpu or 0)
+    prefix = (session.user_id, department or "", profile, session.node_name or "")
+    cpu = float(session.requested_cpu or 0)
+    memory_gib = float(session.requested_memory_mb or 0) * _BYTES_PER_MB / _BYTES_PER_GIB
+    gpu = float(session.requested_gpu or 0)
+    rate = float(session.cost_rate_per_hour or 0)
+    if count_session:
+        totals[prefix + (session.start_time.date(),)]["session_count"] += sign
+    for day, hours in _split_by_day(start, end):
+        bucket = totals[prefix + (day,)]
+        bucket["wall_hours"] += sign * hours
+        bucket["cpu_core_hours"] += sign * cpu * hours
+        bucket["memory_gib_hours"] += sign * memory_gib * hours
+        bucket["gpu_hours"] += sign * gpu * hours
+        bucket["cost"] += sign * rate * hours
+
+
+def _new_totals() -> Dict[RollupKey, Dict[str, float]]:
+    return defaultdict(lambda: dict.fromkeys(MEASURES, 0.0))
+
+
+def _upsert(db: Session, totals: Dict[RollupKey, Dict[str, float]]) -> None:
+    """Add the deltas onto usage_rollup_daily, creating missing rows."""
+    if not totals:
+        return
+    table = models.UsageRollupDaily.__table__
+    key_columns = ["user_id", "department", "resource_profile", "node_name", "day"]
+    rows = []
+    for key, values in totals.items():
+        row = dict(zip(key_columns, key))
+        row.update(values)
+        row["session_count"] = int(round(values["session_count"]))
+        rows.append(row)
+
+    dialect = db.get_bind().dialect.name
+    if dialect in {"postgresql", "sqlite"}:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: table.c[name] + stmt.excluded[name] for name in MEASURES},
+        )
+        db.execute(stmt)
+        return
+
+    for row in rows:
+        key_filter = [table.c[name] == row[name] for name in key_columns]
+        updated = db.execute(
+            table.update().where(*key_filter).values({name: table.c[name] + row[name] for name in MEASURES})
+        ).rowcount
+        if not updated:
+            db.execute(table.insert().values(row))
+
+
+def add_storage_hours(
+    db: Session, spans: Iterable[Tuple[int, Optional[str], float, datetime, datetime]]
+) -> None:
+    """Fold (user_id, department, GiB, start, end) storage spans into the rollup's storage rows."""
+    totals = _new_totals()
+    for user_id, department, gib, start, end in spans:
+        for day, hours in _split_by_day(start, end):
+            totals[(user_id, department or "", STORAGE_PROFILE, "", day)]["storage_gib_hours"] += gib * hours
+    _upsert(db, totals)
+
+
+def accrue(session_factory: SessionFactory, now: Optional[datetime] = None, chunk_size: int = 2000) -> Dict[str, int]:
+    """Fold usage up to ``now`` into the rollup and advance the session watermarks.
+
+    Each chunk commits on its own; rows locked by another accruer are skipped
+    and picked up by the next run, so concurrent portal workers never double count.
+    """
+    now = now or naive_now_local()
+    chunk_size = max(1, int(chunk_size))
+    last_id = 0
+    processed = 0
+    while True:
+        db: Session = session_factory()
+        try:
+            chunk: List[Tuple[models.ContainerSession, Optional[str]]] = (
+                db.query(models.ContainerSession, models.User.department)
+                .join(models.User, models.User.id == models.ContainerSession.user_id)
+                .filter(_UNROLLED)
+                .filter(models.ContainerSession.id > last_id)
+                .filter(models.ContainerSession.start_time <= now)
+                .order_by(models.ContainerSession.id)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True, of=models.ContainerSession)
+                .all()
+            )
+            if not chunk:
+                db.commit()
+                break
+            totals = _new_totals()
+            for session, department in chunk:
+                if session.accounted_department is None:
+                    session.accounted_department = department or ""
+                department = session.accounted_department
+                span_start = session.accounted_until or session.start_time
+                span_end = min(session.end_time, now) if session.end_time else now
+                if span_end > span_start:
+                    _add_span(totals, session, department, span_start, span_end, session.accounted_until is None)
+                    session.accounted_until = span_end
+                else:
+                    if session.accounted_until is None:
+                        _add_span(totals, session, department, span_start, span_start, True)
+                    session.accounted_until = max(span_start, span_end)
+            _upsert(db, totals)
+            last_id = chunk[-1][0].id
+            db.commit()
+            processed += len(chunk)
+            if len(chunk) < chunk_size:
+                break
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return {"sessions": processed}
+
+
+def needs_retraction(session: models.ContainerSession, changes: Dict[str, object]) -> bool:
+    """Whether applying ``changes`` would leave the session's rollup credit under other keys or amounts."""
+    if session.accounted_until is None:
+        return False
+    new_end = changes.get("end_time")
+    if new_end is not None and session.accounted_until > new_end:
+        return True
+    return any(name in CREDITED_FIELDS and getattr(session, name) != value for name, value in changes.items())
+
+
+def retract_session(db: Session, session: models.ContainerSession) -> None:
+    """Remove a session's accounted usage and reset its watermark, e.g. before its times are edited.
+
+    Call it with the session row locked and its old values still loaded; the
+    caller's commit makes the retraction atomic with the edit.
+    """
+    if session.accounted_until is None:
+        return
+    department = session.accounted_department
+    if department is None:
+        # Accrued before accounted_department existed: filed under the user's department of the time.
+        department = session.user.department if session.user else None
+    totals = _new_totals()
+    _add_span(totals, session, department, session.start_time, session.accounted_until, True, sign=-1.0)
+    _upsert(db, totals)
+    session.accounted_until = None
+    session.accounted_department = None
+
+
+def live_totals(db: Session, now: Optional[datetime] = None) -> Dict[int, Dict[str, float]]:
+    """Usage per user that is not in the rollup yet (open sessions and unaccrued tails)."""
+    now = now or naive_now_local()
+    per_user: Dict[int, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(MEASURES, 0.0))
+    for session in unrolled_sessions(db).all():
+        totals = _new_totals()
+        span_start = session.accounted_until or session.start_time
+        span_end = min(session.end_time, now) if session.end_time else now
+        # The live view never needs department/day keys, only per-user sums.
+        _add_span(totals, session, None, span_start, max(span_start, span_end), session.accounted_until is None)
+        target = per_user[session.user_id]
+        for values in totals.values():
+            for name in MEASURES:
+                target[name] += values[name]
+    return per_user
+
+
+class RollupAccruer:
+    """Periodically runs accrue() so the unrolled tail stays short."""
+
+    def __init__(self, session_factory: SessionFactory, interval_seconds: int = 60, chunk_size: int = 2000):
+        self._session_factory = session_factory
+        self.interval_seconds = max(5, interval_seconds)
+        self.chunk_size = chunk_size
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="usage-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                accrue(self._session_factory, chunk_size=self.chunk_size)
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[rollup] accrue failed: {exc}")
+            self._stop_event.wait(self.interval_seconds)
+
+
+def rollup_accruer_from_env(session_factory: SessionFactory) -> Optional[RollupAccruer]:
+    if not ROLLUP_ENABLED:
+        return None
+    interval = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+    chunk_size = int(os.getenv("ROLLUP_CHUNK_SIZE", "2000"))
+    return RollupAccruer(session_factory, interval_seconds=interval, chunk_size=chunk_size)
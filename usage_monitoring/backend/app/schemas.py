@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
@@ -77,6 +77,79 @@ class UsageSummary(BaseModel):
     total_sessions: int
     total_hours: float
     total_estimated_cost: float
+    total_storage_gib_hours: float = 0.0
+
+
+class BillingWindowSummary(BaseModel):
+    """Usage clipped to [period_start, period_end) for one user or department."""
+
+    period_start: datetime
+    period_end: datetime
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    department: Optional[str] = None
+    total_sessions: int
+    total_hours: float
+    cpu_core_hours: float
+    memory_gib_hours: float
+    gpu_hours: float
+    total_estimated_cost: float
+    # PVC storage, accounted per whole day.
+    storage_gib_hours: float = 0.0
+
+
+class RateCardCreate(BaseModel):
+    resource: Literal["cpu_core_hour", "memory_gib_hour", "gpu_hour"]
+    gpu_model: str = Field(default="", max_length=64)
+    price_per_hour: float = Field(..., ge=0)
+    effective_from: datetime
+
+
+class RateCardRead(RateCardCreate):
+    id: int
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CostSummary(BaseModel):
+    """Usage and its price under the rate cards for one user or department in [period_start, period_end)."""
+
+    period_start: datetime
+    period_end: datetime
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    department: Optional[str] = None
+    total_sessions: int
+    total_hours: float
+    cpu_core_hours: float
+    memory_gib_hours: float
+    gpu_hours: float
+    cpu_cost: float
+    memory_cost: float
+    gpu_cost: float
+    total_cost: float
+
+
+class WhatIfRequest(BaseModel):
+    """Reprice a window under hypothetical rate cards without storing them."""
+
+    start: datetime
+    end: datetime
+    group_by: Literal["user", "department"] = "user"
+    breakdown: Optional[Literal["month"]] = None
+    rate_cards: List[RateCardCreate]
+
+
+class MachinePod(BaseModel):
+    name: str
+    user: str | None = None
+    phase: str | None = None
+    cpu: float = 0.0
+    memory_gib: float = 0.0
+    gpu: float = 0.0
 
 
 class MachineInfo(BaseModel):
@@ -93,6 +166,19 @@ class MachineInfo(BaseModel):
     allocatable_cpu: float
     allocatable_memory_gib: float
     allocatable_gpu: float
+    # Requests of the single-user pods on the node, from the shared pod snapshot.
+    requested_cpu: float = 0.0
+    requested_memory_gib: float = 0.0
+    requested_gpu: float = 0.0
+    # Measured usage; None until metrics were collected for the node's pods.
+    used_cpu: float | None = None
+    used_memory_gib: float | None = None
+    used_gpu: float | None = None
+    free_cpu: float = 0.0
+    free_memory_gib: float = 0.0
+    free_gpu: float = 0.0
+    pods: List[MachinePod] = Field(default_factory=list)
+    snapshot_age_seconds: float | None = None
 
 
 class UserUsageStats(BaseModel):
@@ -111,6 +197,12 @@ class UserLimitResponse(BaseModel):
     usage: UserUsageStats
 
 
+class UserLimitsBatch(BaseModel):
+    items: List[UserLimitResponse]
+    # Requested names with no portal user, as given.
+    missing: List[str] = Field(default_factory=list)
+
+
 class MachineAddRequest(BaseModel):
     worker_ip: str
     ssh_username: str = "root"
@@ -132,9 +224,27 @@ class MachineDeleteRequest(BaseModel):
     remote_cleanup: Optional[MachineRemoteCleanup] = None
 
 
-class ScriptExecutionResult(BaseModel):
-    ok: bool
-    stdout: str
-    stderr: str
-    exit_code: int
+class ScriptJobRead(BaseModel):
+    id: str
+    script: str
+    target: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    ok: bool | None = None
+    params: dict = Field(default_factory=dict)
+    exit_code: int | None = None
     hint: str | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class ScriptJobLogLine(BaseModel):
+    seq: int
+    stream: Literal["stdout", "stderr"]
+    line: str
+    created_at: datetime
+
+
+class ScriptJobDetail(ScriptJobRead):
+    log: List[ScriptJobLogLine] = Field(default_factory=list)
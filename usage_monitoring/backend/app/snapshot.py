@@ -0,0 +1,337 @@
+"""Shared, periodically refreshed snapshot of the single-user pods.
+
+One ``kubectl get pods`` feeds every consumer that only needs pod specs
+(requests, node, phase): the spawn-time limits check reads a per-user index of
+requested CPU / memory / GPU from memory instead of running kubectl, kubectl
+top and nvidia-smi on every spawn. The auto-recorder and /api/usage publish
+their fuller collections into the same snapshot.
+
+The node inventory (``kubectl get nodes``) changes only when machines join or
+leave, so it is cached for a TTL and joined with the pod snapshot to give the
+per-node allocation view. The single-user PVC listing is cached the same way
+for the PVC janitor and ``/pvcs``.
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from . import jhub
+from .timeutils import LOCAL_TZ
+
+REFRESH_SECONDS = float(os.getenv("CLUSTER_SNAPSHOT_REFRESH_SECONDS", "5"))
+MAX_AGE_SECONDS = float(os.getenv("CLUSTER_SNAPSHOT_MAX_AGE_SECONDS", "15"))
+NODE_INVENTORY_TTL_SECONDS = float(os.getenv("NODE_INVENTORY_TTL_SECONDS", "60"))
+PVC_INVENTORY_TTL_SECONDS = float(os.getenv("PVC_INVENTORY_TTL_SECONDS", "60"))
+
+PodLoader = Callable[[], List[dict]]
+ListingLoader = Callable[[], List[dict]]
+NodeLoader = ListingLoader
+# Pods in other phases no longer hold their requests on the node.
+_ACTIVE_PHASES = {"Running", "Pending"}
+# Finished pods no longer count as using their volumes.
+_TERMINAL_PHASES = {"succeeded", "failed"}
+
+
+@dataclass(frozen=True)
+class UserRequests:
+    """Resources requested by all running pods of one user."""
+
+    cpu_cores: float = 0.0
+    memory_gib: float = 0.0
+    gpu: float = 0.0
+    pod_count: int = 0
+
+
+def user_key(username: str) -> str:
+    base = (username or "").strip()
+    return jhub._normalize_username_for_key(base) if base else ""
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def index_by_user(pods: List[dict]) -> Dict[str, UserRequests]:
+    totals: Dict[str, List[float]] = {}
+    for pod in pods:
+        requests = pod.get("requests") or {}
+        entry = totals.setdefault(user_key(pod.get("user") or "(unknown)"), [0.0, 0.0, 0.0, 0])
+        entry[0] += _as_float(requests.get("cpuMillicores")) / 1000.0
+        entry[1] += _as_float(requests.get("memoryMiB")) / 1024.0
+        entry[2] += _as_float(requests.get("gpu"))
+        entry[3] += 1
+    return {
+        key: UserRequests(cpu_cores=cpu, memory_gib=memory, gpu=gpu, pod_count=int(count))
+        for key, (cpu, memory, gpu, count) in totals.items()
+    }
+
+
+@dataclass
+class NodeAllocation:
+    """Single-user pods on one node: summed requests, measured usage where known, and the pods."""
+
+    cpu_cores: float = 0.0
+    memory_gib: float = 0.0
+    gpu: float = 0.0
+    used_cpu_cores: Optional[float] = None
+    used_memory_gib: Optional[float] = None
+    used_gpu: Optional[float] = None
+    pods: List[dict] = field(default_factory=list)
+
+
+def _add_used(current: Optional[float], value) -> Optional[float]:
+    if value is None:
+        return current
+    return (current or 0.0) + _as_float(value)
+
+
+def index_by_node(pods: List[dict]) -> Dict[str, NodeAllocation]:
+    nodes: Dict[str, NodeAllocation] = {}
+    for pod in pods:
+        node = pod.get("node")
+        if not node or pod.get("phase") not in _ACTIVE_PHASES:
+            continue
+        requests = pod.get("requests") or {}
+        usage = pod.get("usage") or {}
+        entry = nodes.setdefault(node, NodeAllocation())
+        entry.cpu_cores += _as_float(requests.get("cpuMillicores")) / 1000.0
+        entry.memory_gib += _as_float(requests.get("memoryMiB")) / 1024.0
+        entry.gpu += _as_float(requests.get("gpu"))
+        cpu_used = usage.get("cpuMillicores")
+        memory_used = usage.get("memoryMiB")
+        entry.used_cpu_cores = _add_used(entry.used_cpu_cores, None if cpu_used is None else cpu_used / 1000.0)
+        entry.used_memory_gib = _add_used(entry.used_memory_gib, None if memory_used is None else memory_used / 1024.0)
+        if cpu_used is not None:
+            # GPU usage is only collected together with the metrics (nvidia-smi in the pods).
+            entry.used_gpu = _add_used(entry.used_gpu, (pod.get("gpuUsage") or {}).get("deviceCount"))
+        entry.pods.append(pod)
+    return nodes
+
+
+def claim_owners(pods: List[dict]) -> Dict[str, str]:
+    """User of every PVC claimName referenced by a pod in the listing that has not finished."""
+    owners: Dict[str, str] = {}
+    for pod in pods:
+        if str(pod.get("phase") or "").lower() in _TERMINAL_PHASES:
+            continue
+        for claim in pod.get("claims") or []:
+            owners.setdefault(claim, pod.get("user") or "")
+    return owners
+
+
+def claims_in_use(pods: List[dict]) -> Set[str]:
+    """PVC claimNames referenced by any pod in the listing that has not finished."""
+    return set(claim_owners(pods))
+
+
+def _carry_usage(pods: List[dict], previous: List[dict]) -> List[dict]:
+    """Keep the last measured usage of pods listed without metrics (the plain refresh has none)."""
+    measured = {
+        pod.get("podName"): pod
+        for pod in previous
+        if (pod.get("usage") or {}).get("cpuMillicores") is not None
+    }
+    if not measured:
+        return list(pods)
+    merged = []
+    for pod in pods:
+        earlier = measured.get(pod.get("podName"))
+        if earlier is not None and (pod.get("usage") or {}).get("cpuMillicores") is None:
+            pod = {**pod, "usage": earlier.get("usage"), "gpuUsage": earlier.get("gpuUsage")}
+        merged.append(pod)
+    return merged
+
+
+class ClusterSnapshot:
+    """Latest pod listing plus the per-user request index, swapped atomically on every refresh.
+
+    Concurrent refreshes are coalesced: callers that wait on an in-flight
+    refresh reuse its result instead of running kubectl again.
+    """
+
+    def __init__(
+        self,
+        loader: PodLoader = jhub.list_singleuser_pods,
+        refresh_seconds: float = REFRESH_SECONDS,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+    ):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pods: List[dict] = []
+        self._by_user: Dict[str, UserRequests] = {}
+        self._taken_at: Optional[float] = None
+        self._refreshed_at = 0.0
+        self.updated_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, pods: List[dict], taken_at: Optional[float] = None) -> None:
+        """Install a pod listing taken at monotonic time ``taken_at``; older listings are ignored."""
+        taken_at = time.monotonic() if taken_at is None else taken_at
+        by_user = index_by_user(pods)
+        with self._lock:
+            if self._taken_at is not None and taken_at < self._taken_at:
+                return
+            self._pods = _carry_usage(pods, self._pods)
+            self._by_user = by_user
+            self._taken_at = taken_at
+            self.updated_at = datetime.now(LOCAL_TZ)
+            self.last_error = None
+
+    def refresh(self) -> bool:
+        """Reload the pods; returns False when kubectl failed."""
+        requested_at = time.monotonic()
+        with self._refresh_lock:
+            # A refresh that finished while we waited for the lock is recent enough to share.
+            if self._refreshed_at >= requested_at:
+                return self.last_error is None
+            started = time.monotonic()
+            try:
+                pods = self._loader()
+            except (jhub.PodActionError, ValueError, OSError) as exc:
+                with self._lock:
+                    self.last_error = str(exc)
+                return False
+            finally:
+                self._refreshed_at = time.monotonic()
+            self.publish(pods, taken_at=started)
+            return True
+
+    def age_seconds(self) -> Optional[float]:
+        with self._lock:
+            return None if self._taken_at is None else time.monotonic() - self._taken_at
+
+    def is_fresh(self, max_age_seconds: Optional[float] = None) -> bool:
+        age = self.age_seconds()
+        limit = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        return age is not None and age <= limit
+
+    def ensure_fresh(self, max_age_seconds: Optional[float] = None) -> bool:
+        """Refresh when older than the limit; True when a fresh enough snapshot is available."""
+        if self.is_fresh(max_age_seconds):
+            return True
+        self.refresh()
+        return self.is_fresh(max_age_seconds)
+
+    def pods(self) -> List[dict]:
+        with self._lock:
+            return list(self._pods)
+
+    def usage_for(self, username: str) -> UserRequests:
+        with self._lock:
+            return self._by_user.get(user_key(username), UserRequests())
+
+    def start(self) -> None:
+        if self.refresh_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="cluster-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                if not self.refresh():
+                    print(f"[cluster-snapshot] refresh failed: {self.last_error}")
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[cluster-snapshot] refresh failed: {exc}")
+            self._stop_event.wait(max(1.0, self.refresh_seconds))
+
+
+def _list_nodes() -> List[dict]:
+    return json.loads(jhub.run_kubectl(["get", "nodes", "-o", "json"])).get("items", [])
+
+
+class InventoryCache:
+    """A kubectl listing reused for ``ttl_seconds``.
+
+    Loads are serialized, so concurrent misses share one kubectl call. When a
+    reload fails the previous listing is served until the next attempt.
+    """
+
+    label = "inventory"
+
+    def __init__(self, loader: ListingLoader, ttl_seconds: float):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._items: Optional[List[dict]] = None
+        self._loaded_at: Optional[float] = None
+        self.updated_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def _expired(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    def items(self) -> List[dict]:
+        """Cached objects; raises PodActionError / ValueError / OSError only when nothing was ever loaded."""
+        with self._lock:
+            if self._items is not None and not self._expired():
+                return list(self._items)
+            try:
+                items = self._loader()
+            except (jhub.PodActionError, ValueError, OSError) as exc:
+                self.last_error = str(exc)
+                if self._items is None:
+                    raise
+                print(f"[{self.label}] reload failed, serving the previous listing: {exc}")
+                self._loaded_at = time.monotonic()
+                return list(self._items)
+            self._items = items
+            self._loaded_at = time.monotonic()
+            self.updated_at = datetime.now(LOCAL_TZ)
+            self.last_error = None
+            return list(items)
+
+    def invalidate(self) -> None:
+        """Force a reload on the next read, e.g. after a machine was added or removed."""
+        with self._lock:
+            self._loaded_at = None
+
+
+class NodeInventory(InventoryCache):
+    """Node objects from ``kubectl get nodes``."""
+
+    label = "node-inventory"
+
+    def __init__(self, loader: NodeLoader = _list_nodes, ttl_seconds: float = NODE_INVENTORY_TTL_SECONDS):
+        super().__init__(loader, ttl_seconds)
+
+    def nodes(self) -> List[dict]:
+        return self.items()
+
+
+class PvcInventory(InventoryCache):
+    """Single-user PVCs as returned by ``jhub.list_singleuser_pvcs``."""
+
+    label = "pvc-inventory"
+
+    def __init__(
+        self, loader: ListingLoader = jhub.list_singleuser_pvcs, ttl_seconds: float = PVC_INVENTORY_TTL_SECONDS
+    ):
+        super().__init__(loader, ttl_seconds)
+
+    def pvcs(self) -> List[dict]:
+        return self.items()
+
+
+cluster_snapshot = ClusterSnapshot()
+node_inventory = NodeInventory()
+pvc_inventory = PvcInventory()
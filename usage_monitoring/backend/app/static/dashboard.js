@@ -8,6 +8,7 @@
     sessions: 5,
     pods: 3,
   };
+  const SESSION_FETCH_SIZE = 50;
 
   const formatNumber = (value, digits = 1) => Number(value || 0).toFixed(digits);
   const formatMoney = (value) => `$${Number(value || 0).toFixed(2)}`;
@@ -28,7 +29,7 @@
     .replace(/</g, '&lt;')
     .replace(/>/g, '&gt;');
 
-  const fetchJSON = async (url, options = {}) => {
+  const authorizedFetch = async (url, options = {}) => {
     const headers = { 'Content-Type': 'application/json', ...(options.headers || {}) };
     const userToken = getAuthToken();
     if (userToken) {
@@ -44,10 +45,26 @@
       const text = await res.text().catch(() => '');
       throw new Error(text || res.statusText);
     }
+    return res;
+  };
+
+  const fetchJSON = async (url, options = {}) => {
+    const res = await authorizedFetch(url, options);
     if (res.status === 204) return null;
     return res.json();
   };
 
+  // Keyset-paginated listing: the cursor and row estimate travel in response headers.
+  const fetchPage = async (url) => {
+    const res = await authorizedFetch(url);
+    const estimate = res.headers.get('X-Total-Count-Estimate');
+    return {
+      items: await res.json(),
+      nextCursor: res.headers.get('X-Next-Cursor'),
+      totalEstimate: estimate === null ? null : Number(estimate),
+    };
+  };
+
   const App = {
     initialized: false,
     podInterval: null,
@@ -55,6 +72,10 @@
       users: [],
       summary: [],
       sessions: [],
+      sessionsUserId: null,
+      sessionsCursor: null,
+      sessionsTotal: 0,
+      sessionsLoading: false,
       pods: null,
       selectedUser: null,
       search: '',
@@ -68,6 +89,8 @@
       limitSaving: false,
       limitStatus: null,
       limitInfo: null,
+      // username -> /users/limits record of the users listed so far (null: none), filled a page at a time.
+      limitInfoByName: {},
       limitActiveField: null,
       limitActiveCaret: null,
       machines: [],
@@ -123,6 +146,9 @@
 
       this.limitStatusTimeout = null;
       this.limitInfoRequestId = 0;
+      this.limitBatchGeneration = 0;
+      this.limitBatchPending = new Set();
+      this.sessionsRequestId = 0;
       this.syncStatusTimeout = null;
 
       this.refs.tabs.addEventListener('click', (event) => {
@@ -301,36 +327,73 @@
         target.dataset.state = '';
       }
     },
-    formatScriptResult(result) {
-      if (!result) return '沒有輸出';
+    formatJobResult(job) {
+      if (!job) return '';
       const parts = [];
-      if (result.stdout && result.stdout.trim()) {
-        parts.push(result.stdout.trim());
+      if (typeof job.exit_code === 'number') {
+        parts.push(`(exit code: ${job.exit_code})`);
       }
-      if (result.stderr && result.stderr.trim()) {
-        parts.push(`--- stderr ---\n${result.stderr.trim()}`);
+      if (job.error) {
+        parts.push(`錯誤：${job.error}`);
       }
-      if (typeof result.exit_code === 'number') {
-        parts.push(`(exit code: ${result.exit_code})`);
+      if (job.hint) {
+        parts.push(`提示：${job.hint}`);
       }
-      if (result.hint) {
-        parts.push(`提示：${result.hint}`);
+      return parts.join('\n');
+    },
+    // Follows a script job over SSE; fetch is used instead of EventSource so the auth headers are sent.
+    async followJob(jobId, onLine) {
+      const res = await authorizedFetch(`/machines/jobs/${encodeURIComponent(jobId)}/events`, {
+        headers: { Accept: 'text/event-stream' },
+      });
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let done = null;
+      while (!done) {
+        const { value, done: finished } = await reader.read();
+        if (finished) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary >= 0) {
+          const frame = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
+          let event = 'message';
+          const data = [];
+          frame.split('\n').forEach((line) => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+          });
+          if (!data.length) continue;
+          const payload = JSON.parse(data.join('\n'));
+          if (event === 'line') onLine(payload);
+          else if (event === 'done') done = payload;
+        }
       }
-      return parts.filter(Boolean).join('\n') || '沒有輸出';
+      return done;
     },
     async runMachineCommand(url, payload, logTarget, button) {
       if (button) {
         button.disabled = true;
       }
-      this.setScriptLog(logTarget, '執行中…', '');
+      this.setScriptLog(logTarget, '排入佇列…', '');
       try {
-        const result = await fetchJSON(url, {
+        const job = await fetchJSON(url, {
           method: 'POST',
           body: JSON.stringify(payload),
         });
-        const text = this.formatScriptResult(result);
-        this.setScriptLog(logTarget, text, result.ok ? 'ok' : 'err');
-        if (result.ok) {
+        const lines = [];
+        const render = (state = '') => this.setScriptLog(logTarget, lines.join('\n') || '執行中…', state);
+        render();
+        const result = await this.followJob(job.id, (entry) => {
+          lines.push(entry.stream === 'stderr' ? `[stderr] ${entry.line}` : entry.line);
+          render();
+        });
+        const summary = this.formatJobResult(result);
+        if (summary) lines.push(summary);
+        render(result && result.ok ? 'ok' : 'err');
+        if (result && result.ok) {
           this.loadMachines();
         }
       } catch (err) {
@@ -469,22 +532,24 @@
     async loadAll() {
       this.setLoading(true);
       try {
-        const [users, summary, sessions, pods] = await Promise.all([
+        const [users, summary, pods] = await Promise.all([
           fetchJSON('/users'),
           fetchJSON('/billing/summary'),
-          fetchJSON('/sessions'),
           fetchJSON('/api/usage'),
         ]);
         this.state.users = users;
         this.state.summary = summary;
-        this.state.sessions = sessions.sort((a, b) => new Date(b.start_time) - new Date(a.start_time));
         this.state.pods = pods;
         const selectedExists = users.some((user) => user.id === this.state.selectedUser);
         if (!selectedExists) {
           this.state.selectedUser = users.length ? users[0].id : null;
         }
         this.state.limitInfo = null;
+        this.state.limitInfoByName = {};
+        this.limitBatchGeneration += 1;
+        this.limitBatchPending.clear();
         this.syncLimitDraft(true);
+        this.loadSessions(this.state.selectedUser, true);
         this.renderAll();
         if (this.state.selectedUser) {
           this.loadLimitInfo(this.state.selectedUser);
@@ -496,6 +561,40 @@
         this.setLoading(false);
       }
     },
+    async loadSessions(userId, reset = false) {
+      if (reset) {
+        this.sessionsRequestId += 1;
+        this.state.sessions = [];
+        this.state.sessionsCursor = null;
+        this.state.sessionsTotal = 0;
+        this.state.sessionsUserId = userId;
+        this.state.sessionsLoading = false;
+      } else if (this.state.sessionsLoading || !this.state.sessionsCursor) {
+        return;
+      }
+      if (!userId) return;
+      const requestId = this.sessionsRequestId;
+      const params = new URLSearchParams({ user_id: String(userId), limit: String(SESSION_FETCH_SIZE) });
+      if (this.state.sessionsCursor) {
+        params.set('after', this.state.sessionsCursor);
+      }
+      this.state.sessionsLoading = true;
+      try {
+        const page = await fetchPage(`/sessions?${params.toString()}`);
+        if (this.sessionsRequestId !== requestId) return;
+        this.state.sessions = this.state.sessions.concat(page.items);
+        this.state.sessionsCursor = page.nextCursor;
+        this.state.sessionsTotal = page.totalEstimate ?? this.state.sessions.length;
+      } catch (err) {
+        if (this.sessionsRequestId !== requestId) return;
+        console.error(err);
+      } finally {
+        if (this.sessionsRequestId === requestId) {
+          this.state.sessionsLoading = false;
+          this.renderUsage();
+        }
+      }
+    },
     async loadPods(silent = false) {
       try {
         const pods = await fetchJSON('/api/usage');
@@ -669,6 +768,10 @@
         .map((user) => {
           const metrics = this.metricsForUser(user.id);
           const active = Number(selectedUser) === user.id;
+          const limits = this.state.limitInfoByName[user.username];
+          const usageLine = limits && limits.usage && limits.usage.available
+            ? `<div>CPU ${formatNumber(limits.usage.cpu_cores, 1)} / ${limits.cpu_limit_cores} · GPU ${formatNumber(limits.usage.gpu, 0)} / ${limits.gpu_limit}</div>`
+            : '';
           return `
             <div class="user-card ${active ? 'active' : ''}" data-user="${user.id}">
               <div>
@@ -678,6 +781,7 @@
               <div class="meta">
                 <div>${metrics.sessions} Sessions</div>
                 <div>${formatNumber(metrics.hours, 1)} hrs · ${formatMoney(metrics.cost)}</div>
+                ${usageLine}
               </div>
             </div>
           `;
@@ -692,6 +796,40 @@
         this.state.pageUsers = page;
         this.renderUserList();
       });
+      this.loadPageLimits(usersPage.items);
+    },
+    async loadPageLimits(users) {
+      // One /users/limits call per page of users instead of one request per user.
+      const known = this.state.limitInfoByName;
+      const names = users
+        .map((user) => user.username)
+        .filter((name) => !(name in known) && !this.limitBatchPending.has(name));
+      if (!names.length) return;
+      const generation = this.limitBatchGeneration;
+      names.forEach((name) => this.limitBatchPending.add(name));
+      let batch = null;
+      try {
+        batch = await fetchJSON(`/users/limits?names=${encodeURIComponent(names.join(','))}`);
+      } catch (err) {
+        console.error(err);
+      } finally {
+        names.forEach((name) => this.limitBatchPending.delete(name));
+      }
+      if (generation !== this.limitBatchGeneration) return;
+      const target = this.state.limitInfoByName;
+      ((batch && batch.items) || []).forEach((info) => {
+        target[info.username] = info;
+      });
+      // Missing or failed names are remembered as null so re-rendering does not ask again.
+      names.forEach((name) => {
+        if (!(name in target)) target[name] = null;
+      });
+      const selected = this.selectedUser();
+      if (selected && !this.state.limitInfo && target[selected.username]) {
+        this.state.limitInfo = target[selected.username];
+        this.renderHeader();
+      }
+      this.renderUserList();
     },
     renderHeader() {
       const user = this.selectedUser();
@@ -818,13 +956,26 @@
         .join('');
 
       if (!sessions.length) {
-        this.refs.usageTable.innerHTML = '<p class="muted">尚無 session 記錄。</p>';
+        const message = this.state.sessionsLoading ? 'session 記錄載入中…' : '尚無 session 記錄。';
+        this.refs.usageTable.innerHTML = `<p class="muted">${message}</p>`;
         this.renderPager(this.refs.usagePagination, 1, 1, 0, () => {});
         return;
       }
-      const sessionsPage = this.paginate(sessions, this.state.pageSessions, PAGE_SIZES.sessions);
-      this.state.pageSessions = sessionsPage.page;
-      const rows = sessionsPage.items
+      // Only loaded pages are in memory; the server estimate sizes the pager for the rest.
+      const hasMore = Boolean(this.state.sessionsCursor);
+      const totalSessions = hasMore ? Math.max(this.state.sessionsTotal, sessions.length + 1) : sessions.length;
+      const totalPages = Math.max(1, Math.ceil(totalSessions / PAGE_SIZES.sessions));
+      const page = Math.min(Math.max(1, this.state.pageSessions), totalPages);
+      this.state.pageSessions = page;
+      const pageItems = sessions.slice((page - 1) * PAGE_SIZES.sessions, page * PAGE_SIZES.sessions);
+      if (hasMore && page * PAGE_SIZES.sessions >= sessions.length) {
+        this.loadSessions(user.id);
+      }
+      if (!pageItems.length) {
+        this.refs.usageTable.innerHTML = '<p class="muted">session 記錄載入中…</p>';
+        return;
+      }
+      const rows = pageItems
         .map((session) => {
           const stats = this.sessionStats(session);
           const badge = session.status === 'running'
@@ -866,8 +1017,8 @@
           </table>
         </div>
       `;
-      this.renderPager(this.refs.usagePagination, sessionsPage.page, sessionsPage.totalPages, sessions.length, (page) => {
-        this.state.pageSessions = page;
+      this.renderPager(this.refs.usagePagination, page, totalPages, totalSessions, (nextPage) => {
+        this.state.pageSessions = nextPage;
         this.renderUsage();
       });
     },
@@ -1020,9 +1171,18 @@
       const totalCpu = machines.reduce((acc, node) => acc + (node.allocatable_cpu || 0), 0);
       const totalMem = machines.reduce((acc, node) => acc + (node.allocatable_memory_gib || 0), 0);
       const totalGpu = machines.reduce((acc, node) => acc + (node.allocatable_gpu || 0), 0);
-      const requestedCpu = Object.values(usageByNode).reduce((acc, entry) => acc + (entry.cpuMillicores || 0), 0) / 1000;
-      const requestedMem = Object.values(usageByNode).reduce((acc, entry) => acc + (entry.memoryMiB || 0), 0) / 1024;
-      const requestedGpu = Object.values(usageByNode).reduce((acc, entry) => acc + (entry.gpu || 0), 0);
+      // /machines already joins each node with its pods; older backends only send capacity.
+      const hasAllocation = machines.some((node) => typeof node.requested_cpu === 'number');
+      const nodeRequests = (node) => {
+        if (hasAllocation) {
+          return { cpu: node.requested_cpu || 0, memory: node.requested_memory_gib || 0, gpu: node.requested_gpu || 0 };
+        }
+        const entry = usageByNode[node.name] || { cpuMillicores: 0, memoryMiB: 0, gpu: 0 };
+        return { cpu: (entry.cpuMillicores || 0) / 1000, memory: (entry.memoryMiB || 0) / 1024, gpu: entry.gpu || 0 };
+      };
+      const requestedCpu = machines.reduce((acc, node) => acc + nodeRequests(node).cpu, 0);
+      const requestedMem = machines.reduce((acc, node) => acc + nodeRequests(node).memory, 0);
+      const requestedGpu = machines.reduce((acc, node) => acc + nodeRequests(node).gpu, 0);
       if (machineSummary) {
         machineSummary.innerHTML = [
           { label: 'Ready 節點', value: `${readyCount} / ${machines.length}` },
@@ -1046,10 +1206,12 @@
           const sys = [node.os_image, node.kernel_version].filter(Boolean).join(' · ') || '—';
           const roleLabel = node.roles || 'worker';
           const status = node.status || (node.ready ? 'Ready' : 'NotReady');
-          const nodeUsage = usageByNode[node.name] || { cpuMillicores: 0, memoryMiB: 0, gpu: 0 };
-          const usedCpu = (nodeUsage.cpuMillicores || 0) / 1000;
-          const usedMem = (nodeUsage.memoryMiB || 0) / 1024;
-          const usedGpu = nodeUsage.gpu || 0;
+          const nodeUsage = nodeRequests(node);
+          const usedCpu = nodeUsage.cpu;
+          const usedMem = nodeUsage.memory;
+          const usedGpu = nodeUsage.gpu;
+          const freeGpu = hasAllocation ? `<br /><span class="muted">可用 ${formatAlloc(node.free_gpu, 0)} 顆</span>` : '';
+          const podCount = hasAllocation ? `<br /><span class="muted">${(node.pods || []).length} 個 pod</span>` : '';
           const totalCpuNode = node.capacity_cpu || 0;
           const totalMemNode = node.capacity_memory_gib || 0;
           const totalGpuNode = node.capacity_gpu || 0;
@@ -1057,12 +1219,12 @@
             <tr>
               <td>
                 <strong>${escapeAttr(node.name)}</strong><br />
-                <span class="muted">${escapeAttr(roleLabel)}</span>
+                <span class="muted">${escapeAttr(roleLabel)}</span>${podCount}
               </td>
               <td><span class="${badge}">${escapeAttr(status)}</span></td>
               <td>${formatAlloc(usedCpu, 2)} / ${formatAlloc(totalCpuNode, 2)}</td>
               <td>${formatAlloc(usedMem, 1)} / ${formatAlloc(totalMemNode, 1)}</td>
-              <td>${formatAlloc(usedGpu, 0)} / ${formatAlloc(totalGpuNode, 0)}</td>
+              <td>${formatAlloc(usedGpu, 0)} / ${formatAlloc(totalGpuNode, 0)}${freeGpu}</td>
               <td>${escapeAttr(sys)}</td>
             </tr>
           `;
@@ -1197,6 +1359,7 @@
       this.state.selectedUser = userId;
       this.clearPodSelection();
       this.state.pageSessions = 1;
+      this.loadSessions(userId, true);
       this.state.pagePods = 1;
       this.state.limitActiveField = null;
       this.state.limitActiveCaret = null;
@@ -1214,7 +1377,8 @@
         this.renderHeader();
         return;
       }
-      this.state.limitInfo = null;
+      // Show the page's batched record at once; the per-user call below refreshes it.
+      this.state.limitInfo = this.state.limitInfoByName[user.username] || null;
       this.renderHeader();
       this.limitInfoRequestId += 1;
       const requestId = this.limitInfoRequestId;
@@ -1224,7 +1388,9 @@
           return;
         }
         this.state.limitInfo = info;
+        this.state.limitInfoByName[info.username || user.username] = info;
         this.renderHeader();
+        this.renderUserList();
       } catch (err) {
         if (this.limitInfoRequestId !== requestId || this.state.selectedUser !== userId) {
           return;
@@ -1340,6 +1506,7 @@
           gpu_limit: String(updated.gpu_limit ?? ''),
         };
         this.setLimitStatus({ type: 'success', text: '已更新資源限制。' });
+        delete this.state.limitInfoByName[updated.username];
         this.loadLimitInfo(updated.id);
       } catch (err) {
         console.error(err);
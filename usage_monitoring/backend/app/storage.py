@@ -0,0 +1,249 @@
+"""PVC capacity and used-bytes collection, and storage GiB-hour accounting.
+
+Used bytes come from the kubelet stats summary of every node
+(``/api/v1/nodes/<node>/proxy/stats/summary`` through the API server), fetched
+concurrently and cached for a TTL. Only volumes mounted by a running pod show
+up there, so the latest sample is kept on the claim's pvc_usage row and
+carried forward while it is unmounted; claims never sampled count with their
+declared capacity.
+
+Every sample the accruer folds the storage held since the claim's watermark
+into the ``storage`` rows of usage_rollup_daily for the owning user, so
+billing picks storage up like any other rolled-up measure.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import DateTime, bindparam, func
+from sqlalchemy.orm import Session
+
+from . import jhub, models, pvc_usage, rollup
+from .snapshot import node_inventory, pvc_inventory
+from .timeutils import naive_now_local
+
+STORAGE_ACCOUNTING_ENABLED = os.getenv("STORAGE_ACCOUNTING_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+KUBELET_STATS_TTL_SECONDS = float(os.getenv("KUBELET_STATS_TTL_SECONDS", "60"))
+KUBELET_STATS_WORKERS = int(os.getenv("KUBELET_STATS_WORKERS", "8"))
+
+SessionFactory = Callable[[], Session]
+SummaryFetcher = Callable[[str], dict]
+_BYTES_PER_GIB = 1024 ** 3
+_BYTES_PER_MIB = 1024 ** 2
+
+
+@dataclass(frozen=True)
+class VolumeStats:
+    used_bytes: Optional[int]
+    capacity_bytes: Optional[int]
+
+
+def fetch_node_summary(node: str) -> dict:
+    return json.loads(jhub.run_kubectl(["get", "--raw", f"/api/v1/nodes/{node}/proxy/stats/summary"]))
+
+
+def parse_volume_stats(summary: dict, namespace: str = jhub.JHUB_NAMESPACE) -> Dict[str, VolumeStats]:
+    """PVC volume stats of one node's summary, keyed by claimName."""
+    volumes: Dict[str, VolumeStats] = {}
+    for pod in summary.get("pods") or []:
+        for volume in pod.get("volume") or []:
+            ref = volume.get("pvcRef") or {}
+            claim = ref.get("name")
+            if not claim or (ref.get("namespace") or namespace) != namespace:
+                continue
+            volumes[claim] = VolumeStats(volume.get("usedBytes"), volume.get("capacityBytes"))
+    return volumes
+
+
+def capacity_bytes(quantity: Optional[str]) -> Optional[int]:
+    mebibytes = jhub.parse_mem_to_mebibytes(quantity)
+    return None if mebibytes is None else int(mebibytes * _BYTES_PER_MIB)
+
+
+def _node_names() -> List[str]:
+    return [(item.get("metadata") or {}).get("name") for item in node_inventory.nodes() if item.get("metadata")]
+
+
+class VolumeStatsCollector:
+    """Per-claim volume stats from every node, reloaded at most once per ``ttl_seconds``.
+
+    Nodes are queried in parallel; a node that fails keeps its previous
+    volumes until it answers again.
+    """
+
+    def __init__(
+        self,
+        fetcher: SummaryFetcher = fetch_node_summary,
+        nodes: Callable[[], List[str]] = _node_names,
+        ttl_seconds: float = KUBELET_STATS_TTL_SECONDS,
+        workers: int = KUBELET_STATS_WORKERS,
+    ):
+        self._fetcher = fetcher
+        self._nodes = nodes
+        self.ttl_seconds = ttl_seconds
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._by_node: Dict[str, Dict[str, VolumeStats]] = {}
+        self._loaded_at: Optional[float] = None
+        self.errors: Dict[str, str] = {}
+
+    def _fetch(self, node: str):
+        try:
+            return node, parse_volume_stats(self._fetcher(node)), None
+        except (jhub.PodActionError, ValueError, OSError) as exc:
+            return node, None, str(exc)
+
+    def stats(self) -> Dict[str, VolumeStats]:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+                self._reload()
+            merged: Dict[str, VolumeStats] = {}
+            for volumes in self._by_node.values():
+                merged.update(volumes)
+            return merged
+
+    def _reload(self) -> None:
+        nodes = self._nodes()
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(nodes))), thread_name_prefix="kubelet-stats") as pool:
+            results = list(pool.map(self._fetch, nodes))
+        errors: Dict[str, str] = {}
+        by_node = {node: volumes for node, volumes in self._by_node.items() if node in nodes}
+        for node, volumes, error in results:
+            if error is None:
+                by_node[node] = volumes
+            else:
+                errors[node] = error
+        self._by_node = by_node
+        self.errors = errors
+        self._loaded_at = time.monotonic()
+
+
+def accrue_storage(
+    db: Session,
+    pvcs: List[dict],
+    stats: Dict[str, VolumeStats],
+    now: datetime,
+    max_gap: timedelta,
+) -> Dict[str, int]:
+    """Store the new samples and fold the storage held since each watermark into the rollup.
+
+    Spans longer than ``max_gap`` (the accruer was down) are counted from
+    ``now - max_gap`` only. Rows locked by another portal worker are skipped.
+    """
+    pvc_usage.ensure_tracked(db, pvcs, now)
+    declared = {pvc["name"]: capacity_bytes(pvc.get("capacity")) for pvc in pvcs if pvc.get("name")}
+    table = models.PvcUsage
+    rows = (
+        db.query(table.name, table.username, table.used_bytes, table.capacity_bytes, table.storage_accounted_until)
+        .filter(table.name.in_(list(declared)))
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    owners = {
+        row.username: (row.id, row.department)
+        for row in db.query(models.User.username, models.User.id, models.User.department).filter(
+            models.User.username.in_({row.username for row in rows if row.username})
+        )
+    }
+    updates = []
+    spans = []
+    for row in rows:
+        sample = stats.get(row.name)
+        capacity = (sample.capacity_bytes if sample else None) or declared.get(row.name) or row.capacity_bytes
+        used = sample.used_bytes if sample and sample.used_bytes is not None else row.used_bytes
+        held = used if used is not None else capacity
+        owner = owners.get(row.username)
+        if row.storage_accounted_until is not None and held and owner:
+            start = max(row.storage_accounted_until, now - max_gap)
+            if now > start:
+                spans.append((owner[0], owner[1], held / _BYTES_PER_GIB, start, now))
+        updates.append(
+            {
+                "b_name": row.name,
+                "capacity_bytes": capacity,
+                "used_bytes": used,
+                "sampled_at": now if sample else None,
+                "storage_accounted_until": now,
+            }
+        )
+    rollup.add_storage_hours(db, spans)
+    if updates:
+        columns = table.__table__.c
+        db.execute(
+            table.__table__.update()
+            .where(columns.name == bindparam("b_name"))
+            .values(
+                capacity_bytes=bindparam("capacity_bytes"),
+                used_bytes=bindparam("used_bytes"),
+                sampled_at=func.coalesce(bindparam("sampled_at", type_=DateTime), columns.sampled_at),
+                storage_accounted_until=bindparam("storage_accounted_until"),
+            ),
+            updates,
+        )
+    return {"claims": len(rows), "sampled": sum(1 for row in rows if row.name in stats), "spans": len(spans)}
+
+
+class StorageAccruer:
+    """Samples the volumes every ``interval_seconds`` and accrues storage GiB-hours."""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        interval_seconds: int = 300,
+        collector: Optional[VolumeStatsCollector] = None,
+    ):
+        self._session_factory = session_factory
+        self.interval_seconds = max(30, interval_seconds)
+        self.collector = collector or VolumeStatsCollector()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def accrue_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or naive_now_local()
+        pvcs = pvc_inventory.pvcs()
+        stats = self.collector.stats()
+        db = self._session_factory()
+        try:
+            result = accrue_storage(db, pvcs, stats, now, timedelta(seconds=self.interval_seconds * 2))
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="storage-accruer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.accrue_once()
+                if self.collector.errors:
+                    print(f"[storage] kubelet stats unavailable on: {', '.join(sorted(self.collector.errors))}")
+            except Exception as exc:  # pragma: no cover - defensive logging
+                print(f"[storage] accrue failed: {exc}")
+            self._stop_event.wait(self.interval_seconds)
+
+
+def storage_accruer_from_env(session_factory: SessionFactory) -> Optional[StorageAccruer]:
+    if not STORAGE_ACCOUNTING_ENABLED:
+        return None
+    interval = int(os.getenv("STORAGE_SAMPLE_INTERVAL_SECONDS", "300"))
+    return StorageAccruer(session_factory, interval_seconds=interval)
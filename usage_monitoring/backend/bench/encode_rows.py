@@ -0,0 +1,106 @@
+"""Microbenchmark: encoding the /sessions and /users lists, ORM + response model vs RowEncoder.
+
+Seeds a throwaway SQLite database (or uses DATABASE_URL when --no-seed is
+given) and times both paths on the same rows. From usage_monitoring/backend::
+
+    python bench/encode_rows.py --sessions 200000 --limit 50000
+
+The old path loads ORM objects, validates them through the read schema and
+serializes the result the way FastAPI's response_model and JSONResponse do.
+The new path selects the schema's columns and encodes the tuples with
+RowEncoder. Query and encoding are timed separately, and both outputs are
+checked to decode to the same documents.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def _best(call: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def _response_model_json(adapter, objects) -> bytes:
+    # FastAPI: validate against response_model, dump in JSON mode, then JSONResponse.render().
+    content = adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100_000, help="sessions to seed")
+    parser.add_argument("--users", type=int, default=2_000, help="users to seed")
+    parser.add_argument("--limit", type=int, default=20_000, help="rows per encoded list")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the best is reported")
+    parser.add_argument("--no-seed", action="store_true", help="measure the database in DATABASE_URL as is")
+    args = parser.parse_args(argv)
+
+    if not args.no_seed:
+        workdir = Path(tempfile.mkdtemp(prefix="encode-bench-"))
+        os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'portal.db'}"
+        from load_api import seed
+
+        seed(args.sessions, args.users)
+
+    from pydantic import TypeAdapter
+
+    from app import crud, fastjson, models, schemas
+    from app.database import SessionLocal
+
+    print(f"encoder: {'orjson' if fastjson.orjson is not None else 'json (orjson not installed)'}\n")
+    print(f"{'list':<10} {'rows':>7} {'path':<22} {'query ms':>9} {'encode ms':>10} {'total ms':>9} {'MB':>6}")
+    cases: List[tuple] = [
+        ("sessions", schemas.ContainerSessionRead, models.ContainerSession, crud.SESSION_ROWS,
+         models.ContainerSession.start_time.desc()),
+        ("users", schemas.UserRead, models.User, crud.USER_ROWS, models.User.created_at.desc()),
+    ]
+    db = SessionLocal()
+    try:
+        for name, schema, model, encoder, order in cases:
+            adapter = TypeAdapter(List[schema])
+
+            def load_objects():
+                db.expunge_all()
+                return db.query(model).order_by(order).limit(args.limit).all()
+
+            def load_rows():
+                return db.query(*encoder.columns).order_by(order).limit(args.limit).all()
+
+            old_query, objects = _best(load_objects, args.repeat)
+            old_encode, old_body = _best(lambda: _response_model_json(adapter, objects), args.repeat)
+            new_query, rows = _best(load_rows, args.repeat)
+            new_encode, new_body = _best(lambda: encoder.encode(rows), args.repeat)
+            if json.loads(old_body) != json.loads(new_body):
+                raise SystemExit(f"{name}: RowEncoder output differs from the response model's")
+            for label, query, encode, body in (
+                ("ORM + response_model", old_query, old_encode, old_body),
+                ("columns + RowEncoder", new_query, new_encode, new_body),
+            ):
+                print(
+                    f"{name:<10} {len(rows):>7} {label:<22} {query * 1000:>9.1f} {encode * 1000:>10.1f} "
+                    f"{(query + encode) * 1000:>9.1f} {len(body) / 1e6:>6.1f}"
+                )
+            print(f"{'':<10} {'':>7} {'speed-up':<22} {'':>9} {old_encode / new_encode:>9.1f}x "
+                  f"{(old_query + old_encode) / (new_query + new_encode):>8.1f}x")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
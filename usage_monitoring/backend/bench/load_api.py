@@ -0,0 +1,154 @@
+"""Load test for the Usage Portal API: throughput and latency percentiles per endpoint.
+
+Start the portal as usual (one uvicorn worker), then from usage_monitoring/backend::
+
+    # optional: synthetic users and sessions, written through DATABASE_URL
+    DATABASE_URL=postgresql+psycopg2://... python bench/load_api.py --seed 300000
+    python bench/load_api.py --url http://127.0.0.1:29781 --concurrency 16 --duration 20
+
+Paths default to the spawn-time limits check and the session listings; pass
+your own as arguments. Run it on the commit before a change and on the change
+itself to compare. Let the rollup accruer catch up after seeding before
+measuring, or its first passes will compete with the requests.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/users/bench-user-1/limits",
+    "/sessions?username=bench-user-1&limit=50",
+    "/sessions",
+]
+
+
+def seed(session_count: int, user_count: int) -> None:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from app import migrations, models, partitions
+    from app.database import engine
+    from app.timeutils import naive_now_local
+
+    migrations.upgrade(engine)
+    now = naive_now_local()
+    with engine.begin() as connection:
+        connection.execute(
+            models.User.__table__.insert(),
+            [
+                {
+                    "username": f"bench-user-{index}",
+                    "full_name": f"Bench User {index}",
+                    "email": f"bench-user-{index}@example.com",
+                    "department": f"bench-{index % 10}",
+                    "created_at": now - timedelta(days=400),
+                }
+                for index in range(1, user_count + 1)
+            ],
+        )
+        user_ids = [
+            row.id
+            for row in connection.execute(
+                models.User.__table__.select().where(models.User.username.like("bench-user-%"))
+            )
+        ]
+    rng = random.Random(0)
+    batch: List[dict] = []
+    for index in range(session_count):
+        user_id = user_ids[index % len(user_ids)]
+        start = now - timedelta(minutes=rng.randrange(60, 365 * 24 * 60))
+        gpu = rng.choice((0, 0, 0, 1, 2))
+        batch.append(
+            {
+                "user_id": user_id,
+                "container_name": f"jupyter-bench-{user_id}",
+                "requested_cpu": rng.choice((1.0, 2.0, 4.0)),
+                "requested_memory_mb": rng.choice((2048, 4096, 8192)),
+                "requested_gpu": gpu,
+                "cost_rate_per_hour": 2.5 * gpu,
+                "status": "completed",
+                "start_time": start,
+                "end_time": start + timedelta(minutes=rng.randrange(5, 600)),
+                "resource_profile": f"h100-{gpu}v" if gpu else "cpu-node",
+            }
+        )
+        if len(batch) == 10_000 or index == session_count - 1:
+            with engine.begin() as connection:
+                connection.execute(models.ContainerSession.__table__.insert(), batch)
+            batch = []
+    with engine.begin() as connection:
+        partitions.ensure_partitions(connection)
+    print(f"seeded {user_count} users and {session_count} sessions into {engine.url.render_as_string()}")
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def _worker(client: httpx.AsyncClient, path: str, deadline: float, latencies: List[float], errors: Dict[str, int]):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            await response.aread()
+            if response.status_code >= 400:
+                errors[str(response.status_code)] += 1
+                continue
+        except httpx.HTTPError as exc:
+            errors[type(exc).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url: str, paths: Sequence[str], concurrency: int, duration: float, timeout: float) -> None:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {}
+    if os.getenv("BENCH_AUTHORIZATION"):
+        headers["Authorization"] = os.environ["BENCH_AUTHORIZATION"]
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits, headers=headers) as client:
+        print(f"{'path':<48} {'ok':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for path in paths:
+            latencies: List[float] = []
+            errors: Dict[str, int] = defaultdict(int)
+            started = time.perf_counter()
+            deadline = started + duration
+            await asyncio.gather(
+                *(_worker(client, path, deadline, latencies, errors) for _ in range(concurrency))
+            )
+            elapsed = time.perf_counter() - started
+            print(
+                f"{path:<48} {len(latencies):>7} {sum(errors.values()):>7} {len(latencies) / elapsed:>8.1f} "
+                f"{_percentile(latencies, 0.5) * 1000:>8.1f} {_percentile(latencies, 0.99) * 1000:>8.1f} "
+                f"{max(latencies, default=0.0) * 1000:>8.1f}"
+                + (f"  {dict(errors)}" if errors else "")
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=DEFAULT_PATHS)
+    parser.add_argument("--url", default="http://127.0.0.1:29781")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per path")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, metavar="SESSIONS", help="insert synthetic data and exit")
+    parser.add_argument("--users", type=int, default=500, help="users to create with --seed")
+    args = parser.parse_args(argv)
+    if args.seed:
+        seed(args.seed, args.users)
+        return 0
+    asyncio.run(run(args.url, args.paths, args.concurrency, args.duration, args.timeout))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+"""Spawn-path benchmark: latency of the limits check behind JupyterHub's pre_spawn_hook.
+
+Runs without a cluster. A fake kubectl answers every call after a fixed delay
+(the pod listing holds --pods single-user pods of --users users), and the
+portal runs in a uvicorn subprocess on a throwaway SQLite database. From
+usage_monitoring/backend::
+
+    python bench/spawn_limits.py --kubectl-ms 250 --pods 200 --users 80
+
+Reports the old per-request path (collect_usage_payload() plus a scan for the
+user), /users/{username}/limits served from the pod snapshot (sequential and
+concurrent), and the same endpoint with ?fresh=true.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_api import _percentile, run  # noqa: E402
+
+FAKE_KUBECTL = r'''
+import json, os, sys, time
+
+time.sleep(float(os.environ["FAKE_KUBECTL_MS"]) / 1000.0)
+args = sys.argv[1:]
+pods, users = int(os.environ["FAKE_KUBECTL_PODS"]), int(os.environ["FAKE_KUBECTL_USERS"])
+if args[:2] == ["get", "pods"]:
+    items = []
+    for index in range(pods):
+        user = f"user{index % users}"
+        gpu = {"nvidia.com/gpu": "1"} if index % 4 == 0 else {}
+        items.append({
+            "metadata": {
+                "name": f"jupyter-{user}-{index}",
+                "labels": {"component": "singleuser-server", "hub.jupyter.org/username": user},
+                "annotations": {"hub.jupyter.org/username": user},
+            },
+            "spec": {
+                "nodeName": f"node{index % 8}",
+                "containers": [{"image": "jupyter", "resources": {
+                    "requests": {"cpu": "2", "memory": "4Gi", **gpu},
+                    "limits": {"cpu": "4", "memory": "8Gi", **gpu},
+                }}],
+            },
+            "status": {"phase": "Running", "startTime": "2026-01-01T00:00:00Z", "containerStatuses": [
+                {"containerID": "containerd://" + format(index, "064x")}
+            ]},
+        })
+    print(json.dumps({"items": items}))
+elif args[:1] == ["top"]:
+    for index in range(pods):
+        print(f"jupyter-user{index % users}-{index} 250m 1024Mi")
+else:
+    print(json.dumps({"items": []}))
+'''
+
+
+def _timed(call: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _report(label: str, samples: List[float]) -> None:
+    print(
+        f"{label:<44} n={len(samples):<5} p50 {_percentile(samples, 0.5) * 1000:8.2f} ms"
+        f"   p99 {_percentile(samples, 0.99) * 1000:8.2f} ms"
+    )
+
+
+def _wait_ready(client: httpx.Client, path: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.get(path).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"portal did not answer {path} within {timeout:.0f}s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kubectl-ms", type=float, default=250.0, help="delay of every fake kubectl call")
+    parser.add_argument("--pods", type=int, default=200)
+    parser.add_argument("--users", type=int, default=80)
+    parser.add_argument("--requests", type=int, default=500, help="sequential requests to the limits endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=29799)
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="spawn-bench-"))
+    (workdir / "kubectl.py").write_text(FAKE_KUBECTL)
+    os.environ.update(
+        {
+            "KUBECTL_BIN": f"{sys.executable} {workdir / 'kubectl.py'}",
+            "FAKE_KUBECTL_MS": str(args.kubectl_ms),
+            "FAKE_KUBECTL_PODS": str(args.pods),
+            "FAKE_KUBECTL_USERS": str(args.users),
+            "DATABASE_URL": f"sqlite:///{workdir / 'portal.db'}",
+            "AUTO_RECORD_ENABLED": "false",
+            "STORAGE_ACCOUNTING_ENABLED": "false",
+        }
+    )
+
+    from app import jhub
+
+    username = "user7"
+
+    def old_path():
+        payload = jhub.collect_usage_payload()
+        return next((entry for entry in payload["users"] if entry["user"] == username), None)
+
+    _report("old: collect_usage_payload() + scan", _timed(old_path, 5))
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    path = f"/users/{username}/limits"
+    try:
+        with httpx.Client(base_url=url, timeout=30.0) as client:
+            _wait_ready(client, path)
+            # Let the background snapshot take its first listing, as on a running portal.
+            time.sleep(args.kubectl_ms / 1000.0 * 2)
+            _report("new: limits from the snapshot, sequential", _timed(lambda: client.get(path), args.requests))
+            _report("new: limits with ?fresh=true", _timed(lambda: client.get(path, params={"fresh": "true"}), 10))
+        print(f"\nconcurrent, {args.concurrency} connections:")
+        asyncio.run(run(url, [path], args.concurrency, args.duration, 30.0))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+"""Test setup for the Usage Portal backend.
+
+Run from usage_monitoring/backend (the same layout the Dockerfile uses)::
+
+    python -m pytest -q tests
+
+Tests build their own engines; DATABASE_URL only has to be importable, so it
+defaults to a throwaway SQLite file instead of the compose Postgres host.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(tempfile.gettempdir()) / 'usage_portal_tests.db'}")
+os.environ.setdefault("AUTO_RECORD_ENABLED", "false")
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """A migrated, empty SQLite database."""
+    from app import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'portal.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, _record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(sqlite_engine):
+    session = sessionmaker(bind=sqlite_engine, autocommit=False, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def api_client(sqlite_engine):
+    """TestClient whose request sessions come from the migrated SQLite database."""
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.database import ThreadedSession
+
+    factory = sessionmaker(bind=sqlite_engine, autocommit=False, autoflush=False)
+
+    async def _test_db():
+        db = ThreadedSession(factory())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    def _test_sync_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_ready_db] = _test_db
+    main.app.dependency_overrides[main.get_ready_sync_db] = _test_sync_db
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
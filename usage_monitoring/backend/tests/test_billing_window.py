@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+from app import models
+
+
+@pytest.fixture
+def sessions(db):
+    alice = models.User(username="alice", full_name="Alice", email="alice@example.com", department="physics")
+    bob = models.User(username="bob", full_name="Bob", email="bob@example.com", department="physics")
+    db.add_all([alice, bob])
+    db.flush()
+    common = dict(requested_memory_mb=1024, requested_gpu=0, status="completed", resource_profile="cpu-node")
+    db.add_all(
+        [
+            # Crosses the January / February boundary: 2h in January, 3h in February.
+            models.ContainerSession(
+                user_id=alice.id,
+                container_name="jupyter-alice",
+                requested_cpu=2,
+                cost_rate_per_hour=3,
+                start_time=datetime(2026, 1, 31, 22),
+                end_time=datetime(2026, 2, 1, 3),
+                **common,
+            ),
+            models.ContainerSession(
+                user_id=bob.id,
+                container_name="jupyter-bob",
+                requested_cpu=1,
+                cost_rate_per_hour=1,
+                start_time=datetime(2026, 2, 10, 8),
+                end_time=datetime(2026, 2, 10, 12),
+                **common,
+            ),
+            # Entirely before the window.
+            models.ContainerSession(
+                user_id=bob.id,
+                container_name="jupyter-bob",
+                requested_cpu=1,
+                cost_rate_per_hour=1,
+                start_time=datetime(2025, 12, 1, 8),
+                end_time=datetime(2025, 12, 1, 9),
+                **common,
+            ),
+        ]
+    )
+    db.commit()
+
+
+def _summary(client, **params):
+    response = client.get("/billing/summary", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_window_clips_sessions_to_the_window(api_client, sessions):
+    rows = _summary(api_client, start="2026-02-01T00:00:00", end="2026-03-01T00:00:00")
+
+    by_user = {row["username"]: row for row in rows}
+    assert set(by_user) == {"alice", "bob"}
+    assert by_user["alice"]["total_hours"] == pytest.approx(3.0)
+    assert by_user["alice"]["cpu_core_hours"] == pytest.approx(6.0)
+    assert by_user["alice"]["total_estimated_cost"] == pytest.approx(9.0)
+    assert by_user["bob"]["total_sessions"] == 1
+    assert by_user["bob"]["total_hours"] == pytest.approx(4.0)
+
+
+def test_monthly_breakdown_by_department(api_client, sessions):
+    rows = _summary(
+        api_client,
+        start="2026-01-15T00:00:00",
+        end="2026-03-01T00:00:00",
+        group_by="department",
+        breakdown="month",
+    )
+
+    assert [(row["period_start"], row["period_end"], row["department"]) for row in rows] == [
+        ("2026-01-15T00:00:00", "2026-02-01T00:00:00", "physics"),
+        ("2026-02-01T00:00:00", "2026-03-01T00:00:00", "physics"),
+    ]
+    assert rows[0]["total_hours"] == pytest.approx(2.0)
+    assert rows[1]["total_hours"] == pytest.approx(7.0)
+    assert rows[1]["total_sessions"] == 2
+
+
+def test_window_rejects_an_empty_range(api_client, sessions):
+    response = api_client.get(
+        "/billing/summary", params={"start": "2026-02-01T00:00:00", "end": "2026-02-01T00:00:00"}
+    )
+    assert response.status_code == 400
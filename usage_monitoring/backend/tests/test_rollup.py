@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, rollup, schemas
+
+
+def _rollup_rows(db):
+    table = models.UsageRollupDaily
+    return {
+        (row.department, row.day.isoformat()): round(row.wall_hours, 6)
+        for row in db.query(table).filter(table.resource_profile != rollup.STORAGE_PROFILE)
+    }
+
+
+def test_retraction_debits_the_department_the_session_was_credited_under(sqlite_engine, db):
+    user = models.User(username="alice", full_name="Alice", email="alice@example.com", department="physics")
+    db.add(user)
+    db.flush()
+    session = models.ContainerSession(
+        user_id=user.id,
+        container_name="jupyter-alice",
+        requested_cpu=2,
+        requested_memory_mb=4096,
+        requested_gpu=0,
+        cost_rate_per_hour=1,
+        status="completed",
+        start_time=datetime(2026, 3, 1, 10),
+        end_time=datetime(2026, 3, 1, 14),
+        resource_profile="cpu-node",
+    )
+    db.add(session)
+    db.commit()
+    factory = sessionmaker(bind=sqlite_engine)
+
+    rollup.accrue(factory, now=datetime(2026, 3, 2))
+    db.expire_all()
+    assert _rollup_rows(db) == {("physics", "2026-03-01"): 4.0}
+
+    user.department = "chemistry"
+    db.commit()
+    crud.update_container_session(db, session.id, schemas.ContainerSessionUpdate(end_time=datetime(2026, 3, 1, 12)))
+    rollup.accrue(factory, now=datetime(2026, 3, 2))
+    db.expire_all()
+
+    assert _rollup_rows(db) == {("physics", "2026-03-01"): 0.0, ("chemistry", "2026-03-01"): 2.0}
@@ -0,0 +1,102 @@
+import socket
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs, models
+from app.timeutils import naive_now_local
+
+
+@pytest.fixture
+def runner(sqlite_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "LOG_FLUSH_SECONDS", 0.1)
+    factory = sessionmaker(bind=sqlite_engine, autocommit=False, autoflush=False)
+    runner = jobs.ScriptJobRunner(factory, tmp_path, workers=2, timeout_seconds=30)
+    yield runner
+    runner.shutdown()
+
+
+def _job(job_id, target, owner, heartbeat_at, status="running"):
+    return models.ScriptJob(
+        id=job_id, script="add_node.sh", target=target, status=status, owner=owner, heartbeat_at=heartbeat_at
+    )
+
+
+def _wait_for(runner, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get_job(job_id, with_log=True)
+        if job.status not in jobs.ACTIVE_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_recover_fails_only_jobs_whose_owner_is_gone(db, runner):
+    now = naive_now_local()
+    host = socket.gethostname()
+    db.add_all(
+        [
+            _job("live-elsewhere", "10.0.0.1", "other-host:42:abcd", now),
+            _job("stale-elsewhere", "10.0.0.2", "other-host:43:abcd", now - timedelta(hours=1)),
+            _job("dead-pid-here", "10.0.0.3", f"{host}:999999999:abcd", now),
+            _job("earlier-incarnation", "10.0.0.4", f"{host}:{jobs.os.getpid()}:older", now),
+            _job("mine", "10.0.0.5", runner.owner, now - timedelta(hours=1)),
+            _job("pre-owner", "10.0.0.6", None, None, status="queued"),
+        ]
+    )
+    db.commit()
+
+    assert runner.recover() == 4
+
+    db.expire_all()
+    statuses = {job.id: job.status for job in db.query(models.ScriptJob)}
+    assert statuses == {
+        "live-elsewhere": "running",
+        "stale-elsewhere": "failed",
+        "dead-pid-here": "failed",
+        "earlier-incarnation": "failed",
+        "mine": "running",
+        "pre-owner": "failed",
+    }
+
+
+def test_one_active_job_per_target_is_enforced_by_the_database(db, runner):
+    db.add(_job("first", "10.0.0.9", "other-host:42:abcd", naive_now_local()))
+    db.commit()
+
+    with pytest.raises(jobs.JobConflict, match="first"):
+        runner.submit("add_node.sh", [], target="10.0.0.9", params={})
+
+    db.add(_job("second", "10.0.0.9", "other-host:42:abcd", naive_now_local(), status="queued"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+    # Finished jobs do not hold the target.
+    db.add(_job("done", "10.0.0.9", "other-host:42:abcd", naive_now_local(), status="failed"))
+    db.commit()
+
+
+def test_output_flush_failure_keeps_waiting_on_the_script(runner, tmp_path, monkeypatch):
+    (tmp_path / "add_node.sh").write_text("echo start\nsleep 0.5\necho end\n")
+    real_flush = runner._flush
+    calls = []
+
+    def flaky_flush(job_id, live, flushed):
+        calls.append(flushed)
+        if len(calls) == 1:
+            raise RuntimeError("database went away")
+        return real_flush(job_id, live, flushed)
+
+    monkeypatch.setattr(runner, "_flush", flaky_flush)
+
+    submitted = runner.submit("add_node.sh", [], target="10.0.0.7", params={})
+    job = _wait_for(runner, submitted.id)
+
+    assert job.status == "succeeded"
+    assert job.exit_code == 0
+    assert [entry.line for entry in job.log] == ["start", "end"]
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import cache, crud, models, schemas
+
+
+@pytest.fixture
+def alice(db):
+    cache.invalidate_costs()
+    cache.user_cache.clear()
+    user = models.User(username="alice", full_name="Alice", email="alice@example.com", department="physics")
+    db.add(user)
+    db.commit()
+    crud.remember_user(user)
+    return user
+
+
+def test_department_change_drops_the_cached_user_and_costs(db, alice):
+    cache.cost_cache.set(("period", "department"), ["stale"])
+
+    crud.update_user_by_full_name(db, "Alice", schemas.UserUpdate(department="chemistry"))
+
+    assert crud.cached_user("alice") is None
+    assert cache.cost_cache.get(("period", "department")) == (False, None)
+
+
+def test_limit_change_keeps_cached_costs(db, alice):
+    cache.cost_cache.set(("period", "user"), ["kept"])
+
+    crud.update_user_by_full_name(db, "Alice", schemas.UserUpdate(gpu_limit=2))
+
+    assert crud.cached_user("alice") is None
+    assert cache.cost_cache.get(("period", "user")) == (True, ["kept"])
+
+
+def test_rename_drops_the_old_and_the_new_username(db, alice):
+    cache.user_cache.set("alice2", "cached before the rename")
+    rename = SimpleNamespace(dict=lambda exclude_unset: {"username": "alice2"})
+
+    crud.update_user(db, alice.id, rename)
+
+    assert crud.cached_user("alice") is None
+    assert crud.cached_user("alice2") is None
@@ -0,0 +1,36 @@
+import pytest
+
+from app import main, models
+
+
+@pytest.fixture
+def users(db):
+    db.add_all(
+        [
+            models.User(username=f"user{index}", full_name=f"User {index}", email=f"user{index}@example.com")
+            for index in range(40)
+        ]
+    )
+    db.commit()
+
+
+def test_batch_limits_refresh_a_stale_snapshot_once(api_client, users, monkeypatch):
+    calls = []
+
+    def failing_refresh():
+        calls.append(1)
+        return False
+
+    monkeypatch.setattr(main.cluster_snapshot, "is_fresh", lambda max_age_seconds=None: False)
+    monkeypatch.setattr(main.cluster_snapshot, "ensure_fresh", failing_refresh)
+    monkeypatch.setattr(main.cluster_snapshot, "refresh", failing_refresh)
+
+    names = ",".join(f"user{index}" for index in range(40)) + ",ghost"
+    response = api_client.get("/users/limits", params={"names": names})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["items"]) == 40
+    assert body["missing"] == ["ghost"]
+    assert not any(item["usage"]["available"] for item in body["items"])
+    assert len(calls) == 1
@@ -13,6 +13,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
+try:
+    from usage_monitoring.backend.app.assets import COMPRESSION_ENABLED, CompressionMiddleware, HtmlPage, StaticAssets
+except Exception:  # Usage Portal package not importable: plain static files, no compression.
+    COMPRESSION_ENABLED = False
+    CompressionMiddleware = HtmlPage = StaticAssets = None  # type: ignore
+try:
+    from usage_monitoring.backend.app.instrumentation import instrument
+except Exception:  # Usage Portal package not importable: no /metrics or profiling.
+    def instrument(app, admin=None) -> None:  # type: ignore
+        return None
+
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 FRONTEND_DIR = ROOT_DIR / "frontend"
@@ -187,6 +198,8 @@ def _start_purger():
 
 
 app = FastAPI(title="User Logs Monitor", version="0.1.0")
+# Before the prefix-stripping middleware, so requests are matched to their routes.
+instrument(app)
 
 if SERVICE_PREFIX:
     @app.middleware("http")
@@ -208,6 +221,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
 
 _start_purger()
 
@@ -253,13 +268,17 @@ async def logs(
 
 
 # Static assets must be mounted before the catch-all SPA route.
-app.mount("/app/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
+static_assets = StaticAssets(FRONTEND_DIR) if StaticAssets else StaticFiles(directory=str(FRONTEND_DIR))
+INDEX_FILE = FRONTEND_DIR / "index.html"
+index_page = HtmlPage(INDEX_FILE, static_assets) if HtmlPage and INDEX_FILE.exists() else None
+app.mount("/app/static", static_assets, name="static")
 
 
 @app.get("/app/")
 @app.get("/app/{rest:path}")
-async def spa(rest: str = ""):
-    index = FRONTEND_DIR / "index.html"
-    if not index.exists():
+async def spa(request: Request, rest: str = ""):
+    if index_page is not None:
+        return index_page.response(request)
+    if not INDEX_FILE.exists():
         raise HTTPException(status_code=404, detail="Frontend not found")
-    return FileResponse(index)
+    return FileResponse(INDEX_FILE)
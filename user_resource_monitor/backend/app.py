@@ -1,11 +1,14 @@
+import asyncio
+import hashlib
 import json
 import os
 import re
 import shlex
 import subprocess
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
 
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,6 +16,42 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 import httpx
 
+try:
+    from usage_monitoring.backend.app.assets import COMPRESSION_ENABLED, CompressionMiddleware, HtmlPage, StaticAssets
+except Exception:  # Usage Portal package not importable: plain static files, no compression.
+    COMPRESSION_ENABLED = False
+    CompressionMiddleware = HtmlPage = StaticAssets = None  # type: ignore
+try:
+    from usage_monitoring.backend.app.instrumentation import instrument
+except Exception:  # Usage Portal package not importable: no /metrics or profiling.
+    def instrument(app, admin=None) -> None:  # type: ignore
+        return None
+try:
+    from usage_monitoring.backend.app.cache import TTLCache
+    from usage_monitoring.backend.app.metrics import Counter, Histogram
+except Exception:  # Usage Portal package not importable: lookups go upstream every time, nothing is recorded.
+
+    class TTLCache:  # type: ignore
+        def __init__(self, name: str, maxsize: int = 1024, ttl_seconds: float = 30.0):
+            self.name = name
+
+        def get(self, key: Hashable) -> Tuple[bool, Any]:
+            return False, None
+
+        def set(self, key: Hashable, value: Any) -> None:
+            return None
+
+    class Histogram:  # type: ignore
+        def __init__(self, *args: Any, **kwargs: Any):
+            pass
+
+        def observe(self, *args: Any, **kwargs: Any) -> None:
+            return None
+
+        def inc(self, *args: Any, **kwargs: Any) -> None:
+            return None
+
+    Counter = Histogram  # type: ignore
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 FRONTEND_DIR = ROOT_DIR / "frontend"
@@ -125,6 +164,20 @@ JHUB_NAMESPACE = os.environ.get("JHUB_NAMESPACE", "jhub")
 USAGE_PORTAL_URL = os.environ.get("USAGE_PORTAL_URL", "")
 USAGE_PORTAL_TIMEOUT = float(os.environ.get("USAGE_PORTAL_TIMEOUT", "5.0"))
 HUB_API_URL = os.environ.get("USER_RESOURCE_MONITOR_HUB_API_URL") or os.environ.get("JUPYTERHUB_API_URL")
+HUB_API_TIMEOUT = float(os.environ.get("USER_RESOURCE_MONITOR_HUB_API_TIMEOUT", "5.0"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("USER_RESOURCE_MONITOR_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get("USER_RESOURCE_MONITOR_HTTP_KEEPALIVE_SECONDS", "30"))
+# 0 disables the cache; a revoked Hub token keeps working for at most this long.
+TOKEN_CACHE_SECONDS = float(os.environ.get("USER_RESOURCE_MONITOR_TOKEN_CACHE_SECONDS", "60"))
+# Quotas older than this are served as they are and refreshed in the background,
+# until they reach the max staleness (e.g. the portal stays unreachable).
+QUOTA_CACHE_SECONDS = float(os.environ.get("USER_RESOURCE_MONITOR_QUOTA_CACHE_SECONDS", "30"))
+QUOTA_MAX_STALE_SECONDS = float(os.environ.get("USER_RESOURCE_MONITOR_QUOTA_MAX_STALE_SECONDS", "600"))
+LOOKUP_CACHE_SIZE = int(os.environ.get("USER_RESOURCE_MONITOR_LOOKUP_CACHE_SIZE", "4096"))
+REFRESH_SECONDS = max(1.0, float(os.environ.get("USER_RESOURCE_MONITOR_REFRESH_SECONDS", "15")))
+CAPACITY_REFRESH_SECONDS = max(1.0, float(os.environ.get("USER_RESOURCE_MONITOR_CAPACITY_REFRESH_SECONDS", "300")))
+# With no /api/resources request for this long, the refreshers stop calling kubectl until the next one.
+IDLE_SECONDS = float(os.environ.get("USER_RESOURCE_MONITOR_IDLE_SECONDS", "300"))
 
 USERNAME_SANITIZE_RE = re.compile(r"[^a-z0-9]+")
 USERNAME_LABEL_KEYS = (
@@ -208,11 +261,9 @@ def _collect_cluster_capacity() -> Dict[str, float]:
     """Return allocatable cluster totals for JupyterHub namespace.
 
     Values are derived from node allocatable resources, not live usage.
+    Raises RuntimeError when the nodes cannot be listed.
     """
-    try:
-        raw = _run_kubectl(["get", "nodes", "-o", "json"])
-    except Exception:
-        return {}
+    raw = _run_kubectl(["get", "nodes", "-o", "json"])
     total_cpu = 0.0
     total_mem = 0.0
     total_gpu = 0.0
@@ -229,38 +280,168 @@ def _collect_cluster_capacity() -> Dict[str, float]:
     return {"cpuMillicores": total_cpu, "memoryMiB": total_mem, "gpu": total_gpu}
 
 
-async def _fetch_user_quota(username: str) -> Optional[Dict[str, float]]:
-    """Fetch user quota limits from Usage Portal.
+upstream_seconds = Histogram(
+    "resource_monitor_upstream_seconds", "Usage Portal and Hub API call latency", ("upstream", "outcome")
+)
+cache_lookups = Counter(
+    "resource_monitor_cache_lookups_total", "Token and quota lookups by cache result", ("cache", "result")
+)
+
+
+class UpstreamClient:
+    """One pooled httpx.AsyncClient per upstream for the app's lifetime, created on first use.
 
-    Returns dict with cpuMillicores, memoryMiB, gpu keys, or None if unavailable.
+    Repeated calls reuse keep-alive connections instead of paying a TCP/TLS
+    handshake each; every call is timed in ``upstream_seconds``.
     """
-    if not USAGE_PORTAL_URL:
-        return None
 
-    canonical = normalize_username(username)
-    if not canonical:
-        return None
+    def __init__(self, name: str, timeout_seconds: float, verify: bool = True):
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self.verify = verify
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            )
+            self._client = httpx.AsyncClient(timeout=self.timeout_seconds, verify=self.verify, limits=limits)
+        return self._client
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._get_client().get(url, **kwargs)
+            outcome = str(response.status_code)
+            return response
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started, self.name, outcome)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SingleFlight:
+    """Concurrent callers for the same key share one in-flight call.
+
+    The call runs as its own task, so a waiter that disconnects does not
+    cancel it for the others.
+    """
 
-    url = f"{USAGE_PORTAL_URL.rstrip('/')}/users/{canonical}/limits"
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def pending(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is done else None)
+        return await asyncio.shield(task)
+
+
+portal_client = UpstreamClient("usage_portal", USAGE_PORTAL_TIMEOUT)
+hub_client = UpstreamClient("hub_api", HUB_API_TIMEOUT, verify=False)
+# sha256 of the token -> Hub username, or None for a token the Hub rejected.
+token_cache = TTLCache("hub_tokens", maxsize=LOOKUP_CACHE_SIZE, ttl_seconds=TOKEN_CACHE_SECONDS)
+# canonical username -> quota, or None when the portal has no limits for the user.
+quota_cache = TTLCache(
+    "user_quotas",
+    maxsize=LOOKUP_CACHE_SIZE,
+    ttl_seconds=max(QUOTA_CACHE_SECONDS, QUOTA_MAX_STALE_SECONDS) if QUOTA_CACHE_SECONDS > 0 else 0.0,
+)
+_lookups = SingleFlight()
+# Background refreshes in flight; referenced so they are not garbage collected.
+_background: set = set()
 
-    try:
-        async with httpx.AsyncClient(timeout=USAGE_PORTAL_TIMEOUT) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                return None
+# Loaders return (cacheable, value); failures to reach the upstream are not cached.
+Loader = Callable[[], Awaitable[Tuple[bool, Any]]]
+# (value, loaded at, time.monotonic() when loaded); loaded at is None when the value was not cached.
+Lookup = Tuple[Any, Optional[datetime], Optional[float]]
 
-            data = response.json()
-            cpu_limit = data.get("cpu_limit_cores", 0)
-            mem_limit = data.get("memory_limit_gib", 0)
-            gpu_limit = data.get("gpu_limit", 0)
 
-            return {
-                "cpuMillicores": float(cpu_limit) * 1000.0,  # cores to millicores
-                "memoryMiB": float(mem_limit) * 1024.0,       # GiB to MiB
-                "gpu": float(gpu_limit),
-            }
+async def _cached_lookup(cache: TTLCache, key: Hashable, load: Loader, refresh_after: Optional[float] = None) -> Lookup:
+    """Cached ``load()`` result for ``key``.
+
+    With ``refresh_after``, an entry older than that many seconds is still
+    returned at once while one background call reloads it.
+    """
+    flight_key = (cache.name, key)
+
+    async def load_and_store() -> Lookup:
+        cacheable, loaded = await load()
+        if not cacheable:
+            return loaded, None, None
+        entry = (loaded, datetime.now(timezone.utc), time.monotonic())
+        cache.set(key, entry)
+        return entry
+
+    hit, entry = cache.get(key)
+    if hit:
+        if refresh_after is None or time.monotonic() - entry[2] < refresh_after:
+            cache_lookups.inc(cache.name, "hit")
+        else:
+            cache_lookups.inc(cache.name, "stale")
+            if not _lookups.pending(flight_key):
+                task = asyncio.ensure_future(_lookups.do(flight_key, load_and_store))
+                _background.add(task)
+                task.add_done_callback(_background.discard)
+        return entry
+    cache_lookups.inc(cache.name, "coalesced" if _lookups.pending(flight_key) else "miss")
+    return await _lookups.do(flight_key, load_and_store)
+
+
+async def _load_user_quota(canonical: str) -> Tuple[bool, Optional[Dict[str, float]]]:
+    url = f"{USAGE_PORTAL_URL.rstrip('/')}/users/{canonical}/limits"
+    try:
+        response = await portal_client.get(url)
     except Exception:
-        return None
+        return False, None
+    if response.status_code != 200:
+        # An unknown user is an answer; a portal error is not.
+        return response.status_code < 500, None
+    try:
+        data = response.json()
+        cpu_limit = data.get("cpu_limit_cores", 0)
+        mem_limit = data.get("memory_limit_gib", 0)
+        gpu_limit = data.get("gpu_limit", 0)
+        return True, {
+            "cpuMillicores": float(cpu_limit) * 1000.0,  # cores to millicores
+            "memoryMiB": float(mem_limit) * 1024.0,       # GiB to MiB
+            "gpu": float(gpu_limit),
+        }
+    except Exception:
+        return False, None
+
+
+async def _fetch_user_quota(username: str) -> Tuple[Optional[Dict[str, float]], Optional[datetime]]:
+    """Fetch user quota limits from Usage Portal, and when they were fetched.
+
+    The quota is dict with cpuMillicores, memoryMiB, gpu keys, or None if unavailable.
+    Cached quotas older than ``QUOTA_CACHE_SECONDS`` are refreshed in the background.
+    """
+    if not USAGE_PORTAL_URL:
+        return None, None
+
+    canonical = normalize_username(username)
+    if not canonical:
+        return None, None
+    quota, fetched_at, _ = await _cached_lookup(
+        quota_cache, canonical, lambda: _load_user_quota(canonical), refresh_after=QUOTA_CACHE_SECONDS
+    )
+    return quota, fetched_at
 
 
 def _run_kubectl(args: List[str]) -> dict:
@@ -303,8 +484,11 @@ def _fetch_pod_metrics() -> Tuple[bool, Dict[str, Dict[str, Optional[float]]]]:
     return True, metrics
 
 
-def list_user_pods(account: str) -> Tuple[List[dict], bool]:
-    owner_key = normalize_username(account)
+def collect_pods() -> Tuple[Dict[str, List[dict]], bool]:
+    """Every singleuser pod grouped by normalized owner, and whether usage metrics were available.
+
+    Blocking (kubectl, nvidia-smi); only the refresher calls it, off the event loop.
+    """
     # Preferred path: use Usage Portal collector to get GPU usage too.
     if usage_jhub is not None:
         try:
@@ -318,15 +502,13 @@ def list_user_pods(account: str) -> Tuple[List[dict], bool]:
                 except Exception:
                     return 0
 
-            pods: List[dict] = []
+            by_user: Dict[str, List[dict]] = {}
             for pod in raw_pods:
                 user_key = normalize_username(pod.get("user") or pod.get("displayUser") or "")
-                if user_key != owner_key:
-                    continue
                 req = pod.get("requests") or {}
                 lim = pod.get("limits") or {}
                 usage = pod.get("usage") or {}
-                pods.append(
+                by_user.setdefault(user_key, []).append(
                     {
                         "name": pod.get("podName") or pod.get("name") or "",
                         "displayUser": pod.get("displayUser") or pod.get("user") or "",
@@ -362,9 +544,10 @@ def list_user_pods(account: str) -> Tuple[List[dict], bool]:
                         "gpuUsage": pod.get("gpuUsage") or {},
                     }
                 )
-            for p in pods:
-                p["resourceFormat"] = _infer_resource_format(p)
-            return pods, metrics_available
+            for pods in by_user.values():
+                for p in pods:
+                    p["resourceFormat"] = _infer_resource_format(p)
+            return by_user, metrics_available
         except Exception:
             # Fall back to direct kubectl parsing if Usage Portal code fails.
             pass
@@ -373,15 +556,13 @@ def list_user_pods(account: str) -> Tuple[List[dict], bool]:
         ["get", "pods", "-n", JHUB_NAMESPACE, "-l", "component=singleuser-server", "-o", "json"]
     )
     metrics_available, metrics_map = _fetch_pod_metrics()
-    pods: List[dict] = []
+    by_user: Dict[str, List[dict]] = {}
     for item in raw.get("items", []):
         metadata = item.get("metadata") or {}
         status = item.get("status") or {}
         spec = item.get("spec") or {}
         pod_name = metadata.get("name") or ""
         user_key, display_user = _extract_username(metadata, pod_name)
-        if user_key != owner_key:
-            continue
         containers = spec.get("containers") or []
         container = containers[0] if containers else {}
         resources = container.get("resources") or {}
@@ -397,7 +578,7 @@ def list_user_pods(account: str) -> Tuple[List[dict], bool]:
                 age_seconds = (datetime.now(timezone.utc) - start_dt).total_seconds()
             except Exception:
                 age_seconds = None
-        pods.append(
+        by_user.setdefault(user_key, []).append(
             {
                 "name": pod_name,
                 "displayUser": display_user,
@@ -432,9 +613,111 @@ def list_user_pods(account: str) -> Tuple[List[dict], bool]:
                 },
             }
         )
-    for p in pods:
-        p["resourceFormat"] = _infer_resource_format(p)
-    return pods, metrics_available
+    for pods in by_user.values():
+        for p in pods:
+            p["resourceFormat"] = _infer_resource_format(p)
+    return by_user, metrics_available
+
+
+refresh_seconds = Histogram(
+    "resource_monitor_refresh_seconds", "Background collection time", ("source", "outcome")
+)
+
+
+class Snapshot:
+    def __init__(self, value: Any, collected_at: datetime):
+        self.value = value
+        self.collected_at = collected_at
+        self.monotonic = time.monotonic()
+
+
+class BackgroundRefresher:
+    """Runs a blocking collection in a worker thread and keeps the latest result for the handlers.
+
+    A background task refreshes every ``interval_seconds`` while the page is
+    being used, so requests only read memory and one slow kubectl call no
+    longer stalls the event loop. A snapshot older than ``max_age_seconds``
+    (none yet, or the refresher was idle) is refreshed before ``latest``
+    returns it; concurrent readers share that one collection. When a refresh
+    fails the previous snapshot keeps being served and ``last_error`` says why.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        collect: Callable[[], Any],
+        interval_seconds: float,
+        idle_seconds: float = IDLE_SECONDS,
+    ):
+        self.source = source
+        self._collect = collect
+        self.interval_seconds = interval_seconds
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = interval_seconds * 3
+        self.last_error: Optional[str] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._refreshing: Optional["asyncio.Future[Snapshot]"] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._last_read = time.monotonic()
+
+    async def refresh(self) -> Snapshot:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self) -> Snapshot:
+        started = time.perf_counter()
+        try:
+            value = await asyncio.to_thread(self._collect)
+        except Exception as exc:
+            refresh_seconds.observe(time.perf_counter() - started, self.source, "error")
+            self.last_error = str(exc) or exc.__class__.__name__
+            if self._snapshot is None:
+                raise
+            return self._snapshot
+        refresh_seconds.observe(time.perf_counter() - started, self.source, "ok")
+        self.last_error = None
+        self._snapshot = Snapshot(value, datetime.now(timezone.utc))
+        return self._snapshot
+
+    async def latest(self) -> Snapshot:
+        self._last_read = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.monotonic > self.max_age_seconds:
+            return await self.refresh()
+        return snapshot
+
+    def current(self) -> Optional[Snapshot]:
+        """The latest snapshot, however old, without waiting for a collection."""
+        self._last_read = time.monotonic()
+        return self._snapshot
+
+    async def _run(self) -> None:
+        while True:
+            if time.monotonic() - self._last_read < self.idle_seconds:
+                try:
+                    await self.refresh()
+                except Exception as exc:  # pragma: no cover - defensive logging
+                    print(f"[user-resource-monitor] {self.source} refresh failed: {exc}", flush=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+pod_refresher = BackgroundRefresher("pods", collect_pods, REFRESH_SECONDS)
+# Node allocatable totals, the fallback when the portal has no quota for the user.
+capacity_refresher = BackgroundRefresher("capacity", _collect_cluster_capacity, CAPACITY_REFRESH_SECONDS)
 
 
 def _user_from_jupyterhub_headers(request: Request) -> Optional[str]:
@@ -445,6 +728,23 @@ def _user_from_jupyterhub_headers(request: Request) -> Optional[str]:
     return None
 
 
+async def _load_token_user(url: str, token: str) -> Tuple[bool, Optional[str]]:
+    try:
+        resp = await hub_client.get(url, headers={"Authorization": f"Bearer {token}"})
+    except Exception:
+        return False, None
+    if resp.status_code in (401, 403):
+        return True, None
+    if resp.status_code != 200:
+        return False, None
+    try:
+        data = resp.json()
+    except Exception:
+        return False, None
+    username = data.get("name") or data.get("username")
+    return True, username or None
+
+
 async def _user_from_jupyterhub_token(request: Request) -> Optional[str]:
     if not HUB_API_URL:
         return None
@@ -458,19 +758,10 @@ async def _user_from_jupyterhub_token(request: Request) -> Optional[str]:
     if not base_api:
         base_api = f"{request.url.scheme}://{request.url.netloc}/hub/api"
     url = f"{base_api}/user"
-    try:
-        async with httpx.AsyncClient(timeout=5.0, verify=False) as client:
-            resp = await client.get(url, headers={"Authorization": f"Bearer {token}"})
-    except Exception:
-        return None
-    if resp.status_code != 200:
-        return None
-    try:
-        data = resp.json()
-    except Exception:
-        return None
-    username = data.get("name") or data.get("username")
-    return username or None
+    # Only a digest of the token is kept in memory.
+    key = (base_api, hashlib.sha256(token.encode("utf-8")).hexdigest())
+    username, _, _ = await _cached_lookup(token_cache, key, lambda: _load_token_user(url, token))
+    return username
 
 
 async def require_user(request: Request) -> str:
@@ -482,6 +773,8 @@ async def require_user(request: Request) -> str:
 
 
 app = FastAPI(title="User Resource Monitor", version="0.1.0")
+# Before the prefix-stripping middleware, so requests are matched to their routes.
+instrument(app)
 
 if SERVICE_PREFIX:
     @app.middleware("http")
@@ -503,6 +796,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+
+@app.on_event("startup")
+async def start_refreshers() -> None:
+    pod_refresher.start()
+    capacity_refresher.start()
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients() -> None:
+    await pod_refresher.stop()
+    await capacity_refresher.stop()
+    await portal_client.aclose()
+    await hub_client.aclose()
 
 
 @app.get("/api/me")
@@ -512,7 +821,12 @@ async def me(user: str = Depends(require_user)):
 
 @app.get("/api/resources")
 async def resources(user: str = Depends(require_user)):
-    pods, metrics_available = list_user_pods(user)
+    try:
+        snapshot = await pod_refresher.latest()
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Pod data unavailable: {exc}") from exc
+    by_user, metrics_available = snapshot.value
+    pods = by_user.get(normalize_username(user), [])
     total_usage_cpu = sum((p["usage"]["cpuMillicores"] or 0.0) for p in pods)
     total_usage_mem = sum((p["usage"]["memoryMiB"] or 0.0) for p in pods)
     total_req_cpu = sum((p["requests"]["cpuMillicores"] or 0.0) for p in pods)
@@ -523,8 +837,15 @@ async def resources(user: str = Depends(require_user)):
     total_lim_gpu = sum((p["limits"]["gpuCount"] or p["requests"]["gpuCount"] or 0) for p in pods)
 
     # Try to get user quota from Usage Portal first, fallback to cluster capacity
-    user_quota = await _fetch_user_quota(user)
-    cluster_capacity = user_quota if user_quota else _collect_cluster_capacity()
+    user_quota, quota_fetched_at = await _fetch_user_quota(user)
+    if user_quota:
+        capacity = capacity_refresher.current()
+    else:
+        try:
+            capacity = await capacity_refresher.latest()
+        except Exception:
+            capacity = None
+    cluster_capacity = user_quota if user_quota else (capacity.value if capacity else {})
 
     formats_summary: Dict[str, dict] = {}
     for pod in pods:
@@ -548,26 +869,41 @@ async def resources(user: str = Depends(require_user)):
 
     return {
         "user": user,
-        "updatedAt": datetime.now(timezone.utc).isoformat(),
+        "updatedAt": snapshot.collected_at.isoformat(),
+        "refreshError": pod_refresher.last_error,
         "metricsAvailable": metrics_available,
         "usage": {"cpuMillicores": total_usage_cpu, "memoryMiB": total_usage_mem},
         "requests": {"cpuMillicores": total_req_cpu, "memoryMiB": total_req_mem, "gpu": total_req_gpu},
         "limits": {"cpuMillicores": total_lim_cpu, "memoryMiB": total_lim_mem, "gpu": total_lim_gpu},
         "clusterCapacity": cluster_capacity,
+        "capacitySource": "quota" if user_quota else "cluster",
+        "quota": {
+            "limits": user_quota,
+            "fetchedAt": quota_fetched_at.isoformat() if quota_fetched_at else None,
+        },
+        "cluster": {
+            "capacity": capacity.value if capacity else None,
+            "collectedAt": capacity.collected_at.isoformat() if capacity else None,
+            "refreshError": capacity_refresher.last_error,
+        },
         "formats": list(formats_summary.values()),
         "pods": pods,
     }
 
 
 # Static assets must be mounted before the catch-all SPA route.
-app.mount("/app/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
+static_assets = StaticAssets(FRONTEND_DIR) if StaticAssets else StaticFiles(directory=str(FRONTEND_DIR))
+INDEX_FILE = FRONTEND_DIR / "index.html"
+index_page = HtmlPage(INDEX_FILE, static_assets) if HtmlPage and INDEX_FILE.exists() else None
+app.mount("/app/static", static_assets, name="static")
 
 
 # SPA routes
 @app.get("/app/")
 @app.get("/app/{rest:path}")
-async def spa(rest: str = ""):
-    index = FRONTEND_DIR / "index.html"
-    if not index.exists():
+async def spa(request: Request, rest: str = ""):
+    if index_page is not None:
+        return index_page.response(request)
+    if not INDEX_FILE.exists():
         raise HTTPException(status_code=404, detail="Frontend not found")
-    return FileResponse(index)
+    return FileResponse(INDEX_FILE)
@@ -0,0 +1,13 @@
+"""Test setup for the User Resource Monitor.
+
+Run from the repository root (start_user_monitor.sh puts it on PYTHONPATH too)::
+
+    python -m pytest -q user_resource_monitor/tests
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
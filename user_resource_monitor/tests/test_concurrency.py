@@ -0,0 +1,110 @@
+"""Slow kubectl collections must not serialize /api requests."""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from user_resource_monitor.backend import app as monitor
+
+COLLECT_SECONDS = 0.5
+HEADERS = {"x-jupyterhub-user": "alice"}
+
+
+def _pods():
+    pod = {
+        "usage": {"cpuMillicores": 250.0, "memoryMiB": 512.0},
+        "requests": {"cpuMillicores": 1000.0, "memoryMiB": 2048.0, "gpuCount": 0},
+        "limits": {"cpuMillicores": 2000.0, "memoryMiB": 4096.0, "gpuCount": 0},
+        "resourceFormat": {"slug": "cpu-node", "label": "CPU", "gpu": 0, "cpuCores": 1, "memoryGiB": 2},
+    }
+    return {"alice": [pod]}, True
+
+
+@pytest.fixture
+def slow_collect(monkeypatch):
+    """Blocking collections that take COLLECT_SECONDS each; returns the per-source call counts."""
+    calls = {"pods": 0, "capacity": 0}
+    lock = threading.Lock()
+
+    def slow(source, value):
+        def collect():
+            with lock:
+                calls[source] += 1
+            time.sleep(COLLECT_SECONDS)
+            return value
+
+        return collect
+
+    monkeypatch.setattr(monitor, "USAGE_PORTAL_URL", "")
+    for refresher, source, value in (
+        (monitor.pod_refresher, "pods", _pods()),
+        (monitor.capacity_refresher, "capacity", {"cpuMillicores": 64000.0, "memoryMiB": 262144.0, "gpu": 8}),
+    ):
+        monkeypatch.setattr(refresher, "_collect", slow(source, value))
+        monkeypatch.setattr(refresher, "_snapshot", None)
+        monkeypatch.setattr(refresher, "_refreshing", None)
+    return calls
+
+
+async def _timed_get(client, path):
+    started = time.perf_counter()
+    response = await client.get(path, headers=HEADERS)
+    return response, time.perf_counter() - started
+
+
+def _run(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=monitor.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://monitor") as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_cold_start_requests_share_one_collection(slow_collect):
+    async def scenario(client):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_timed_get(client, "/api/resources") for _ in range(20)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = _run(scenario)
+
+    assert all(response.status_code == 200 for response, _ in results)
+    assert slow_collect == {"pods": 1, "capacity": 1}
+    # Serialized, 20 requests would take 20 x 2 collections; shared, they take about two.
+    assert elapsed < COLLECT_SECONDS * 4
+    assert results[0][0].json()["requests"]["cpuMillicores"] == 1000.0
+
+
+def test_event_loop_keeps_serving_during_a_collection(slow_collect):
+    async def scenario(client):
+        refresh = asyncio.ensure_future(monitor.pod_refresher.refresh())
+        await asyncio.sleep(0.05)
+        results = await asyncio.gather(*(_timed_get(client, "/api/me") for _ in range(10)))
+        await refresh
+        return results
+
+    results = _run(scenario)
+
+    assert all(response.status_code == 200 for response, _ in results)
+    assert max(latency for _, latency in results) < COLLECT_SECONDS / 2
+
+
+def test_snapshot_is_served_while_a_refresh_is_running(slow_collect):
+    async def scenario(client):
+        await monitor.pod_refresher.refresh()
+        await monitor.capacity_refresher.refresh()
+        refresh = asyncio.ensure_future(monitor.pod_refresher.refresh())
+        await asyncio.sleep(0.05)
+        results = await asyncio.gather(*(_timed_get(client, "/api/resources") for _ in range(10)))
+        await refresh
+        return results
+
+    results = _run(scenario)
+
+    assert all(response.status_code == 200 for response, _ in results)
+    assert max(latency for _, latency in results) < COLLECT_SECONDS / 2
+    assert slow_collect["pods"] == 2